@@ -7,12 +7,15 @@ import tld
 
 import utils
 from config import Config
-from database import URL, Site, Task, load_database
+from database import URL, JobCounter, Site, Task, load_database
 
 
 def main(job: str, file: pathlib.Path) -> int:
     # Iterate over URLs and add them to database
     database = load_database()
+    JobCounter.create_table()
+
+    added: int = 0
     with database.atomic(), open(file, encoding="utf-8") as _file:
         for entry in _file:
             rank, url = entry.split(',')
@@ -50,6 +53,9 @@ def main(job: str, file: pathlib.Path) -> int:
 
             task.landing = _url.id
             task.save()
+            added += 1
+
+        JobCounter.add(database, job, {'tasks_added': added, 'urls_added': added})
 
     database.close()
 
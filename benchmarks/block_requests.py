@@ -0,0 +1,126 @@
+import argparse
+import sys
+import time
+from typing import List, Optional, Tuple, cast
+
+from playwright.sync_api import Route, sync_playwright
+
+import utils
+from config import Config
+from database import load_database
+from modules.BlockRequests import BlockRequests, Matcher
+
+
+def _load_requests(job: Optional[str], file: Optional[str], limit: int) -> List[Tuple[str, str, str]]:
+    requests: List[Tuple[str, str, str]] = []
+
+    if file:
+        with open(file, encoding='utf-8') as _file:
+            for entry in _file:
+                entry = entry.strip()
+                if not entry:
+                    continue
+
+                url, _, resource = entry.partition(' ')
+                parsed = utils.get_tld_object(url)
+                requests.append((url, resource.strip() or 'script', parsed.parsed_url.hostname if parsed else ''))
+
+    if job:
+        database = load_database()
+        rows = database.execute_sql(
+            f"SELECT request.url, request.resource, site.site FROM request JOIN task ON request.task_id=task.id JOIN site ON request.site_id=site.id WHERE task.job={database.param} LIMIT {database.param}",
+            (job, limit)
+        ).fetchall()
+        requests += [(row[0], row[1], row[2]) for row in rows]
+        database.close()
+
+    return requests[:limit]
+
+def benchmark_matcher(matcher: Matcher, requests: List[Tuple[str, str, str]], rounds: int) -> None:
+    blocked: int = 0
+    start: float = time.perf_counter()
+
+    for _ in range(rounds):
+        for url, resource, first_party in requests:
+            blocked += matcher.match(url, resource, first_party)
+
+    duration: float = time.perf_counter() - start
+    decisions: int = len(requests) * rounds
+
+    print(f"Matcher: {decisions} decisions in {duration:.3f}s, {decisions / duration:.0f} decisions/s, "
+          f"{duration / decisions * 1e6:.2f} us/decision, {blocked / decisions * 100:.1f}% blocked")
+
+def benchmark_pages(matcher: Matcher, urls: List[str]) -> None:
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch(headless=True)
+
+        for block in (False, True):
+            total: float = 0
+            requests: int = 0
+            blocked: int = 0
+
+            for url in urls:
+                context = browser.new_context(**playwright.devices[Config.DEVICE])
+                page = context.new_page()
+                counter: List[int] = [0, 0]
+
+                def handler(route: Route) -> None:
+                    first_party: str = page.url.split('://', 1)[-1].split('/', 1)[0].split(':', 1)[0]
+                    if (not route.request.is_navigation_request()) and matcher.match(route.request.url, route.request.resource_type, first_party):
+                        counter[1] += 1
+                        route.abort('blockedbyclient')
+                    else:
+                        route.fallback()
+
+                if block:
+                    context.route('**/*', handler)
+
+                page.on('request', lambda _: counter.__setitem__(0, counter[0] + 1))
+
+                start: float = time.perf_counter()
+                try:
+                    page.goto(url, timeout=Config.LOAD_TIMEOUT, wait_until='networkidle')
+                except Exception as error:
+                    print(f"{url}: {error}")
+                total += time.perf_counter() - start
+                requests += counter[0]
+                blocked += counter[1]
+
+                context.close()
+
+            print(f"Pages {'with' if block else 'without'} blocking: {total / max(1, len(urls)):.3f}s mean load until network idle, "
+                  f"{requests / max(1, len(urls)):.1f} requests per page, {blocked / max(1, len(urls)):.1f} blocked per page")
+
+        browser.close()
+
+def main(job: Optional[str], file: Optional[str], pages: Optional[str], limit: int, rounds: int) -> int:
+    start: float = time.perf_counter()
+    matcher: Matcher = BlockRequests.compile_matcher(BlockRequests.get_sources())
+    print(f"Compiled {len(matcher)} filters in {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    matcher = BlockRequests.load_matcher()
+    print(f"Loaded cached filters in {time.perf_counter() - start:.3f}s")
+
+    requests: List[Tuple[str, str, str]] = _load_requests(job, file, limit)
+    if requests:
+        benchmark_matcher(matcher, requests, rounds)
+
+    if pages:
+        with open(pages, encoding='utf-8') as _file:
+            benchmark_pages(matcher, [entry.strip() for entry in _file if entry.strip()])
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-j", "--job", type=str, required=False, help="replay requests recorded by CollectRequests for this job")
+    args_parser.add_argument("-f", "--file", type=str, required=False, help="file with one '<url> [resource type]' per line")
+    args_parser.add_argument("-p", "--pages", type=str, required=False, help="file with page URLs to compare load times with and without blocking")
+    args_parser.add_argument("-n", "--limit", type=int, default=100000, help="maximum number of requests to replay")
+    args_parser.add_argument("-r", "--rounds", type=int, default=3, help="how many times to replay the requests")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(args.get('job'), args.get('file'), args.get('pages'), cast(int, args.get('limit')), cast(int, args.get('rounds'))))
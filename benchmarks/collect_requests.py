@@ -0,0 +1,85 @@
+import argparse
+import resource
+import sys
+import time
+from typing import List, Type, cast
+
+from playwright.sync_api import sync_playwright
+
+from benchmarks.common import BenchmarkCrawler, get_logger, prepare_database
+from config import Config
+from modules.CollectRequests import CollectRequests
+from modules.CollectRequestsCDP import CollectRequestsCDP
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def benchmark(module: Type[CollectRequests], job: str, urls: List[str]) -> None:
+    log = get_logger(job)
+    rows: int = 0
+
+    cpu_children: float = _children_cpu()
+    cpu: float = time.process_time()
+    start: float = time.perf_counter()
+
+    # The driver and the browser are child processes; their CPU time is accounted once they exit
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch(headless=True)
+
+        for url in urls:
+            crawler: BenchmarkCrawler = BenchmarkCrawler(job, url, log)
+            crawler.playwright = playwright
+            crawler.browser = browser
+            crawler.context = browser.new_context(**playwright.devices[Config.DEVICE])
+            crawler.page = crawler.context.new_page()
+            crawler.cdp = crawler.context.new_cdp_session(crawler.page)
+
+            instance = module(crawler)
+            instance.add_handlers()
+
+            try:
+                response = crawler.page.goto(url, timeout=Config.LOAD_TIMEOUT, wait_until=Config.WAIT_LOAD_UNTIL)
+                crawler.page.wait_for_timeout(Config.WAIT_AFTER_LOAD)
+            except Exception as error:
+                print(f"{url}: {error}")
+                response = None
+
+            instance.receive_response(crawler.captures.get_chain(response), crawler.page.url, 1)
+
+            crawler.cdp.detach()
+            crawler.context.close()
+
+            rows += crawler.database.execute_sql(f"SELECT COUNT(*) FROM request WHERE task_id={crawler.database.param}", (crawler.task.get_id(),)).fetchone()[0]
+
+        browser.close()
+
+    wall: float = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    cpu_children = _children_cpu() - cpu_children
+    pages: int = max(1, len(urls))
+
+    print(f"{module.__name__}: {wall / pages:.3f}s wall, {cpu / pages * 1000:.1f}ms python CPU, "
+          f"{cpu_children / pages * 1000:.1f}ms driver and browser CPU, {rows / pages:.1f} requests per page")
+
+def main(job: str, file: str) -> int:
+    with open(file, encoding='utf-8') as _file:
+        urls: List[str] = [entry.strip() for entry in _file if entry.strip()]
+
+    prepare_database([CollectRequests], get_logger(job))
+
+    for module in (CollectRequests, CollectRequestsCDP):
+        benchmark(module, job, urls)
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-j", "--job", type=str, default='benchmark', help="job id for the recorded rows")
+    args_parser.add_argument("-f", "--file", type=str, required=True, help="file with page URLs, one per line")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(str, args.get('job')), cast(str, args.get('file'))))
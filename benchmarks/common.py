@@ -0,0 +1,84 @@
+import logging
+import pathlib
+from typing import Any, Dict, List, Tuple, Type
+
+import utils
+from capture import ResponseCache
+from config import Config
+from database import URL, URLDB, Entity, JobCounter, Site, Task, load_database
+from modules.Module import Module
+
+
+def get_logger(name: str) -> logging.Logger:
+    handler: logging.StreamHandler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+
+    log = logging.Logger(name)
+    log.setLevel(logging.WARNING)
+    log.addHandler(handler)
+
+    return log
+
+def prepare_database(modules: List[Type[Module]], log: logging.Logger) -> None:
+    load_database()
+
+    Entity.create_table()
+    Site.create_table()
+    Task.create_table()
+    URL.create_table()
+    JobCounter.create_table()
+
+    for module in modules:
+        module.register_job(log)
+
+def get_database_volume() -> Tuple[int, int]:
+    """Returns the number of rows in all tables and the size of the database in bytes."""
+
+    database = load_database()
+    rows: int = sum(database.execute_sql(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in database.get_tables() if not table.startswith('sqlite_'))
+
+    if Config.SQLITE:
+        size: int = sum(path.stat().st_size for path in (pathlib.Path(Config.SQLITE), pathlib.Path(Config.SQLITE + '-wal')) if path.exists())
+    else:
+        size = database.execute_sql("SELECT pg_database_size(current_database())").fetchone()[0]
+
+    database.close()
+    return rows, size
+
+
+class BenchmarkCrawler:
+    """
+    Stand-in for the crawler with the attributes modules use, so module code can run without the crawl loop.
+    """
+
+    def __init__(self, job: str, url: str, log: logging.Logger) -> None:
+        self.database = load_database()
+        self.log: logging.Logger = log
+        self.stop: bool = False
+
+        parsed = utils.get_tld_object(url)
+        assert parsed is not None
+
+        self.site: Site = Site.get_or_create(scheme=utils.get_url_scheme(parsed), tld=parsed.tld, site=utils.get_url_site(parsed))[0]
+        self.task: Task = Task.create(job=job, site=self.site, crawler=1, state='progress')
+        self.landing: URL = URL.create(task=self.task, site=self.site, url=url, depth=0, repetition=1, state='progress')
+        self.task.landing = self.landing
+        self.task.save()
+
+        self.url: URL = self.landing
+        self.captures: ResponseCache = ResponseCache(self.site.site, log)
+        self.origin: str = utils.get_url_origin(parsed)
+        self.depth: int = 0
+        self.repetition: int = 1
+        self.state: Dict[str, Any] = {}
+
+        self.playwright: Any = None
+        self.browser: Any = None
+        self.context: Any = None
+        self.page: Any = None
+        self.cdp: Any = None
+        self.report: Any = None
+        self.urldb: URLDB = URLDB(self)
+
+    def _update_cache(self) -> None:
+        pass
@@ -0,0 +1,147 @@
+import argparse
+import csv
+import importlib
+import json
+import multiprocessing
+import pathlib
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, cast
+
+from benchmarks.common import get_database_volume, get_logger, prepare_database
+from benchmarks.synthetic_web import Shape, SyntheticWeb, add_arguments, get_shape
+from config import Config
+from database import load_database
+
+# Lower is better for everything but throughput
+HIGHER_IS_BETTER: List[str] = ['pages_per_minute']
+
+
+def _configure(directory: pathlib.Path, port: int, postgres: bool, depth: int, shape: Shape, wait: int) -> None:
+    # Crawler processes are forked, so they inherit the configuration
+    Config.LOG = directory / 'logs'
+    Config.SQLITE = None if postgres else str(directory / 'e2e.db')
+    Config.BROWSER = 'chromium'
+    Config.HEADLESS = True
+    Config.BROWSER_ARGS = [f"--host-resolver-rules=MAP * 127.0.0.1:{port}"]
+    Config.EXTENSIONS = []
+    Config.HAR = None
+    Config.RECURSIVE = True
+    Config.DEPTH = depth
+    Config.MAX_URLS = shape.pages
+    Config.SAME_ETLDP1 = True
+    Config.ADULT_FILTER = False
+    Config.MANUAL_SETUP = False
+    Config.WAIT_BEFORE_LOAD = wait
+    Config.WAIT_AFTER_LOAD = wait
+
+def _add_tasks(job: str, urls: List[str], directory: pathlib.Path) -> None:
+    tranco: pathlib.Path = directory / 'tranco.csv'
+    with open(tranco, 'w', encoding='utf-8', newline='') as file:
+        csv.writer(file).writerows(enumerate(urls, start=1))
+
+    importlib.import_module('add_tasks_tranco').main(job, tranco)
+
+def run(job: str, module_names: List[str], crawlers: int, postgres: bool, depth: int, shape: Shape, wait: int) -> Dict[str, float]:
+    web: SyntheticWeb = SyntheticWeb(shape)
+    port: int = web.serve()
+
+    with tempfile.TemporaryDirectory() as directory:
+        _configure(pathlib.Path(directory), port, postgres, depth, shape, wait)
+
+        # The crawl entry point reads the configuration on import
+        pycrawler = importlib.import_module('main')
+
+        log = get_logger('e2e')
+        prepare_database([], log)
+        _add_tasks(job, web.get_urls(), pathlib.Path(directory))
+        rows, size = get_database_volume()
+
+        multiprocessing.set_start_method('fork', force=True)
+        usage: resource.struct_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start: float = time.perf_counter()
+
+        pycrawler.main(job, crawlers, module_names, Config.LOG)
+
+        wall: float = time.perf_counter() - start
+        _usage: resource.struct_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        _rows, _size = get_database_volume()
+
+        # Visits are the final URL rows; redirect hops are stored as extra rows
+        database = load_database()
+        pages: int = database.execute_sql(
+            f"SELECT COUNT(*) FROM url JOIN task ON url.task_id=task.id WHERE task.job={database.param} AND url.state='complete' AND url.redirect_id IS NULL",
+            (job,)
+        ).fetchone()[0]
+        database.close()
+
+    web.close()
+
+    return {
+        'pages': pages,
+        'wall_seconds': round(wall, 1),
+        'pages_per_minute': round(pages / wall * 60, 2),
+        'cpu_seconds': round((_usage.ru_utime - usage.ru_utime) + (_usage.ru_stime - usage.ru_stime), 1),
+        'peak_rss_mb': round(_usage.ru_maxrss / 1024, 1),
+        'rows_written': _rows - rows,
+        'database_mb': round((_size - size) / 1024 / 1024, 2),
+        'server_requests': web.requests,
+        'server_mb': round(web.sent / 1024 / 1024, 1),
+    }
+
+def compare(results: Dict[str, float], baseline: Optional[Dict[str, float]]) -> None:
+    for name, value in results.items():
+        line: str = f"{name:>18}: {value}"
+
+        if baseline and baseline.get(name):
+            change: float = (value - baseline[name]) / baseline[name] * 100
+            better: bool = (change > 0) == (name in HIGHER_IS_BETTER)
+            line += f" (baseline {baseline[name]}, {change:+.1f}%{'' if abs(change) < 5 else (' better' if better else ' worse')})"
+
+        print(line)
+
+def main(module_names: List[str], crawlers: int, postgres: bool, depth: int, shape: Shape, wait: int, baseline: Optional[pathlib.Path], save: bool) -> int:
+    job: str = f"e2e-{int(time.time())}"
+    results: Dict[str, float] = run(job, module_names, crawlers, postgres, depth, shape, wait)
+
+    print(f"{'PostgreSQL' if postgres else 'SQLite'}, {crawlers} crawlers, modules {module_names or '-'}, {shape.sites} sites with {shape.pages} pages, depth {depth}")
+    print("CPU and peak RSS cover the crawler and browser processes; peak RSS is the largest single process")
+
+    stored: Optional[Dict[str, float]] = None
+    if (baseline is not None) and baseline.exists() and (not save):
+        stored = json.loads(baseline.read_text(encoding='utf-8'))
+
+    compare(results, stored)
+
+    if (baseline is not None) and save:
+        baseline.write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"Saved baseline {baseline}")
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-m", "--modules", type=str, nargs='*', default=[], help="which modules the crawler will run")
+    args_parser.add_argument("-c", "--crawlers", type=int, default=1, help="how many crawlers will run concurrently")
+    args_parser.add_argument("-d", "--depth", type=int, default=1, help="URL discovery depth")
+    args_parser.add_argument("-w", "--wait", type=int, default=0, help="wait before and after load in ms")
+    args_parser.add_argument("--postgres", default=False, action='store_true', help="use the PostgreSQL database from config.py instead of a temporary SQLite file")
+    args_parser.add_argument("-b", "--baseline", type=pathlib.Path, default=None, help="JSON file with results to compare with")
+    args_parser.add_argument("--save", default=False, action='store_true', help="store the results as the new baseline")
+    add_arguments(args_parser)
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(
+        cast(List[str], args.get('modules')),
+        cast(int, args.get('crawlers')),
+        cast(bool, args.get('postgres')),
+        cast(int, args.get('depth')),
+        get_shape(args),
+        cast(int, args.get('wait')),
+        args.get('baseline'),
+        cast(bool, args.get('save'))
+    ))
@@ -0,0 +1,65 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+from typing import Callable, Dict, List, cast
+
+import utils
+
+
+def _hashes_reference(data: bytes) -> Dict[str, bytes]:
+    # Previous utils.hashes: one pass over the whole buffer per digest
+    result = {}
+    for algorithm in ('md5', 'sha1', 'sha256', 'sha512'):
+        _hash = hashlib.new(algorithm)
+        _hash.update(data)
+        result[algorithm] = _hash.digest()
+    return result
+
+def _run(name: str, function: Callable[[], List[Dict[str, bytes]]], size: int, rounds: int) -> List[Dict[str, bytes]]:
+    results: List[Dict[str, bytes]] = []
+    start: float = time.perf_counter()
+    for _ in range(rounds):
+        results = function()
+    duration: float = (time.perf_counter() - start) / rounds
+    print(f"  {name:<24} {duration * 1e3:>10.3f} ms {size / duration / 1e6:>10.1f} MB/s")
+    return results
+
+def main(sizes: List[int], count: int, rounds: int) -> int:
+    print(f"Parallel above {utils.HASH_PARALLEL} bytes, chunks of {utils.HASH_CHUNK} bytes, {os.cpu_count()} CPUs")
+
+    mismatches: int = 0
+    for size in sizes:
+        # 64 MB worth of bodies unless given
+        bodies: List[bytes] = [os.urandom(size) for _ in range(count or max(1, 64_000_000 // size))]
+        print(f"{len(bodies)} bodies of {size} bytes")
+
+        expected = _run('reference', lambda: [_hashes_reference(body) for body in bodies], size * len(bodies), rounds)
+        results = [
+            _run('hashes', lambda: [utils.hashes(body) for body in bodies], size * len(bodies), rounds),
+            _run('hashes (single thread)', lambda: [utils.hashes(body, parallel=False) for body in bodies], size * len(bodies), rounds),
+            _run('hashes (parallel)', lambda: [utils.hashes(body, parallel=True) for body in bodies], size * len(bodies), rounds),
+        ]
+        if len(bodies) > 1:
+            results.append(_run('hashes_batch', lambda: utils.hashes_batch(bodies), size * len(bodies), rounds))
+
+        mismatches += sum(result != expected for result in results)
+
+    if mismatches:
+        print(f"{mismatches} results differ from the reference")
+        return 1
+
+    print("All digests identical to the reference")
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-s", "--sizes", type=int, nargs='*', default=[1_000, 64_000, 1_000_000, 16_000_000, 128_000_000], help="body sizes in bytes")
+    args_parser.add_argument("-c", "--count", type=int, default=0, help="bodies per size (default: 64 MB worth, at least 1)")
+    args_parser.add_argument("-r", "--rounds", type=int, default=3, help="how many times to hash the bodies")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(List[int], args.get('sizes')), cast(int, args.get('count')), cast(int, args.get('rounds'))))
@@ -0,0 +1,87 @@
+import argparse
+import importlib
+import multiprocessing
+import sys
+import time
+from multiprocessing.connection import Connection
+from typing import List, Tuple, cast
+
+
+def _get_preload(module_names: List[str]) -> List[str]:
+    return ['config', 'utils', 'database', 'capture', 'crawler'] + [f"modules.{module_name}" for module_name in module_names]
+
+def _ready(module_names: List[str], started: float, connection: Connection) -> None:
+    # What a crawler process needs before it can start crawling
+    preloaded: bool = 'crawler' in sys.modules
+    importlib.import_module('crawler')
+    for module_name in module_names:
+        importlib.import_module(f"modules.{module_name}")
+
+    connection.send((time.time() - started, preloaded))
+    connection.close()
+
+def measure(method: str, module_names: List[str], rounds: int, preload: bool = True) -> List[Tuple[float, bool]]:
+    context = multiprocessing.get_context(method)
+
+    if (method == 'forkserver') and preload:
+        context.set_forkserver_preload(_get_preload(module_names))
+
+    durations: List[Tuple[float, bool]] = []
+    for _ in range(rounds):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_ready, args=(module_names, time.time(), sender))
+        process.start()
+        process.join()
+
+        if not receiver.poll():
+            raise RuntimeError(f"{method}: crawler process failed with exit code {process.exitcode}")
+
+        durations.append(receiver.recv())
+        process.close()
+
+    return durations
+
+def _manage(module_names: List[str], rounds: int, connection: Connection) -> None:
+    # Like a crawler manager of main.py: a fork server child that starts the per-task crawler processes
+    importlib.import_module('main')._start_forkserver(module_names)
+    connection.send(measure('forkserver', module_names, rounds, preload=False))
+    connection.close()
+
+def measure_manager(module_names: List[str], rounds: int) -> List[Tuple[float, bool]]:
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['main'] + _get_preload(module_names))
+
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_manage, args=(module_names, rounds, sender))
+    process.start()
+    process.join()
+
+    if not receiver.poll():
+        raise RuntimeError(f"manager: crawler manager failed with exit code {process.exitcode}")
+
+    durations: List[Tuple[float, bool]] = receiver.recv()
+    process.close()
+    return durations
+
+def main(module_names: List[str], rounds: int) -> int:
+    # The parent does not import the crawler, so fork shows the cost of a cold child; the per-task crawler
+    # processes of main.py are started by a crawler manager, which is itself a fork server child
+    for method in ('spawn', 'fork', 'forkserver', 'forkserver (manager)'):
+        results: List[Tuple[float, bool]] = measure_manager(module_names, rounds) if method == 'forkserver (manager)' else measure(method, module_names, rounds)
+        durations: List[float] = [duration for duration, _ in results]
+        preloaded: int = sum(preloaded for _, preloaded in results)
+
+        # The first forkserver child also waits for the server to start and preload
+        print(f"{method}: first {durations[0] * 1000:.0f}ms, then {sorted(durations[1:] or durations)[len(durations[1:] or durations) // 2] * 1000:.0f}ms median until a crawler process is ready, {preloaded}/{len(results)} with the crawler preloaded")
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-m", "--modules", type=str, nargs='*', default=[], help="modules the crawler processes import")
+    args_parser.add_argument("-r", "--rounds", type=int, default=10, help="how many crawler processes to start per method")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(List[str], args.get('modules')), cast(int, args.get('rounds'))))
@@ -0,0 +1,84 @@
+import argparse
+import json
+import pathlib
+import re
+import sys
+import time
+from typing import Callable, List, Optional, Tuple, cast
+
+from bs4 import BeautifulSoup
+
+import capture
+from database import load_database
+
+
+def _load_pages(job: Optional[str], directory: Optional[str], limit: int) -> List[Tuple[str, bytes, Optional[str]]]:
+    pages: List[Tuple[str, bytes, Optional[str]]] = []
+
+    if directory:
+        for path in sorted(pathlib.Path(directory).rglob('*')):
+            if path.is_file():
+                pages.append((str(path), path.read_bytes(), 'text/html'))
+
+    if job:
+        database = load_database()
+        rows = database.execute_sql(
+            f"SELECT url.url, url.resbody, url.content FROM url JOIN task ON url.task_id=task.id WHERE task.job={database.param} AND url.resbody IS NOT NULL LIMIT {database.param}",
+            (job, limit)
+        ).fetchall()
+        pages += [(row[0], bytes(row[1]), row[2]) for row in rows]
+        database.close()
+
+    return pages[:limit]
+
+def _extract_soup(data: bytes, content_type: Optional[str]) -> Optional[str]:
+    metaheaders = BeautifulSoup(data.decode(), 'html.parser')
+    metaheaders = metaheaders.find_all('meta', attrs={'http-equiv': re.compile('.*')})
+    return json.dumps([str(entry) for entry in metaheaders])
+
+def _run(name: str, extract: Callable[[bytes, Optional[str]], Optional[str]], pages: List[Tuple[str, bytes, Optional[str]]], rounds: int) -> List[Optional[str]]:
+    results: List[Optional[str]] = []
+    start: float = time.perf_counter()
+
+    for _ in range(rounds):
+        results = []
+        for _, data, content_type in pages:
+            try:
+                results.append(extract(data, content_type))
+            except Exception:
+                results.append(None)
+
+    duration: float = time.perf_counter() - start
+    size: int = sum(len(data) for _, data, _ in pages) * rounds
+    print(f"{name}: {len(pages) * rounds} pages in {duration:.3f}s, {duration / max(1, len(pages) * rounds) * 1e3:.3f} ms/page, {size / duration / 1e6:.1f} MB/s")
+
+    return results
+
+def main(job: Optional[str], directory: Optional[str], limit: int, rounds: int) -> int:
+    pages: List[Tuple[str, bytes, Optional[str]]] = _load_pages(job, directory, limit)
+    if not pages:
+        print("No pages found")
+        return 1
+
+    expected: List[Optional[str]] = _run('BeautifulSoup', _extract_soup, pages, rounds)
+    results: List[Optional[str]] = _run('capture.get_meta_headers', capture.get_meta_headers, pages, rounds)
+
+    # The fast path only scans the head of HTML documents
+    mismatches: List[str] = [url for (url, _, content_type), old, new in zip(pages, expected, results) if (new is not None) and (old != new)]
+    print(f"Identical output for {len(pages) - len(mismatches)}/{len(pages)} pages")
+    for url in mismatches[:20]:
+        print(f"Mismatch: {url}")
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-j", "--job", type=str, required=False, help="use the documents saved by SaveURL for this job")
+    args_parser.add_argument("-d", "--directory", type=str, required=False, help="directory with saved HTML pages")
+    args_parser.add_argument("-n", "--limit", type=int, default=10000, help="maximum number of pages")
+    args_parser.add_argument("-r", "--rounds", type=int, default=3, help="how many times to process the pages")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(args.get('job'), args.get('directory'), cast(int, args.get('limit')), cast(int, args.get('rounds'))))
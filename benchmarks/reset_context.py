@@ -0,0 +1,166 @@
+import argparse
+import http.server
+import sys
+import threading
+import time
+from logging import Logger
+from typing import Dict, List, cast
+
+from playwright.sync_api import Playwright, sync_playwright
+
+from benchmarks.common import BenchmarkCrawler, get_logger, prepare_database
+from config import Config
+from crawler import Crawler
+
+# Page that creates every kind of state a site can leave behind
+STORE: str = """<html><body><script>
+document.cookie = 'script=1; max-age=3600';
+localStorage.setItem('local', '1');
+sessionStorage.setItem('session', '1');
+const request = indexedDB.open('database', 1);
+request.onupgradeneeded = () => request.result.createObjectStore('store');
+if (self.caches) { caches.open('cache').then((cache) => cache.put('/cached', new Response('1'))); }
+if (navigator.serviceWorker) {
+    navigator.serviceWorker.register('/worker.js').then(() => { document.title = 'stored'; });
+} else {
+    document.title = 'stored';
+}
+</script></body></html>"""
+
+# Page that reports which state is still there
+CHECK: str = """<html><body><script>
+(async () => {
+    const databases = indexedDB.databases ? (await indexedDB.databases()).map((entry) => entry.name) : [];
+    window.leaks = {
+        cookies: document.cookie,
+        localStorage: localStorage.length,
+        sessionStorage: sessionStorage.length,
+        indexedDB: databases.length,
+        cacheStorage: self.caches ? (await caches.keys()).length : 0,
+        serviceWorkers: navigator.serviceWorker ? (await navigator.serviceWorker.getRegistrations()).length : 0
+    };
+    await fetch('/cacheable');
+    document.title = 'checked';
+})();
+</script></body></html>"""
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    counter: int = 0
+
+    def do_GET(self) -> None:
+        body: bytes = b''
+        headers: Dict[str, str] = {'Content-Type': 'text/html'}
+
+        if self.path == '/store':
+            body = STORE.encode()
+            headers['Set-Cookie'] = 'header=1; Max-Age=3600'
+        elif self.path == '/check':
+            body = CHECK.encode()
+        elif self.path == '/worker.js':
+            body = b"self.addEventListener('fetch', () => {});"
+            headers['Content-Type'] = 'text/javascript'
+        elif self.path == '/cacheable':
+            # Every fetch that reaches the server returns a new value
+            _Handler.counter += 1
+            body = str(_Handler.counter).encode()
+            headers['Cache-Control'] = 'max-age=3600'
+
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+def get_crawler(playwright: Playwright, log: Logger) -> BenchmarkCrawler:
+    # A crawler with a browser of Config.BROWSER, but no context yet
+    crawler: BenchmarkCrawler = BenchmarkCrawler('reset_context', 'https://example.com/', log)
+    crawler.playwright = playwright
+    crawler.browser = getattr(playwright, Config.BROWSER).launch(headless=True)
+    crawler.har = None
+    crawler.origins = set()
+    crawler.resetting = False
+    crawler.state = {}
+    crawler._record_origin = lambda request: Crawler._record_origin(cast(Crawler, crawler), request)
+    crawler._clear_origin = lambda origin: Crawler._clear_origin(cast(Crawler, crawler), origin)
+    return crawler
+
+def _store(crawler: BenchmarkCrawler, origin: str) -> None:
+    crawler.page.goto(f"{origin}/store")
+    crawler.page.wait_for_function("document.title === 'stored'")
+    crawler.page.evaluate("fetch('/cacheable').then((response) => response.text())")
+
+def _check(crawler: BenchmarkCrawler, origin: str) -> Dict[str, int]:
+    counter: int = _Handler.counter
+
+    crawler.page.goto(f"{origin}/check")
+    crawler.page.wait_for_function("document.title === 'checked'")
+    leaks: Dict[str, int] = crawler.page.evaluate("window.leaks")
+
+    # A cached response does not reach the server
+    leaks['httpCache'] = int(_Handler.counter == counter)
+    return leaks
+
+def main(rounds: int) -> int:
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    origin: str = f"http://127.0.0.1:{server.server_address[1]}"
+
+    log = get_logger('reset_context')
+    prepare_database([], log)
+
+    leaked: List[str] = []
+
+    with sync_playwright() as playwright:
+        crawler: BenchmarkCrawler = get_crawler(playwright, log)
+
+        # Recreating the context, like the crawler does without RESET_CONTEXT
+        Crawler._init_context(cast(Crawler, crawler))
+        total: float = 0
+        for _ in range(rounds):
+            _store(crawler, origin)
+            start: float = time.perf_counter()
+            Crawler._close_context(cast(Crawler, crawler))
+            Crawler._init_context(cast(Crawler, crawler))
+            total += time.perf_counter() - start
+        print(f"Recreate context: {total / rounds * 1000:.1f}ms per URL")
+
+        # Resetting the context in place
+        total = 0
+        for _ in range(rounds):
+            _store(crawler, origin)
+            start = time.perf_counter()
+            if not Crawler._reset_context(cast(Crawler, crawler)):
+                print("Reset failed")
+                return 1
+            total += time.perf_counter() - start
+
+            leaks: Dict[str, int] = _check(crawler, origin)
+            leaked += [name for name, value in leaks.items() if value and ((name != 'httpCache') or (Config.BROWSER == 'chromium'))]
+            Crawler._reset_context(cast(Crawler, crawler))
+        print(f"Reset context: {total / rounds * 1000:.1f}ms per URL")
+
+        Crawler._close_context(cast(Crawler, crawler))
+        crawler.browser.close()
+
+    server.shutdown()
+
+    if leaked:
+        print(f"State leaked between URLs: {sorted(set(leaked))}")
+        return 1
+
+    print("No state leaked between URLs")
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-r", "--rounds", type=int, default=20, help="how many URLs to simulate")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(int, args.get('rounds'))))
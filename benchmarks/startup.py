@@ -0,0 +1,66 @@
+import argparse
+import subprocess
+import sys
+from typing import List, Optional, Tuple, cast
+
+# Entry points of the crawler processes
+MODULES: List[str] = ['utils', 'database', 'crawler', 'main', 'add_tasks_tranco', 'prepare_database']
+
+# Dependencies that must only be loaded on first use
+HEAVY: List[str] = ['nltk', 'autocorrect', 'bs4']
+
+# Runs in a fresh interpreter: time the import, report peak memory and loaded heavy dependencies
+_PROBE: str = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ','.join(heavy))
+"""
+
+def measure(module: str, rounds: int) -> Optional[Tuple[float, int, str]]:
+    durations: List[float] = []
+    memory: int = 0
+    heavy: str = ''
+
+    for _ in range(rounds):
+        result = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY)], capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{module}: import failed\n{result.stderr.strip()}")
+            return None
+
+        duration, memory_str, heavy = result.stdout.split(' ', 2)
+        durations.append(float(duration))
+        memory = int(memory_str)
+
+    return min(durations), memory, heavy.strip()
+
+def main(modules: List[str], rounds: int, limit: Optional[float]) -> int:
+    failed: bool = False
+
+    for module in modules:
+        result = measure(module, rounds)
+        if result is None:
+            failed = True
+            continue
+
+        duration, memory, heavy = result
+        print(f"{module}: {duration * 1000:.0f}ms import, {memory / 1024:.1f}MB max RSS" + (f", loaded {heavy}" if heavy else ''))
+
+        # Regression checks
+        if heavy or ((limit is not None) and (duration > limit)):
+            failed = True
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-m", "--modules", type=str, nargs='*', default=MODULES, help="modules to import")
+    args_parser.add_argument("-r", "--rounds", type=int, default=3, help="how many fresh interpreters to measure per module")
+    args_parser.add_argument("-l", "--limit", type=float, required=False, help="fail if an import takes longer than ... seconds")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(List[str], args.get('modules')), cast(int, args.get('rounds')), args.get('limit')))
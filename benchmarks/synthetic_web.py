@@ -0,0 +1,245 @@
+import argparse
+import http.server
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, cast
+
+# Pages with a cookie banner the AcceptCookies module can click away
+BANNER: str = """<div id="cookie-banner" style="position:fixed;bottom:0;width:100%;background:#eee">
+<p>We use cookies to improve your experience.</p>
+<button onclick="document.cookie='consent=1; max-age=3600'; this.parentNode.remove();">Accept all</button>
+<button onclick="this.parentNode.remove();">Reject</button>
+</div>"""
+
+LOGIN: str = """<form action="/login" method="post">
+<input type="text" name="username" placeholder="Username">
+<input type="password" name="password" placeholder="Password">
+<button type="submit">Sign in</button>
+</form>"""
+
+
+@dataclass
+class Shape:
+    """Shape of the synthetic sites; every choice is derived from the site, page, and seed."""
+
+    sites: int = 10  # number of sites, served as bench-site-<n>.com
+    pages: int = 20  # pages per site
+    links: int = 5  # links per page to other pages of the same site
+    external: int = 1  # links per page to other sites
+    redirects: float = 0.1  # share of links that go through a redirect chain
+    chain: int = 2  # redirects per chain
+    banners: float = 0.5  # share of sites with a cookie banner
+    logins: float = 0.2  # share of pages with a login form
+    subresources: int = 10  # scripts, stylesheets and small images per page
+    images: int = 2  # heavy images per page
+    image_size: int = 200_000  # bytes per heavy image
+    slow: float = 0.1  # share of slow pages
+    delay: int = 1000  # delay of slow pages in ms
+    seed: int = 0
+
+
+class SyntheticWeb:
+    """
+    Deterministic synthetic sites for offline benchmarks, served by a local HTTP server.
+
+    Sites are told apart by the Host header, so the browser has to resolve every bench-site-<n>.com host to the
+    server, e.g. with ``--host-resolver-rules=MAP * 127.0.0.1:<port>`` in ``Config.BROWSER_ARGS`` (Chromium).
+    """
+
+    HOST: re.Pattern = re.compile(r'^bench-site-(\d+)\.com(:\d+)?$')
+
+    def __init__(self, shape: Shape) -> None:
+        self.shape: Shape = shape
+        self.requests: int = 0
+        self.sent: int = 0
+
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self._lock: threading.Lock = threading.Lock()
+        self._image: bytes = random.Random(shape.seed).randbytes(shape.image_size)
+
+    @staticmethod
+    def get_host(site: int) -> str:
+        return f"bench-site-{site}.com"
+
+    def get_urls(self) -> List[str]:
+        return [f"http://{SyntheticWeb.get_host(site)}/" for site in range(1, self.shape.sites + 1)]
+
+    def _random(self, *key) -> random.Random:
+        return random.Random('-'.join(str(part) for part in (self.shape.seed,) + key))
+
+    def _link(self, rng: random.Random, site: int) -> str:
+        target: str = f"page/{rng.randrange(self.shape.pages)}"
+        if rng.random() < self.shape.redirects:
+            return f"http://{SyntheticWeb.get_host(site)}/redirect/{self.shape.chain}/{target}"
+        return f"http://{SyntheticWeb.get_host(site)}/{target}"
+
+    def render_page(self, site: int, page: int) -> Tuple[str, float]:
+        rng: random.Random = self._random(site, page)
+        shape: Shape = self.shape
+
+        links: List[str] = [self._link(rng, site) for _ in range(shape.links)]
+        if shape.sites > 1:
+            links += [f"http://{SyntheticWeb.get_host(rng.choice([other for other in range(1, shape.sites + 1) if other != site]))}/" for _ in range(shape.external)]
+
+        head: List[str] = [f'<title>Site {site} page {page}</title>', '<meta http-equiv="X-UA-Compatible" content="IE=edge">']
+        body: List[str] = [f'<h1>Site {site} page {page}</h1>', '<p>' + ' '.join(rng.choice(['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'account', 'privacy', 'news']) for _ in range(200)) + '</p>']
+
+        for i in range(shape.subresources):
+            kind: int = i % 3
+            if kind == 0:
+                head.append(f'<script src="/static/{page}-{i}.js"></script>')
+            elif kind == 1:
+                head.append(f'<link rel="stylesheet" href="/static/{page}-{i}.css">')
+            else:
+                body.append(f'<img src="/static/{page}-{i}.png" width="16" height="16">')
+
+        body += [f'<img src="/image/{page}-{i}.jpg" width="640" height="480">' for i in range(shape.images)]
+        body += [f'<a href="{link}">Link {i}</a>' for i, link in enumerate(links)]
+
+        if rng.random() < shape.logins:
+            body.append(LOGIN)
+        if self._random(site).random() < shape.banners:
+            body.append(BANNER)
+
+        delay: float = (shape.delay / 1000) if rng.random() < shape.slow else 0
+        return f"<!DOCTYPE html><html><head>{''.join(head)}</head><body>{''.join(body)}</body></html>", delay
+
+    def handle(self, host: str, path: str) -> Tuple[int, Dict[str, str], bytes, float]:
+        """Returns status, headers, body, and delay in seconds of a request."""
+
+        match: Optional[re.Match] = SyntheticWeb.HOST.match(host)
+        site: int = int(match.group(1)) if match else 0
+        if not (1 <= site <= self.shape.sites):
+            return 404, {'Content-Type': 'text/plain'}, b'unknown site', 0
+
+        path = path.split('?')[0].split('#')[0]
+
+        if path.startswith('/redirect/'):
+            _, _, count, rest = path.split('/', 3)
+            location: str = f"/redirect/{int(count) - 1}/{rest}" if int(count) > 1 else f"/{rest}"
+            return 302, {'Location': location, 'Content-Type': 'text/html'}, b'', 0
+
+        if (path == '/') or path.startswith('/page/'):
+            page: int = int(path.rsplit('/', 1)[1]) if path != '/' else 0
+            if page >= self.shape.pages:
+                return 404, {'Content-Type': 'text/html'}, b'<html><body>Not found</body></html>', 0
+
+            html, delay = self.render_page(site, page)
+            headers: Dict[str, str] = {'Content-Type': 'text/html; charset=utf-8'}
+            if page == 0:
+                headers['Set-Cookie'] = f'session={site}; Path=/; Max-Age=3600'
+            return 200, headers, html.encode(), delay
+
+        if path.startswith('/static/'):
+            extension: str = path.rsplit('.', 1)[-1]
+            if extension == 'js':
+                return 200, {'Content-Type': 'text/javascript', 'Cache-Control': 'max-age=3600'}, f"window.loaded = (window.loaded || 0) + 1; // {path}".encode(), 0
+            if extension == 'css':
+                return 200, {'Content-Type': 'text/css', 'Cache-Control': 'max-age=3600'}, f"/* {path} */ body {{ margin: 0; }}".encode(), 0
+            return 200, {'Content-Type': 'image/png', 'Cache-Control': 'max-age=3600'}, self._image[:256], 0
+
+        if path.startswith('/image/'):
+            return 200, {'Content-Type': 'image/jpeg'}, self._image, 0
+
+        return 404, {'Content-Type': 'text/html'}, b'<html><body>Not found</body></html>', 0
+
+    def serve(self, address: Tuple[str, int] = ('127.0.0.1', 0)) -> int:
+        """Starts the server on a background thread and returns its port."""
+
+        web: SyntheticWeb = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self, send_body: bool) -> None:
+                status, headers, body, delay = web.handle(self.headers.get('Host', ''), self.path)
+                if delay:
+                    time.sleep(delay)
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+                with web._lock:
+                    web.requests += 1
+                    web.sent += len(body) if send_body else 0
+
+            def do_GET(self) -> None:
+                self._respond(True)
+
+            def do_HEAD(self) -> None:
+                self._respond(False)
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self._respond(True)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(address, Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='SyntheticWeb', daemon=True).start()
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def add_arguments(args_parser: argparse.ArgumentParser) -> None:
+    defaults: Shape = Shape()
+    args_parser.add_argument("-s", "--sites", type=int, default=defaults.sites, help="number of synthetic sites")
+    args_parser.add_argument("-p", "--pages", type=int, default=defaults.pages, help="pages per site")
+    args_parser.add_argument("--links", type=int, default=defaults.links, help="links per page to pages of the same site")
+    args_parser.add_argument("--external", type=int, default=defaults.external, help="links per page to other sites")
+    args_parser.add_argument("--redirects", type=float, default=defaults.redirects, help="share of links with a redirect chain")
+    args_parser.add_argument("--chain", type=int, default=defaults.chain, help="redirects per chain")
+    args_parser.add_argument("--banners", type=float, default=defaults.banners, help="share of sites with a cookie banner")
+    args_parser.add_argument("--logins", type=float, default=defaults.logins, help="share of pages with a login form")
+    args_parser.add_argument("--subresources", type=int, default=defaults.subresources, help="scripts, stylesheets and icons per page")
+    args_parser.add_argument("--images", type=int, default=defaults.images, help="heavy images per page")
+    args_parser.add_argument("--image-size", type=int, default=defaults.image_size, help="bytes per heavy image")
+    args_parser.add_argument("--slow", type=float, default=defaults.slow, help="share of slow pages")
+    args_parser.add_argument("--delay", type=int, default=defaults.delay, help="delay of slow pages in ms")
+    args_parser.add_argument("--seed", type=int, default=defaults.seed, help="seed of the synthetic sites")
+
+def get_shape(args: Dict) -> Shape:
+    return Shape(**{name: args[name] for name in Shape.__dataclass_fields__})
+
+def main(shape: Shape, port: int) -> int:
+    web: SyntheticWeb = SyntheticWeb(shape)
+    port = web.serve(('127.0.0.1', port))
+
+    print(f"Serving {shape.sites} synthetic sites on 127.0.0.1:{port}")
+    print(f"Chromium: --host-resolver-rules=\"MAP * 127.0.0.1:{port}\"")
+    for url in web.get_urls():
+        print(url)
+
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        web.close()
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    add_arguments(args_parser)
+    args_parser.add_argument("--port", type=int, default=8000, help="port of the server")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(get_shape(args), cast(int, args.get('port'))))
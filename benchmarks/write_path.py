@@ -0,0 +1,341 @@
+import argparse
+import gzip
+import json
+import multiprocessing
+import pathlib
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
+from peewee import OperationalError
+
+from benchmarks.common import BenchmarkCrawler, get_database_volume, get_logger, prepare_database
+from config import Config
+from crawler import Crawler
+from database import URL, load_database
+from modules.CollectRequests import CollectRequests
+from modules.SaveURL import SaveURL
+
+SITE: str = 'https://bench-site-1.com'
+
+
+class _Request:
+    """Stand-in for a playwright request with the attributes the write paths use."""
+
+    def __init__(self, url: str, method: str, resource_type: str, headers: Dict[str, str], post_data: Optional[bytes], navigation: bool) -> None:
+        self.url: str = url
+        self.method: str = method
+        self.resource_type: str = resource_type
+        self.headers: Dict[str, str] = headers
+        self.post_data_buffer: Optional[bytes] = post_data
+        self.navigation: bool = navigation
+        self.redirected_from: Optional[_Request] = None
+        self.redirected_to: Optional[_Request] = None
+        self._response: Optional[_Response] = None
+
+    def is_navigation_request(self) -> bool:
+        return self.navigation
+
+    def header_value(self, name: str) -> Optional[str]:
+        return self.headers.get(name.lower(), None)
+
+    def headers_array(self) -> List[Dict[str, str]]:
+        return [{'name': name, 'value': value} for name, value in self.headers.items()]
+
+    def response(self) -> Optional['_Response']:
+        return self._response
+
+class _Response:
+    """Stand-in for a playwright response with the attributes the write paths use."""
+
+    def __init__(self, request: _Request, status: int, status_text: str, headers: Dict[str, str], body: bytes) -> None:
+        self.request: _Request = request
+        self.url: str = request.url
+        self.status: int = status
+        self.status_text: str = status_text
+        self.headers: Dict[str, str] = headers
+        self.frame: Any = None
+        self.from_service_worker: bool = False
+        self._body: bytes = body
+        request._response = self
+
+    def header_value(self, name: str) -> Optional[str]:
+        return self.headers.get(name.lower(), None)
+
+    def headers_array(self) -> List[Dict[str, str]]:
+        return [{'name': name, 'value': value} for name, value in self.headers.items()]
+
+    def body(self) -> bytes:
+        return self._body
+
+class _Context:
+    def __init__(self) -> None:
+        self.handlers: Dict[str, Callable] = {}
+
+    def on(self, event: str, handler: Callable) -> None:
+        self.handlers[event] = handler
+
+# A page capture: navigation response (end of the redirect chain), all other responses, and discovered links
+Capture = Tuple[_Response, List[_Response], List[str]]
+
+
+def _link(responses: List[_Response], request: _Request, status: int, headers: Dict[str, str], body: bytes) -> _Response:
+    # Chain a redirect hop to the previous one
+    if responses and (responses[-1].status in (301, 302, 303, 307, 308)):
+        request.redirected_from = responses[-1].request
+        responses[-1].request.redirected_to = request
+    response: _Response = _Response(request, status, 'OK' if status == 200 else 'Found', headers, body)
+    responses.append(response)
+    return response
+
+def synthetic_captures(count: int, prefix: str, seed: int) -> List[Capture]:
+    rng: random.Random = random.Random(seed)
+    captures: List[Capture] = []
+
+    def headers(content_type: str, size: int) -> Dict[str, str]:
+        result: Dict[str, str] = {'content-type': content_type, 'content-length': str(size), 'date': 'Mon, 19 Oct 2026 08:00:00 GMT'}
+        for i in range(rng.randrange(8, 16)):
+            result[f"x-header-{i}"] = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=rng.randrange(20, 80)))
+        return result
+
+    for page in range(count):
+        url: str = f"{SITE}/page/{prefix}-{page}"
+        chain: List[_Response] = []
+
+        for hop in range(rng.choice([0, 0, 0, 1, 2])):
+            request = _Request(f"{url}/redirect/{hop}", 'GET', 'document', {'referer': f"{SITE}/"}, None, True)
+            _link(chain, request, 302, {'location': f"{url}/redirect/{hop + 1}", 'content-type': 'text/html', 'content-length': '0'}, b'')
+
+        html: bytes = (b'<html><head><meta http-equiv="Content-Security-Policy" content="default-src \'self\'"><title>Page</title></head><body>'
+                       + rng.randbytes(30_000).hex().encode()[:30_000] + b'</body></html>')
+        document: _Response = _link(chain, _Request(url, 'GET', 'document', {'referer': f"{SITE}/"}, None, True), 200, headers('text/html; charset=utf-8', len(html)), html)
+
+        others: List[_Response] = []
+        for i in range(30):
+            resource_type, content_type, size = rng.choice([('script', 'text/javascript', 10_000), ('stylesheet', 'text/css', 5_000), ('image', 'image/png', 5_000), ('xhr', 'application/json', 1_000)])
+            origin: str = SITE if rng.random() < 0.5 else f"https://cdn-{rng.randrange(5)}.example.com"
+            body: bytes = rng.randbytes(size)
+            post_data: Optional[bytes] = b'{"event": "view"}' if resource_type == 'xhr' else None
+            request = _Request(f"{origin}/{resource_type}/{page}-{i}", 'POST' if post_data else 'GET', resource_type, {'referer': url, 'accept': '*/*'}, post_data, False)
+            others.append(_Response(request, 200, 'OK', headers(content_type, size), body))
+
+        captures.append((document, chain[:-1] + others, [f"{url}/link/{i}" for i in range(20)]))
+
+    return captures
+
+def har_captures(paths: List[pathlib.Path]) -> List[Capture]:
+    captures: List[Capture] = []
+
+    for path in paths:
+        with (gzip.open(path, 'rt', encoding='utf-8') if path.suffix == '.gz' else open(path, encoding='utf-8')) as file:
+            entries: List[Dict[str, Any]] = json.load(file)['log']['entries']
+
+        chain: List[_Response] = []
+        others: List[_Response] = []
+        for entry in entries:
+            request, response = entry['request'], entry['response']
+            content: Dict[str, Any] = response.get('content', {})
+
+            body: bytes = b''
+            if '_file' in content and (path.parent / content['_file']).exists():
+                body = (path.parent / content['_file']).read_bytes()
+            elif 'text' in content:
+                body = content['text'].encode()
+
+            post_data: Optional[bytes] = request['postData']['text'].encode() if 'postData' in request else None
+            navigation: bool = (entry.get('_resourceType') == 'document') and ((not chain) or (chain[-1].status in (301, 302, 303, 307, 308) and chain[-1].header_value('Location') is not None))
+
+            _request = _Request(request['url'], request['method'], entry.get('_resourceType', 'other'), {header['name'].lower(): header['value'] for header in request['headers']}, post_data, navigation)
+            _headers: Dict[str, str] = {header['name'].lower(): header['value'] for header in response['headers']}
+
+            if navigation:
+                _link(chain, _request, response['status'], _headers, body)
+            else:
+                others.append(_Response(_request, response['status'], response['statusText'], _headers, body))
+
+        if chain:
+            captures.append((chain[-1], chain[:-1] + others, [entry['request']['url'] for entry in entries]))
+
+    return captures
+
+
+def _count_lock_waits(database) -> List[float]:
+    # SQLite waits for the write lock inside the busy handler; retry here instead to measure the waiting
+    waited: List[float] = [0.0]
+    execute_sql = database.execute_sql
+
+    def _execute_sql(sql, params=None):
+        start: Optional[float] = None
+        while True:
+            try:
+                result = execute_sql(sql, params)
+                break
+            except OperationalError as error:
+                if ('locked' not in str(error)) or ((start is not None) and (time.perf_counter() - start > 10)):
+                    raise
+                start = start or time.perf_counter()
+                time.sleep(0.001)
+
+        if start is not None:
+            waited[0] += time.perf_counter() - start
+        return result
+
+    database.execute_sql('PRAGMA busy_timeout=0')
+    database.execute_sql = _execute_sql
+    return waited
+
+def _save_url(crawler: BenchmarkCrawler, captures: List[Capture]) -> Callable[[Capture], None]:
+    module: SaveURL = SaveURL(crawler)
+    urls: Dict[str, URL] = {capture[0].url: URL.create(task=crawler.task, site=crawler.site, url=capture[0].url, depth=0, repetition=1, state='progress') for capture in captures}
+
+    def write(capture: Capture) -> None:
+        crawler.url = urls[capture[0].url]
+        crawler.captures.clear()
+        module.receive_response(crawler.captures.get_chain(capture[0]), capture[0].url, 1)
+
+    return write
+
+def _collect_requests(crawler: BenchmarkCrawler, captures: List[Capture]) -> Callable[[Capture], None]:
+    crawler.context = _Context()
+    CollectRequests(crawler).add_handlers()
+    handler: Callable = crawler.context.handlers['response']
+
+    def write(capture: Capture) -> None:
+        for response in [capture[0]] + capture[1]:
+            handler(response)
+
+    return write
+
+def _add_url(crawler: BenchmarkCrawler, captures: List[Capture]) -> Callable[[Capture], None]:
+    def write(capture: Capture) -> None:
+        for link in capture[2]:
+            crawler.urldb.add_url(link, 1, crawler.landing)
+
+    return write
+
+def _update_cache(crawler: BenchmarkCrawler, captures: List[Capture]) -> Callable[[Capture], None]:
+    def write(capture: Capture) -> None:
+        # The checkpoint grows with the URLs seen so far
+        for link in capture[2]:
+            crawler.urldb.add_seen(link)
+        Crawler._update_cache(cast(Crawler, crawler))
+
+    return write
+
+WRITE_PATHS: Dict[str, Callable[[BenchmarkCrawler, List[Capture]], Callable[[Capture], None]]] = {
+    'SaveURL': _save_url,
+    'CollectRequests': _collect_requests,
+    'URLDB.add_url': _add_url,
+    'Crawler._update_cache': _update_cache,
+}
+
+
+def _writer(job: str, name: str, captures: List[Capture], barrier: Any, results: Any) -> None:
+    log = get_logger(job)
+    crawler: BenchmarkCrawler = BenchmarkCrawler(job, f"{SITE}/", log)
+    write: Callable[[Capture], None] = WRITE_PATHS[name](crawler, captures)
+    waited: List[float] = _count_lock_waits(crawler.database) if Config.SQLITE else [0.0]
+
+    barrier.wait()
+    start: float = time.perf_counter()
+    for capture in captures:
+        write(capture)
+    results.put((time.perf_counter() - start, waited[0]))
+
+def _sample_lock_waits(stop: threading.Event, waited: List[float]) -> None:
+    # PostgreSQL reports sessions waiting for a lock
+    database = load_database()
+    while not stop.wait(0.01):
+        waited[0] += 0.01 * database.execute_sql("SELECT COUNT(*) FROM pg_stat_activity WHERE wait_event_type='Lock' AND datname=current_database()").fetchone()[0]
+    database.close()
+
+def measure(job: str, name: str, writers: int, captures: List[List[Capture]]) -> Dict[str, float]:
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(writers + 1)
+    results = context.Queue()
+
+    # Children must not inherit an open connection
+    load_database().close()
+
+    processes = [context.Process(target=_writer, args=(job, name, captures[i], barrier, results)) for i in range(writers)]
+    for process in processes:
+        process.start()
+
+    stop: threading.Event = threading.Event()
+    sampled: List[float] = [0.0]
+    sampler: Optional[threading.Thread] = threading.Thread(target=_sample_lock_waits, args=(stop, sampled), daemon=True) if not Config.SQLITE else None
+
+    # Writers have prepared their tasks and URLs
+    barrier.wait()
+    rows, size = get_database_volume()
+    start: float = time.perf_counter()
+    if sampler is not None:
+        sampler.start()
+
+    durations: List[Tuple[float, float]] = [results.get() for _ in processes]
+    wall: float = time.perf_counter() - start
+
+    stop.set()
+    if sampler is not None:
+        sampler.join()
+    for process in processes:
+        process.join()
+
+    _rows, _size = get_database_volume()
+    operations: int = sum(len(entry) for entry in captures[:writers])
+    lock_wait: float = sum(waited for _, waited in durations) if Config.SQLITE else sampled[0]
+
+    return {
+        'operations_per_second': operations / wall,
+        'rows_per_second': (_rows - rows) / wall,
+        'megabytes_per_second': (_size - size) / wall / 1024 / 1024,
+        'lock_wait_seconds': lock_wait,
+        'lock_wait_share': lock_wait / max(1e-9, sum(duration for duration, _ in durations)),
+    }
+
+def main(writer_counts: List[int], pages: int, postgres: bool, paths: List[str], files: List[pathlib.Path], seed: int) -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        Config.SQLITE = None if postgres else str(pathlib.Path(directory) / 'write_path.db')
+        Config.LOG = pathlib.Path(directory)
+
+        prepare_database([CollectRequests], get_logger('write_path'))
+
+        # Every writer replays its own captures, so writers do not update the same rows
+        captures: List[List[Capture]] = []
+        for i in range(max(writer_counts)):
+            captures.append(har_captures(files) if files else synthetic_captures(pages, str(i), seed + i))
+
+        print(f"{'PostgreSQL' if postgres else 'SQLite (WAL)'}, {len(captures[0])} pages per writer")
+        print(f"{'write path':<22} {'writers':>7} {'pages/s':>10} {'rows/s':>10} {'MB/s':>8} {'lock wait':>10} {'of time':>8}")
+
+        for name in paths:
+            for writers in writer_counts:
+                result: Dict[str, float] = measure(f"write_path-{int(time.time())}", name, writers, captures)
+                print(f"{name:<22} {writers:>7} {result['operations_per_second']:>10.1f} {result['rows_per_second']:>10.1f} {result['megabytes_per_second']:>8.2f} "
+                      f"{result['lock_wait_seconds']:>9.2f}s {result['lock_wait_share'] * 100:>7.1f}%")
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-w", "--writers", type=int, nargs='*', default=[1, 8, 64], help="numbers of concurrent writer processes")
+    args_parser.add_argument("-p", "--pages", type=int, default=50, help="synthetic pages per writer")
+    args_parser.add_argument("--postgres", default=False, action='store_true', help="use the PostgreSQL database from config.py instead of a temporary SQLite file")
+    args_parser.add_argument("--paths", type=str, nargs='*', default=list(WRITE_PATHS), choices=list(WRITE_PATHS), help="write paths to measure")
+    args_parser.add_argument("-f", "--files", type=pathlib.Path, nargs='*', default=[], help="HAR files (as written with Config.HAR) to replay instead of synthetic pages")
+    args_parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic pages")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(
+        cast(List[int], args.get('writers')),
+        cast(int, args.get('pages')),
+        cast(bool, args.get('postgres')),
+        cast(List[str], args.get('paths')),
+        cast(List[pathlib.Path], args.get('files')),
+        cast(int, args.get('seed'))
+    ))
@@ -0,0 +1,338 @@
+import codecs
+import hashlib
+import json
+import pathlib
+import re
+import traceback
+from asyncio import CancelledError
+from functools import cached_property
+from html.parser import HTMLParser
+from logging import Logger
+from typing import Any, Dict, List, Optional, Tuple
+
+from playwright.sync_api import Response
+
+import utils
+from config import Config
+
+
+# State of a stored response body
+CAPTURED: str = 'captured'
+TRUNCATED: str = 'truncated'
+SKIPPED: str = 'skipped'
+
+# Meta header extraction
+META_PATTERN: re.Pattern = re.compile(rb'http-equiv', re.I)
+META_CHUNK: int = 16384
+META_LIST_ATTRIBUTES: Tuple[str, ...] = ('class', 'accesskey', 'dropzone')
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _MetaParser(HTMLParser):
+    """
+    Tokenizer that collects meta tags with an http-equiv attribute and stops at the body of the document.
+
+    Tags are serialized the way BeautifulSoup (html.parser builder, minimal formatter) serializes them, with
+    sorted attributes and escaped values, so the result matches ``str(tag)`` of the previous extraction.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self.tags: List[str] = []
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        value = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+        if '"' not in value:
+            return f'"{value}"'
+
+        if "'" not in value:
+            return f"'{value}'"
+
+        return '"' + value.replace('"', '&quot;') + '"'
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag == 'body':
+            raise _StopParsing()
+
+        if tag != 'meta':
+            return
+
+        # Later duplicates replace the value
+        attributes: Dict[str, str] = {}
+        for name, value in attrs:
+            value = value if value is not None else ''
+            attributes[name] = ' '.join(value.split()) if name in META_LIST_ATTRIBUTES else value
+
+        if 'http-equiv' in attributes:
+            self.tags.append('<meta' + ''.join(f" {name}={_MetaParser._quote(value)}" for name, value in sorted(attributes.items())) + '/>')
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == 'head':
+            raise _StopParsing()
+
+
+def is_body_allowed(resource: Optional[str], content_type: Optional[str], url: str, site: str, size: Optional[int]) -> bool:
+    """Checks the body capture policy before the body is fetched.
+
+    Args:
+        resource (str): resource type of the request
+        content_type (str): content type of the response
+        url (str): URL of the response
+        site (str): site of the crawled task, to tell first-party and third-party responses apart
+        size (int): announced size of the body if known
+
+    Returns:
+        true if the body should be fetched and stored
+    """
+
+    if (Config.BODY_RESOURCES is not None) and (resource not in Config.BODY_RESOURCES):
+        return False
+
+    if (Config.BODY_CONTENT_TYPES is not None) and (not any((content_type or '').lower().startswith(entry) for entry in Config.BODY_CONTENT_TYPES)):
+        return False
+
+    if size is not None:
+        if size < Config.BODY_MIN_SIZE:
+            return False
+
+        # Do not even fetch bodies that are known to exceed the limit
+        if (Config.BODY_MAX_SIZE is not None) and (size > Config.BODY_MAX_SIZE):
+            return False
+
+    if not Config.BODY_THIRD_PARTY:
+        parsed_url = utils.get_tld_object(url)
+        if (parsed_url is None) or (utils.get_url_site(parsed_url) != site):
+            return False
+
+    return True
+
+def store_body(body: bytes) -> Tuple[Optional[bytes], Optional[str], str]:
+    """Applies the size limits of the body capture policy to a fetched body.
+
+    Bodies larger than BODY_SPILL_SIZE are written to a content-addressed file in BODY_SPILL_PATH, so the
+    database row only keeps the path.
+
+    Args:
+        body (bytes): the body
+
+    Returns:
+        the body to store in the database, the path of the file with the body, and the state of the body
+    """
+
+    state: str = CAPTURED
+
+    if len(body) < Config.BODY_MIN_SIZE:
+        return None, None, SKIPPED
+
+    if (Config.BODY_MAX_SIZE is not None) and (len(body) > Config.BODY_MAX_SIZE):
+        body = body[:Config.BODY_MAX_SIZE]
+        state = TRUNCATED
+
+    if (Config.BODY_SPILL_SIZE is None) or (len(body) <= Config.BODY_SPILL_SIZE):
+        return body, None, state
+
+    digest: str = hashlib.sha1(body).hexdigest()
+    path: pathlib.Path = Config.BODY_SPILL_PATH / digest[:2] / digest
+
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary: pathlib.Path = path.with_suffix('.tmp')
+        temporary.write_bytes(body)
+        temporary.replace(path)
+
+    return None, str(path), state
+
+def get_meta_headers(data: bytes, content_type: Optional[str]) -> Optional[str]:
+    """Extracts the meta tags with an http-equiv attribute from the head of an HTML document.
+
+    Args:
+        data (bytes): the body of the response
+        content_type (str): content type of the response
+
+    Returns:
+        JSON list of the serialized meta tags, or None if the response is not an HTML document
+    """
+
+    if (content_type is not None) and ('html' not in content_type.lower()):
+        return None
+
+    # Most responses do not contain any meta header at all
+    if META_PATTERN.search(data) is None:
+        return '[]'
+
+    parser: _MetaParser = _MetaParser()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+
+    try:
+        for start in range(0, len(data), META_CHUNK):
+            parser.feed(decoder.decode(data[start:start + META_CHUNK], final=(start + META_CHUNK >= len(data))))
+        parser.close()
+    except _StopParsing:
+        pass
+
+    return json.dumps(parser.tags)
+
+def get_response_body(response: Response, site: str) -> Tuple[Optional[bytes], Optional[str], str, Optional[bytes]]:
+    """Fetches and stores the body of a response according to the body capture policy.
+
+    Args:
+        response (Response): the response
+        site (str): site of the crawled task
+
+    Returns:
+        the body to store in the database, the path of the file with the body, the state of the body, and the
+        complete fetched body (None if skipped) for further processing
+    """
+
+    # Provisional headers are available without a round trip to the browser
+    headers = response.headers
+    size: Optional[str] = headers.get('content-length', None)
+
+    if not is_body_allowed(response.request.resource_type, headers.get('content-type', None), response.url, site, int(size) if (size or '').isdigit() else None):
+        return None, None, SKIPPED, None
+
+    data: bytes = response.body()
+    return (*store_body(data), data)
+
+
+class CapturedResponse:
+    """
+    Response shared by all modules, which fetches the data modules store from the browser at most once.
+
+    The body, the meta headers, the header lists, and the redirect chain are fetched lazily and kept, so
+    modules processing the same response do not repeat the round trips to the browser. Errors are logged once
+    and the field is None afterwards. Other attributes are taken from the wrapped playwright response.
+    """
+
+    def __init__(self, response: Response, cache: 'ResponseCache') -> None:
+        self.response: Response = response
+        self._cache: ResponseCache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.response, name)
+
+    def __repr__(self) -> str:
+        return f"<CapturedResponse url={self.response.url!r} status={self.response.status}>"
+
+    @cached_property
+    def _body(self) -> Tuple[Optional[bytes], Optional[str], Optional[str], Optional[str]]:
+        try:
+            resbody, resbodyfile, resbodystate, data = get_response_body(self.response, self._cache.site)
+        except (Exception, CancelledError) as error:
+            self._cache.log.warning('capture.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return None, None, None, None
+
+        metaheaders: Optional[str] = None
+        if data is not None:
+            try:
+                metaheaders = get_meta_headers(data, self.response.headers.get('content-type', None))
+            except (Exception, CancelledError) as error:
+                self._cache.log.warning('capture.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+        # The complete body is released here, only the stored part is kept
+        return resbody, resbodyfile, resbodystate, metaheaders
+
+    @property
+    def resbody(self) -> Optional[bytes]:
+        return self._body[0]
+
+    @property
+    def resbodyfile(self) -> Optional[str]:
+        return self._body[1]
+
+    @property
+    def resbodystate(self) -> Optional[str]:
+        return self._body[2]
+
+    @property
+    def metaheaders(self) -> Optional[str]:
+        return self._body[3]
+
+    @cached_property
+    def reqbody(self) -> Optional[bytes]:
+        try:
+            return self.response.request.post_data_buffer
+        except (Exception, CancelledError) as error:
+            self._cache.log.warning('capture.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return None
+
+    @cached_property
+    def reqheaders(self) -> Optional[str]:
+        try:
+            return json.dumps(self.response.request.headers_array())
+        except (Exception, CancelledError) as error:
+            self._cache.log.warning('capture.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return None
+
+    @cached_property
+    def resheaders(self) -> Optional[str]:
+        try:
+            return json.dumps(self.response.headers_array())
+        except (Exception, CancelledError) as error:
+            self._cache.log.warning('capture.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return None
+
+    @cached_property
+    def redirected_from(self) -> Optional['CapturedResponse']:
+        if self.response.request.redirected_from is None:
+            return None
+
+        try:
+            return self._cache.get(self.response.request.redirected_from.response())
+        except (Exception, CancelledError) as error:
+            self._cache.log.warning('capture.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return None
+
+
+class ResponseCache:
+    """
+    Captured navigation responses of the current visit.
+
+    Only navigation responses, including their redirects, are kept, as those are processed by several modules;
+    other responses are wrapped without being kept so their bodies are released right away. Clear the cache
+    before every navigation.
+    """
+
+    def __init__(self, site: str, log: Logger) -> None:
+        self.site: str = site
+        self.log: Logger = log
+        self._captures: Dict[Response, CapturedResponse] = {}
+
+    def get(self, response: Optional[Response]) -> Optional[CapturedResponse]:
+        if response is None:
+            return None
+
+        captured: Optional[CapturedResponse] = self._captures.get(response, None)
+        if captured is not None:
+            return captured
+
+        captured = CapturedResponse(response, self)
+        if response.request.is_navigation_request():
+            self._captures[response] = captured
+
+        return captured
+
+    def get_chain(self, response: Optional[Response]) -> List[Optional[CapturedResponse]]:
+        """Gets the redirect chain of a response, beginning with the first request.
+
+        Args:
+            response (Response): the final response
+
+        Returns:
+            the captured responses of the chain
+        """
+
+        chain: List[Optional[CapturedResponse]] = [self.get(response)]
+        while (chain[-1] is not None) and (chain[-1].redirected_from is not None):
+            chain.append(chain[-1].redirected_from)
+
+        chain.reverse()
+        return chain
+
+    def clear(self) -> None:
+        self._captures.clear()
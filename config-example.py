@@ -1,6 +1,6 @@
 import pathlib
 from logging import DEBUG, ERROR, INFO, WARNING
-from typing import Dict, List, Literal, Optional
+from typing import Dict, List, Literal, Optional, Tuple
 
 
 class Config:
@@ -14,8 +14,17 @@ class Config:
 
     LOG: pathlib.Path = pathlib.Path('./logs/')  # path for saving logs
     LOG_LEVEL = INFO  # DEBUG|INFO|WARNING|ERROR
+    LOG_FORMAT: Literal['text', 'json', 'ecs'] = 'text'  # Format of log records (ecs uses ecs-logging if installed, otherwise json)
+    LOG_ROTATE_BYTES: int = 0  # Rotate log files at this size (0 disables size-based rotation)
+    LOG_ROTATE_WHEN: Optional[str] = None  # Rotate log files at this interval, e.g., 'midnight' or 'h' (None disables time-based rotation)
+    LOG_BACKUPS: int = 5  # Number of rotated and compressed log files to keep
+    LOG_RATE_LIMIT: int = 10  # Maximum number of identical warnings per minute (0 disables rate limiting)
 
-    HAR: Optional[pathlib.Path] = None
+    SCREENSHOT_FORMAT: Literal['png', 'jpeg', 'webp'] = 'png'  # Encoding of screenshots (jpeg and webp are smaller; webp requires Chromium, playwright falls back to jpeg)
+    SCREENSHOT_QUALITY: int = 80  # Quality of jpeg and webp screenshots (0-100)
+    SCREENSHOT_SCALE: float = 1.0  # Scale of screenshots relative to the viewport (Chromium only; below 1 uses CSS pixels elsewhere)
+
+    HAR: Optional[pathlib.Path] = None  # Directory for compressed HAR files (one per URL and repetition) and their response bodies
 
     EXTENSIONS: Optional[List[pathlib.Path]] = []
 
@@ -24,11 +33,24 @@ class Config:
     LOCALE: str = 'de-DE'
     TIMEZONE: str = 'Europe/Berlin'
     HEADLESS: bool = False  # Headless browser
+    BROWSER_ARGS: List[str] = []  # Additional command line arguments for the browser (e.g., --host-resolver-rules for Chromium)
 
     INSTRUMENT_MEDIA: bool = False  # Intercept GET requests to media content (e.g., images, videos) and return a fake content to reduce load
     INSTRUMENT_MEDIA_GET: bool = True  # Use GET instead of HEAD before returning fake content
+    INSTRUMENT_MEDIA_NOFETCH: bool = False  # Return fake content based on resource type, Accept header and URL extension without fetching the media first
+    INSTRUMENT_MEDIA_ALL: bool = False  # With INSTRUMENT_MEDIA_NOFETCH, also stub media URLs without a media extension (e.g., /image?id=1); every request then passes through python
+
+    # Response body capture policy; bodies that do not match are not fetched and their rows are marked as skipped
+    BODY_RESOURCES: Optional[List[str]] = None  # Resource types (document, script, image, etc.) to capture bodies for (None = all)
+    BODY_CONTENT_TYPES: Optional[List[str]] = None  # Content type prefixes (e.g., 'text/', 'application/json') to capture bodies for (None = all)
+    BODY_MIN_SIZE: int = 0  # Skip bodies smaller than ... bytes
+    BODY_MAX_SIZE: Optional[int] = None  # Skip bodies announced larger than ... bytes and truncate others to that size (None = unlimited)
+    BODY_THIRD_PARTY: bool = True  # Capture bodies of third-party responses
+    BODY_SPILL_SIZE: Optional[int] = None  # Write bodies larger than ... bytes to BODY_SPILL_PATH instead of the database (None = never)
+    BODY_SPILL_PATH: pathlib.Path = pathlib.Path('./logs/bodies/')
 
     SAVE_CONTEXT: bool = False  # Store saved cookies and localStorage while crawling
+    RESET_CONTEXT: bool = False  # If SAVE_CONTEXT is False, clear cookies, storage, cache, and service workers in place after every URL instead of recreating the context (Firefox and WebKit keep their HTTP cache)
 
     MANUAL_SETUP: bool = False  # Setup the state manually at the start of the crawl
 
@@ -41,6 +63,10 @@ class Config:
     SAME_ENTITY: bool = False  # URL discovery for same entity only (ETLD+1 or company, owner, etc.)
     DEPTH: int = 1  # URL discovery limit; 0 (initial URL only), 1 (+ all URLs from initial page), etc.
     MAX_URLS: int = 100  # limit number of URLs gathered for a domain
+    URL_CANONICALIZE: bool = True  # Treat URLs that only differ in tracking or session parameters, parameter order, or percent-encoding as already seen
+    URL_STRIP_PARAMETERS: List[str] = []  # Additional query parameters to ignore when comparing URLs, e.g., 'sid' where it is a session id (names ending with '*' are prefixes)
+    URL_LOWERCASE_PATH: bool = False  # Treat URL paths that only differ in case as the same (only for case-insensitive servers)
+    URL_LEARN_PARAMETERS: int = 0  # Ignore a query parameter of a site after this many pages only differing in it had the same links (0 = disable)
 
     REPETITIONS: int = 1  # how many times to crawl the same URL and invoke module response handlers
 
@@ -51,9 +77,27 @@ class Config:
     RESTART_TIMEOUT: int = 600  # restart crawler if it hasn't done anything for ... seconds
 
     RESTART_BROWSER: int = 10  # Close and re-open browser after ... page visits
+    PRELOAD: bool = False  # Load the next URL in a sibling context while modules process the current page (requires SAVE_CONTEXT, RESET_CONTEXT, HAR, and MANUAL_SETUP off, no extensions, and modules that support it)
+
+    METRICS: bool = False  # Record wall and CPU time of every crawler phase per URL and repetition in the metric table (see metrics.py)
+    METRICS_ADDRESS: Optional[Tuple[str, int]] = None  # Serve live crawl metrics in the Prometheus text format on (host, port), e.g. ('127.0.0.1', 9100)
+    METRICS_FILE: Optional[pathlib.Path] = None  # Periodically write live crawl metrics in the Prometheus text format to this file
+    METRICS_INTERVAL: int = 15  # Update live crawl metrics every ... seconds
+
+    PROFILE: float = 0  # Share of tasks (0-1) to profile completely; profiles are written to LOG/profiles (see profiling.py)
+    PROFILE_MODULES: List[str] = []  # Modules whose add_handlers and receive_response are profiled in every task
+    PROFILE_MODE: Literal['sampled', 'deterministic'] = 'sampled'  # Sample stacks (collapsed stacks for flamegraphs) or trace every call with cProfile (pstats)
+    PROFILE_INTERVAL: float = 0.005  # Seconds between stack samples
+
+    TRACE: float = 0  # Share of tasks (0-1) to trace; traces are written next to the screenshots (see tracing.py)
+    TRACE_TASKS: List[int] = []  # IDs of tasks to trace in any case
+    TRACE_CATEGORIES: Optional[List[str]] = None  # Chromium trace categories (None for the Playwright defaults)
+    TRACE_PLAYWRIGHT: bool = False  # Also store a Playwright trace (snapshots, network, console) per browser context of traced tasks
+
+    ACCEPT_COOKIES: bool = False  # Attempt to find cookie banners and accept them (unreliable)
+    TOKENIZE_OPTIONAL_CORPORA: bool = False  # Tokenize without lemmatizing or removing stop words (with a warning) if the nltk wordnet or stopwords corpus is missing, instead of failing
 
     # TODO more options
-    # ACCEPT_COOKIES: bool = False  # Attempt to find cookie banners and accept them (unreliable)
     # OBEY_ROBOTS: bool = False  # obey robots.txt
     FIRST_AND_LAST: bool = False  # prioritize visiting "interesting" URLS (experimental)
     ADULT_FILTER: bool = False  # avoid visiting adult sites
@@ -3,24 +3,58 @@ import pickle
 import shutil
 import time
 import traceback
+import urllib.parse
 from datetime import datetime
 from logging import Logger
-from typing import Any, Callable, Dict, List, Optional, Type, cast
+from typing import Any, Callable, Dict, List, Optional, Set, Type, cast
 
 import tld
-from playwright.sync_api import Browser, BrowserContext, CDPSession, Error, Page, Playwright, Response, sync_playwright
+from playwright.sync_api import Browser, BrowserContext, CDPSession, Error, Page, Playwright, Request, Response, sync_playwright
 
 import utils
+from capture import CapturedResponse, ResponseCache
 from config import Config
 from database import URL, URLDB, Site, Task, load_database
+from har import HarWriter
+from logger import set_context
+from metrics import PhaseTimer, get_rss
 from modules.AcceptCookies import AcceptCookies
 from modules.CollectUrls import CollectUrls
 from modules.InstrumentMedia import InstrumentMedia
 from modules.Module import Module
 from modules.SaveURL import SaveURL
+from profiling import Profiler
+from screenshots import ScreenshotWriter
+from tracing import Tracer
+
+# Clears the storage of the origin it runs in and returns whether everything could be cleared
+CLEAR_STORAGE: str = """async () => {
+    localStorage.clear();
+    sessionStorage.clear();
+    if (!indexedDB.databases) {
+        return false;
+    }
+    for (const database of await indexedDB.databases()) {
+        await new Promise((resolve) => { const request = indexedDB.deleteDatabase(database.name); request.onsuccess = request.onerror = request.onblocked = resolve; });
+    }
+    if (self.caches) {
+        for (const key of await caches.keys()) {
+            await caches.delete(key);
+        }
+    }
+    if (navigator.serviceWorker) {
+        for (const registration of await navigator.serviceWorker.getRegistrations()) {
+            await registration.unregister();
+        }
+    }
+    return true;
+}"""
 
 
 class Crawler:
+    # Navigation timing entries that correspond to the load states
+    LOAD_EVENTS: Dict[str, str] = {'commit': 'responseStart', 'domcontentloaded': 'domContentLoadedEventEnd', 'load': 'loadEventEnd'}
+
     def _update_cache(self) -> None:
         self.log.debug("Updating cache")
 
@@ -28,6 +62,7 @@ class Crawler:
             self.task.updated = datetime.today()
             self.task.crawlerstate = pickle.dumps(self.state)
             self.database.execute_sql(f"UPDATE task SET updated={self.database.param}, crawlerstate={self.database.param} WHERE id={self.database.param}", (self.task.updated, self.task.crawlerstate, self.task.get_id()))
+            self.urldb.flush_counts()
 
     def _delete_browser_cache(self) -> None:
         self.log.debug("Deleting browser cache")
@@ -45,27 +80,24 @@ class Crawler:
             self.task.updated = datetime.today()
             self.state = None
             self.database.execute_sql(f"UPDATE task SET updated={self.database.param}, crawlerstate=NULL WHERE id={self.database.param}", (self.task.updated, self.task.get_id()))
+            self.urldb.flush_counts()
 
     def _init_context(self) -> None:
         self.log.debug("Initializing context")
 
-        if Config.HAR:
-            self.context = self.browser.new_context(
-                storage_state=self.state.get('Context', None),
-                **self.playwright.devices[Config.DEVICE],
-                locale=Config.LOCALE,
-                timezone_id=Config.TIMEZONE,
-                record_har_content='embed',
-                record_har_mode='full',
-                record_har_path=(Config.HAR / f"{self.task.job}-{self.task.crawler}.har")
-            )
-        else:
-            self.context = self.browser.new_context(
-                storage_state=self.state.get('Context', None),
-                **self.playwright.devices[Config.DEVICE],
-                locale=Config.LOCALE,
-                timezone_id=Config.TIMEZONE
-            )
+        self.context = self.browser.new_context(
+            storage_state=self.state.get('Context', None),
+            **self.playwright.devices[Config.DEVICE],
+            locale=Config.LOCALE,
+            timezone_id=Config.TIMEZONE
+        )
+
+        if self.har is not None:
+            self.har.attach(self.context)
+        if self.tracer is not None:
+            self.tracer.attach(self.context)
+
+        self.context.on('request', self._record_origin)
 
         self.page = self.context.new_page()
         self.cdp = self.context.new_cdp_session(self.page) if Config.BROWSER == 'chromium' else None
@@ -73,40 +105,104 @@ class Crawler:
     def _init_context_extensions(self) -> None:
         self.log.debug("Initializing context with extensions")
 
-        if Config.HAR:
-            self.context = self.playwright.chromium.launch_persistent_context(
-                Config.LOG / f"browser-{self.task.job}-{self.task.crawler}",
-                headless=Config.HEADLESS,
-                record_har_content='embed',
-                record_har_mode='full',
-                record_har_path=(Config.HAR / f"{self.task.job}.har"),
-                args=[
-                    "--disable-extensions-except=" + ','.join([str(extension) for extension in Config.EXTENSIONS or []]),
-                    "--load-extension" + ','.join([str(extension) for extension in Config.EXTENSIONS or []]),
-                ]
-            )
-        else:
-            self.context = self.playwright.chromium.launch_persistent_context(
-                Config.LOG / f"browser-{self.task.job}-{self.task.crawler}",
-                headless=Config.HEADLESS,
-                args=[
-                    "--disable-extensions-except=" + ','.join([str(extension) for extension in Config.EXTENSIONS or []]),
-                    "--load-extension" + ','.join([str(extension) for extension in Config.EXTENSIONS or []]),
-                ]
-            )
+        self.context = self.playwright.chromium.launch_persistent_context(
+            Config.LOG / f"browser-{self.task.job}-{self.task.crawler}",
+            headless=Config.HEADLESS,
+            args=[
+                "--disable-extensions-except=" + ','.join([str(extension) for extension in Config.EXTENSIONS or []]),
+                "--load-extension" + ','.join([str(extension) for extension in Config.EXTENSIONS or []]),
+            ] + Config.BROWSER_ARGS
+        )
+
+        if self.har is not None:
+            self.har.attach(self.context)
+        if self.tracer is not None:
+            self.tracer.attach(self.context)
+
+        self.context.on('request', self._record_origin)
 
         self.page = self.context.new_page()
         self.cdp = self.context.new_cdp_session(self.page) if Config.BROWSER == 'chromium' else None
 
+    def _record_origin(self, request: Request) -> None:
+        # Only documents (and the workers they start) create storage
+        if request.resource_type != 'document':
+            return
+
+        parsed_url: urllib.parse.SplitResult = urllib.parse.urlsplit(request.url)
+        if parsed_url.scheme in ('http', 'https'):
+            self.origins.add(f"{parsed_url.scheme}://{parsed_url.netloc}")
+
+    def _clear_origin(self, origin: str) -> bool:
+        # Open an empty page of the origin without contacting the site and clear its storage from there
+        url: str = f"{origin}/"
+        self.page.route(url, lambda route: route.fulfill(status=200, content_type='text/html', body='<html></html>'))
+        try:
+            self.page.goto(url)
+            return bool(self.page.evaluate(CLEAR_STORAGE))
+        finally:
+            self.page.unroute(url)
+
+    def _reset_context(self) -> bool:
+        """Clears the state of the context in place; returns False if it has to be recreated instead.
+
+        Chromium clears everything through CDP. Firefox and WebKit clear the storage of every visited origin from
+        an empty page of the origin; their HTTP cache cannot be cleared and is kept.
+        """
+
+        self.log.debug("Resetting context")
+
+        self.resetting = True
+        try:
+            # Leave the page first, so no script writes state back
+            for page in self.context.pages:
+                if page != self.page:
+                    page.close()
+            self.page.goto('about:blank')
+
+            self.context.clear_cookies()
+            self.context.clear_permissions()
+
+            if self.cdp is not None:
+                self.cdp.send('Network.clearBrowserCache')
+
+                for origin in self.origins:
+                    self.cdp.send('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+                    self.cdp.send('DOMStorage.clear', {'storageId': {'securityOrigin': origin, 'isLocalStorage': False}})
+            else:
+                # The pages opened for clearing are not part of the visit
+                if self.har is not None:
+                    self.har.close()
+
+                for origin in list(self.origins):
+                    if not self._clear_origin(origin):
+                        return False
+                self.page.goto('about:blank')
+
+                # Workers started before they were unregistered could have set cookies meanwhile
+                self.context.clear_cookies()
+
+            self.origins.clear()
+        except Exception as error:
+            self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return False
+        finally:
+            self.resetting = False
+
+        return True
+
     def _init_browser(self) -> None:
         self.log.debug("Initializing browser")
 
         if Config.BROWSER == 'firefox':
-            self.browser = self.playwright.firefox.launch(headless=Config.HEADLESS)
+            self.browser = self.playwright.firefox.launch(headless=Config.HEADLESS, args=Config.BROWSER_ARGS)
         elif Config.BROWSER == 'webkit':
-            self.browser = self.playwright.webkit.launch(headless=Config.HEADLESS)
+            self.browser = self.playwright.webkit.launch(headless=Config.HEADLESS, args=Config.BROWSER_ARGS)
         elif Config.BROWSER == 'chromium':
-            self.browser = self.playwright.chromium.launch(headless=Config.HEADLESS)
+            self.browser = self.playwright.chromium.launch(headless=Config.HEADLESS, args=Config.BROWSER_ARGS)
+
+        if self.tracer is not None:
+            self.tracer.start_browser(self.browser)
 
         self._init_context()
 
@@ -121,6 +217,10 @@ class Crawler:
 
     def _close_context(self) -> None:
         self.log.debug("Closing context")
+        if self.har is not None:
+            self.har.close()
+        if self.tracer is not None:
+            self.tracer.detach(self.context)
         if (Config.BROWSER == 'chromium') and (self.cdp is not None):
             self.cdp.detach()
         self.page.close()
@@ -130,29 +230,30 @@ class Crawler:
         self._close_context()
         self.log.debug("Closing browser")
         if self.browser:
+            if self.tracer is not None:
+                self.tracer.stop_browser(self.browser)
             self.browser.close()
 
     def _invoke_page_handlers(self) -> None:
         self.log.debug("Invoking page handlers")
 
         for module in self.modules:
-            module.add_handlers()
+            with self.metrics.measure(f"add_handlers:{type(module).__name__}"), self.profiler.profile(type(module).__name__):
+                module.add_handlers()
 
     def _invoke_response_handlers(self, responses: List[Optional[Response]], repetition: int) -> None:
         self.log.debug("Invoking response handlers")
         assert len(responses) == 1
 
         # Prepare response chain if there are redirections
-        response: Optional[Response] = responses[-1]
-        while (response is not None) and (response.request.redirected_from is not None):
-            responses.append(response.request.redirected_from.response())
-            response: Optional[Response] = responses[-1]
-        responses.reverse()
+        with self.metrics.measure('response_chain'):
+            captured: List[Optional[CapturedResponse]] = self.captures.get_chain(responses[0])
 
         final_url: str = self.page.url
 
         for module in self.modules:
-            module.receive_response(responses, final_url, repetition)
+            with self.metrics.measure(f"receive_response:{type(module).__name__}"), self.profiler.profile(type(module).__name__):
+                module.receive_response(captured, final_url, repetition)
 
     def _open_url(self) -> Optional[Response]:
         self.log.info(f"Navigating to URL: {self.url.url}")
@@ -160,32 +261,143 @@ class Crawler:
         response: Optional[Response] = None
         error_message: Optional[str] = None
 
-        self.page.wait_for_timeout(Config.WAIT_BEFORE_LOAD)
+        with self.metrics.measure('wait_before'):
+            self.page.wait_for_timeout(Config.WAIT_BEFORE_LOAD)
         try:
-            response = self.page.goto(cast(str, self.url.url), timeout=Config.LOAD_TIMEOUT, wait_until=Config.WAIT_LOAD_UNTIL)
+            with self.metrics.measure('goto'):
+                response = self.page.goto(cast(str, self.url.url), timeout=Config.LOAD_TIMEOUT, wait_until=Config.WAIT_LOAD_UNTIL)
         except Error as error:
             error_message = ((error.name + ' ') if error.name else '') + error.message
             self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
-        self.page.wait_for_timeout(Config.WAIT_AFTER_LOAD)
+        with self.metrics.measure('wait_after'):
+            self.page.wait_for_timeout(Config.WAIT_AFTER_LOAD)
+
+        return self._finish_url(response, error_message)
 
+    def _finish_url(self, response: Optional[Response], error_message: Optional[str]) -> Optional[Response]:
         # On first visit, also update the task
         if (self.landing.code is None) and (self.repetition == 1):
             self.task.updated = datetime.today()
             self.task.error = error_message
 
-            self.database.execute_sql(
-                f"UPDATE task SET updated={self.database.param}, error={self.database.param} WHERE id={self.database.param}",
-                (self.task.updated, self.task.error, self.task.get_id())
-            )
+            if (error_message is not None) and (self.report is not None):
+                self.report('task_error', 1)
+
+            with self.metrics.measure('task_update'):
+                self.database.execute_sql(
+                    f"UPDATE task SET updated={self.database.param}, error={self.database.param} WHERE id={self.database.param}",
+                    (self.task.updated, self.task.error, self.task.get_id())
+                )
 
-            utils.get_screenshot(
-                self.page,
-                (Config.LOG / f"screenshots/{datetime.now().strftime('%Y-%m-%d')}-{self.task.job}-{self.task.crawler}-1-{self.site.scheme}-{self.site.site}.png")
-            )
+            with self.metrics.measure('screenshot'):
+                self.screenshots.take(
+                    self.page,
+                    (Config.LOG / f"screenshots/{datetime.now().strftime('%Y-%m-%d')}-{self.task.job}-{self.task.crawler}-1-{self.site.scheme}-{self.site.site}.png"),
+                    self.cdp
+                )
+
+        self.urldb.count_visit(self.repetition, response.status if response is not None else Config.ERROR_CODES['response_error'])
 
         self.log.info(f"Response status {response if response is None else response.status} repetition {self.repetition}")
         return response
 
+    def _start_preload(self, url: URL) -> None:
+        self.log.info(f"Preloading URL: {url.url}")
+
+        current = (self.context, self.page, self.cdp, self.url, self.depth, self.repetition)
+        responses: List[Response] = []
+        failures: List[str] = []
+
+        def on_response(response: Response) -> None:
+            if response.request.is_navigation_request() and (response.frame.parent_frame is None):
+                responses.append(response)
+
+        def on_failed(request: Request) -> None:
+            if request.is_navigation_request() and (request.frame.parent_frame is None):
+                failures.append(request.failure or '')
+
+        try:
+            # Prepare a sibling context as if the crawler was already on the next URL
+            self._init_context()
+            self.url, self.depth, self.repetition = url, cast(int, url.depth), 1
+            self._invoke_page_handlers()
+
+            self.page.on('response', on_response)
+            self.page.on('requestfailed', on_failed)
+
+            # Start the navigation without waiting for it
+            if self.cdp is not None:
+                self.cdp.send('Page.navigate', {'url': url.url})
+            else:
+                self.page.evaluate("(url) => { window.location.href = url; }", url.url)
+
+            self.preload = {'url': url, 'context': self.context, 'page': self.page, 'cdp': self.cdp, 'responses': responses, 'failures': failures, 'start': time.time()}
+        except Exception as error:
+            self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            if self.context is not current[0]:
+                self._close_context()
+            URL.update(state='free').where(URL.id == url.get_id()).execute()
+        finally:
+            self.context, self.page, self.cdp, self.url, self.depth, self.repetition = current
+
+    def _adopt_preload(self) -> None:
+        self.context = self.preload['context']
+        self.page = self.preload['page']
+        self.cdp = self.preload['cdp']
+
+    def _cancel_preload(self) -> None:
+        if self.preload is None:
+            return
+
+        self.log.info(f"Cancel preloading URL: {self.preload['url'].url}")
+
+        try:
+            self.preload['context'].close()
+        except Exception as error:
+            self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+        URL.update(state='free').where(URL.id == self.preload['url'].get_id()).execute()
+        self.preload = None
+
+    def _finish_preload(self) -> Optional[Response]:
+        self.log.info(f"Navigating to preloaded URL: {self.url.url}")
+
+        preload: Dict[str, Any] = cast(Dict[str, Any], self.preload)
+        self.preload = None
+
+        error_message: Optional[str] = None
+
+        # Wait for the rest of the load timeout, like goto would
+        elapsed: float = (time.time() - preload['start']) * 1000
+        try:
+            if Config.WAIT_LOAD_UNTIL != 'commit':
+                with self.metrics.measure('goto'):
+                    self.page.wait_for_load_state(Config.WAIT_LOAD_UNTIL, timeout=max(1, Config.LOAD_TIMEOUT - elapsed) if Config.LOAD_TIMEOUT else 0)
+        except Error as error:
+            error_message = ((error.name + ' ') if error.name else '') + error.message
+            self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+        if preload['failures'] and (error_message is None):
+            error_message = f"{preload['failures'][0]} at {self.url.url}"
+            self.log.error(f"crawler.py: {error_message}")
+
+        # The navigation response is the end of the first redirect chain, later navigations are client-side
+        response: Optional[Response] = next((entry for entry in preload['responses'] if entry.request.redirected_to is None), None)
+
+        # Only wait for what is left of the time after load
+        try:
+            event: str = Crawler.LOAD_EVENTS.get(Config.WAIT_LOAD_UNTIL, '')
+            since_load: float = self.page.evaluate(
+                "(event) => { const entry = performance.getEntriesByType('navigation')[0]; return (entry && entry[event]) ? performance.now() - entry[event] : 0; }",
+                event
+            ) if event else 0
+        except Error:
+            since_load = 0
+        with self.metrics.measure('wait_after'):
+            self.page.wait_for_timeout(max(0, Config.WAIT_AFTER_LOAD - since_load))
+
+        return self._finish_url(response, error_message)
+
     def __init__(self, taskid: int, log: Logger, modules: List[Type[Module]]) -> None:
         log.debug("Crawler initializing")
 
@@ -218,6 +430,16 @@ class Crawler:
         self.context: BrowserContext = None
         self.page: Page = None
         self.cdp: Optional[CDPSession] = None
+        self.har: Optional[HarWriter] = HarWriter(Config.HAR, self.log) if Config.HAR else None
+        self.captures: ResponseCache = ResponseCache(self.site.site, self.log)
+        self.origins: Set[str] = set()
+        self.resetting: bool = False  # The context is being reset, its requests are not part of a visit
+        self.screenshots: ScreenshotWriter = ScreenshotWriter(self.log)
+        self.metrics: PhaseTimer = PhaseTimer(Config.METRICS, self.log)
+        self.tracer: Optional[Tracer] = Tracer(self.task.job, self.task.crawler, self.task.get_id(), self.site.site, self.log) if Tracer.is_traced(self.task.get_id()) else None
+        self.metrics.tracer = self.tracer
+        self.profiler: Profiler = Profiler(self.task.job, self.task.crawler, self.task.get_id(), self.log)
+        self.report: Optional[Callable[[str, float], None]] = None  # Live metrics of the process that started the crawler
         self.urldb: URLDB = URLDB(self)
 
         # Add URL to database
@@ -225,12 +447,16 @@ class Crawler:
             # Crawler previously crashed on current URL
             # Therefore, invalidate the current URL
             self.log.warning("Invalidating latest crashed URL %s", self.url.url)
-            URL.update(code=Config.ERROR_CODES['crawler_error'], state='complete').where(URL.task==self.task, URL.url==self.url.url, URL.depth==self.depth, URL.state!='complete').execute()
+            invalidated: int = URL.update(code=Config.ERROR_CODES['crawler_error'], state='complete').where(URL.task==self.task, URL.url==self.url.url, URL.depth==self.depth, URL.state!='complete').execute()
             self.url = URL.get_by_id(self.state.get('URL', self.landing.get_id()))
 
+            # The invalidated rows are the crashed repetition and the ones after it
+            for repetition in range(Config.REPETITIONS - invalidated + 1, Config.REPETITIONS + 1):
+                self.urldb.count_visit(repetition, Config.ERROR_CODES['crawler_error'])
+
         # Initialize modules
         self.modules: List[Module] = []
-        # TODO [AcceptCookies(self)] if Config.ACCEPT_COOKIES else []
+        self.modules += [AcceptCookies(self)] if Config.ACCEPT_COOKIES else []
         self.modules += [CollectUrls(self)] if Config.RECURSIVE else []
         for module in modules:
             self.modules.append(module(self))
@@ -238,6 +464,13 @@ class Crawler:
         self.modules += [InstrumentMedia(self)] if Config.INSTRUMENT_MEDIA else []
         self.log.debug(f"Prepared modules: {self.modules}")
 
+        # Preloading needs a fresh sibling context per URL and modules that do not depend on the current URL for browser events
+        self.preload: Optional[Dict[str, Any]] = None
+        self._preload: bool = Config.PRELOAD and (not Config.SAVE_CONTEXT) and (not Config.RESET_CONTEXT) and (not Config.EXTENSIONS) and (not Config.HAR) and (not Config.MANUAL_SETUP)
+        if self._preload and any(not module.PRELOAD_SAFE for module in self.modules):
+            self.log.warning(f"Preloading disabled for modules {[type(module).__name__ for module in self.modules if not module.PRELOAD_SAFE]}")
+            self._preload = False
+
         # Initialize URL filters
         url_filter_out: List[Callable[[tld.utils.Result], bool]] = []
         for module in self.modules:
@@ -251,10 +484,11 @@ class Crawler:
         # Initiate playwright, browser, context, and page
         try:
             self.playwright = sync_playwright().start()
-            if (Config.BROWSER == 'chromium') and Config.EXTENSIONS:
-                self._init_browser_extensions()
-            else:
-                self._init_browser()
+            with self.metrics.measure('browser'):
+                if (Config.BROWSER == 'chromium') and Config.EXTENSIONS:
+                    self._init_browser_extensions()
+                else:
+                    self._init_browser()
         except Exception as error:
             self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
             self.stop = True
@@ -301,37 +535,65 @@ class Crawler:
 
         # Main loop
         _count = 0
+        _reset = False
         while (self.url is not None) and (not self.stop):
             for repetition in range(Config.REPETITIONS):
                 if (self.url is None) or self.stop:
                     break
 
                 self.repetition = repetition + 1
+                _visit = (self.url.get_id(), self.repetition)
+                set_context(self.log, url_id=self.url.get_id())
+                if self.tracer is not None:
+                    self.tracer.visit(self.url.url, self.repetition)
+                _started: float = time.time()
 
                 # Invoke module page handlers
-                if (_count == 0) or ((self.repetition == 1) and (_count > 0) and ((_count - 1) % Config.RESTART_BROWSER == 0)) or (not Config.SAVE_CONTEXT):
-                    self._invoke_page_handlers()
-                self.page.wait_for_timeout(5000)
+                if self.preload is None:
+                    if (_count == 0) or ((self.repetition == 1) and (_count > 0) and ((_count - 1) % Config.RESTART_BROWSER == 0)) or ((not Config.SAVE_CONTEXT) and (not _reset)):
+                        self._invoke_page_handlers()
+                    with self.metrics.measure('wait_handlers'):
+                        self.page.wait_for_timeout(5000)
+
+                # Record a separate HAR file for every visit
+                if self.har is not None:
+                    self.har.rotate(Config.HAR / f"{self.task.job}-{self.task.crawler}-{self.task.get_id()}-{self.url.get_id()}-{self.repetition}.har.gz", self.url.url)
 
                 # Navigate to page
-                response: Optional[Response] = self._open_url()
+                self.captures.clear()
+                response: Optional[Response] = self._open_url() if self.preload is None else self._finish_preload()
+
+                # Load the next URL while the modules process this one
+                if self._preload and (self.repetition == Config.REPETITIONS) and (_count % Config.RESTART_BROWSER != 0) and (not self.stop):
+                    with self.metrics.measure('preload'):
+                        url: Optional[URL] = self.urldb.get_url(1, fallback=False)
+                        if url is not None:
+                            self._start_preload(url)
 
                 # Run modules response handler
                 self._invoke_response_handlers([response], self.repetition)
 
-                # Last screenshot
-                if (self.repetition == Config.REPETITIONS) and (not self.database.execute_sql(f"SELECT id FROM URL WHERE task_id={self.database.param} AND state='free' LIMIT 1", (self.task.get_id(),)).fetchone()):
-                    utils.get_screenshot(
-                        self.page,
-                        (Config.LOG / f"screenshots/{datetime.now().strftime('%Y-%m-%d')}-{self.task.job}-{self.task.crawler}-2-{self.site.scheme}-{self.site.site}.png")
-                    )
+                if self.report is not None:
+                    self.report('page', time.time() - _started)
+                    self.report('rss', get_rss())
 
                 # Get next URL to crawl
                 if self.repetition == Config.REPETITIONS:
-                    self.url = self.urldb.get_url(1)
+                    with self.metrics.measure('next_url'):
+                        self.url = self.urldb.get_url(1) if self.preload is None else self.preload['url']
                     self.repetition = 1
+
+                    # Last screenshot, the page is still open when there is no URL left
+                    if self.url is None:
+                        with self.metrics.measure('screenshot'):
+                            self.screenshots.take(
+                                self.page,
+                                (Config.LOG / f"screenshots/{datetime.now().strftime('%Y-%m-%d')}-{self.task.job}-{self.task.crawler}-2-{self.site.scheme}-{self.site.site}.png"),
+                                self.cdp
+                            )
                 else:
-                    self.url = self.urldb.get_url(self.repetition)
+                    with self.metrics.measure('next_url'):
+                        self.url = self.urldb.get_url(self.repetition)
                 self.log.info(f"Get URL {self.url.url if self.url is not None else self.url} depth {self.url.depth if self.url is not None else self.depth} repetition {self.repetition}")
 
                 # Update state
@@ -341,38 +603,57 @@ class Crawler:
                     self.state['URL'] = self.url.get_id()
 
                 # Save state if needed
-                if Config.SAVE_CONTEXT and self.browser and (self.repetition == 1):
-                    try:
-                        self.state['Context'] = self.context.storage_state()
-                    except Exception as error:
-                        self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+                with self.metrics.measure('checkpoint'):
+                    if Config.SAVE_CONTEXT and self.browser and (self.repetition == 1):
+                        try:
+                            self.state['Context'] = self.context.storage_state()
+                        except Exception as error:
+                            self.log.error('crawler.py:%s %s', traceback.extract_stack()[-1].lineno, error)
 
-                self._update_cache()
+                    self._update_cache()
 
                 # Delete cache if needed
                 if (self.url is not None) and (not self.stop) and (not Config.SAVE_CONTEXT):
-                    self._close_context()
-                    self._delete_browser_cache()
-                    if (Config.BROWSER == 'chromium') and Config.EXTENSIONS:
-                        self._init_context_extensions()
-                    else:
-                        self._init_context()
+                    with self.metrics.measure('context'):
+                        # A reset context keeps its handlers
+                        _reset = Config.RESET_CONTEXT and self._reset_context()
+
+                        if not _reset:
+                            self._close_context()
+                            self._delete_browser_cache()
+                            if self.preload is not None:
+                                self._adopt_preload()
+                            elif (Config.BROWSER == 'chromium') and Config.EXTENSIONS:
+                                self._init_context_extensions()
+                            else:
+                                self._init_context()
+
+                self.metrics.flush(self.database, self.task.get_id(), *_visit)
 
             # Restart browser to to avoid memory issues every few page visits
             if (self.url is not None) and (not self.stop) and (_count % Config.RESTART_BROWSER == 0):
-                self._close_browser()
+                with self.metrics.measure('browser'):
+                    self._close_browser()
 
-                if not Config.SAVE_CONTEXT:
-                    self._delete_browser_cache()
+                    if not Config.SAVE_CONTEXT:
+                        self._delete_browser_cache()
 
-                if (Config.BROWSER == 'chromium') and Config.EXTENSIONS:
-                    self._init_browser_extensions()
-                else:
-                    self._init_browser()
+                    if (Config.BROWSER == 'chromium') and Config.EXTENSIONS:
+                        self._init_browser_extensions()
+                    else:
+                        self._init_browser()
+
+                # The restart follows the last visit
+                self.metrics.flush(self.database, self.task.get_id(), *_visit)
+
+                if self.report is not None:
+                    self.report('browser', 1)
 
             _count += 1
 
         # Close everything
+        self._cancel_preload()
+        self.screenshots.close()
         self._close_browser()
         self.playwright.stop()
 
@@ -1,7 +1,9 @@
+import hashlib
+import urllib.parse
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from peewee import AutoField, BlobField, BooleanField, CharField, DatabaseProxy, DateTimeField, DeferredForeignKey, ForeignKeyField, IntegerField, Model, PostgresqlDatabase, SqliteDatabase, TextField
+from peewee import AutoField, BlobField, BooleanField, CharField, CompositeKey, DatabaseProxy, DateTimeField, DeferredForeignKey, FloatField, ForeignKeyField, IntegerField, Model, PostgresqlDatabase, SqliteDatabase, TextField, fn
 
 import utils
 from config import Config
@@ -43,6 +45,27 @@ def load_database() -> SqliteDatabase | PostgresqlDatabase:
 
     return _database
 
+def add_columns(database: SqliteDatabase | PostgresqlDatabase, table: str, columns: Dict[str, str], indexes: List[str]) -> None:
+    """Adds columns that were introduced after a table was created, with their indexes.
+
+    Args:
+        database: the database
+        table (str): table name
+        columns (Dict[str, str]): SQL type with default by column name
+        indexes (List[str]): columns that are indexed
+    """
+
+    existing: Set[str] = {column.name for column in database.get_columns(table)}
+    missing: List[str] = [name for name in columns if name not in existing]
+    if not missing:
+        return
+
+    with database.atomic():
+        for name in missing:
+            database.execute_sql(f"ALTER TABLE {table} ADD COLUMN {name} {columns[name]};")
+            if name in indexes:
+                database.execute_sql(f"CREATE INDEX idx_{table}_{name} ON {table}({name});")
+
 
 class BaseModel(Model):
     class Meta:
@@ -194,11 +217,15 @@ class URL(BaseModel):
     metaheaders = TextField(default=None, null=True)
     reqbody = BlobField(default=None, null=True)
     resbody = BlobField(default=None, null=True)
+    resbodystate = CharField(default=None, null=True, index=True)
+    resbodyfile = TextField(default=None, null=True)
 
     @classmethod
     def create_table(cls, safe: bool = False, **options) -> None:
         database = load_database()
         if database.table_exists('url'):
+            # Tables of earlier versions lack the body capture columns
+            add_columns(database, 'url', {'resbodystate': "VARCHAR DEFAULT NULL", 'resbodyfile': "TEXT DEFAULT NULL"}, ['resbodystate'])
             return
 
         with database.atomic():
@@ -226,14 +253,16 @@ class URL(BaseModel):
                 resheaders TEXT DEFAULT NULL,
                 metaheaders TEXT DEFAULT NULL,
                 reqbody {"BLOB" if Config.SQLITE is not None else "BYTEA"} DEFAULT NULL,
-                resbody {"BLOB" if Config.SQLITE is not None else "BYTEA"} DEFAULT NULL);
+                resbody {"BLOB" if Config.SQLITE is not None else "BYTEA"} DEFAULT NULL,
+                resbodystate VARCHAR DEFAULT NULL,
+                resbodyfile TEXT DEFAULT NULL);
             """)
 
             database.execute_sql("CREATE INDEX idx_url_task ON url(task_id);")
             database.execute_sql("CREATE INDEX idx_url_site ON url(site_id);")
             database.execute_sql("CREATE INDEX idx_url_fromurl ON url(fromurl_id);")
             database.execute_sql("CREATE INDEX idx_url_redirect ON url(redirect_id);")
-            database.execute_sql("CREATE INDEX idx_url_redirect ON url(redirectfrom_id);")
+            database.execute_sql("CREATE INDEX idx_url_redirectfrom ON url(redirectfrom_id);")
             database.execute_sql("CREATE INDEX idx_url_depth ON url(depth);")
             database.execute_sql("CREATE INDEX idx_url_repetition ON url(repetition);")
             database.execute_sql("CREATE INDEX idx_url_state ON url(state);")
@@ -242,11 +271,129 @@ class URL(BaseModel):
             database.execute_sql("CREATE INDEX idx_url_codetext ON url(codetext);")
             database.execute_sql("CREATE INDEX idx_url_resource ON url(resource);")
             database.execute_sql("CREATE INDEX idx_url_content ON url(content);")
+            database.execute_sql("CREATE INDEX idx_url_resbodystate ON url(resbodystate);")
 
             if not Config.SQLITE:
                 database.execute_sql("ALTER TABLE task ADD CONSTRAINT task_landing_fk FOREIGN KEY (landing_id) REFERENCES url(id) ON DELETE SET NULL;")
 
+class Metric(BaseModel):
+    id = AutoField()
+    task = ForeignKeyField(Task, index=True, null=False)
+    url = ForeignKeyField(URL, index=True, null=True)
+    repetition = IntegerField(null=False)
+    phase = CharField(index=True, null=False)
+    wall = FloatField(null=False)
+    cpu = FloatField(null=False)
+
+    @classmethod
+    def create_table(cls, safe: bool = False, **options) -> None:
+        database = load_database()
+        if database.table_exists('metric'):
+            return
+
+        with database.atomic():
+            database.execute_sql(f"""
+                CREATE TABLE metric (
+                id {"INTEGER" if Config.SQLITE is not None else "SERIAL"} PRIMARY KEY {"AUTOINCREMENT" if Config.SQLITE is not None else ""},
+                task_id INTEGER NOT NULL REFERENCES task(id),
+                url_id INTEGER REFERENCES url(id) DEFAULT NULL,
+                repetition INTEGER NOT NULL,
+                phase VARCHAR NOT NULL,
+                wall REAL NOT NULL,
+                cpu REAL NOT NULL);
+            """)
+
+            database.execute_sql("CREATE INDEX idx_metric_task ON metric(task_id);")
+            database.execute_sql("CREATE INDEX idx_metric_url ON metric(url_id);")
+            database.execute_sql("CREATE INDEX idx_metric_phase ON metric(phase);")
+
+class JobCounter(BaseModel):
+    # Every crawler adds to its own shard of the counters, so crawlers never wait on each other's row locks
+    job = CharField(null=False)
+    crawler = IntegerField(null=False, default=0)
+    name = CharField(null=False)
+    value = IntegerField(null=False, default=0)
+    created = DateTimeField(default=datetime.now)
+    updated = DateTimeField(default=datetime.now)
+
+    class Meta:
+        primary_key = CompositeKey('job', 'crawler', 'name')
+
+    @classmethod
+    def create_table(cls, safe: bool = False, **options) -> None:
+        database = load_database()
+        if database.table_exists('jobcounter') and ('crawler' in {column.name for column in database.get_columns('jobcounter')}):
+            return
+
+        with database.atomic():
+            database.execute_sql("""
+                CREATE TABLE jobcounter_new (
+                job VARCHAR NOT NULL,
+                crawler INTEGER NOT NULL DEFAULT 0,
+                name VARCHAR NOT NULL,
+                value INTEGER NOT NULL DEFAULT 0,
+                created TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job, crawler, name));
+            """)
+
+            # Counters from before the shards become shard 0
+            if database.table_exists('jobcounter'):
+                database.execute_sql("INSERT INTO jobcounter_new (job, crawler, name, value, created, updated) SELECT job, 0, name, value, created, updated FROM jobcounter;")
+                database.execute_sql("DROP TABLE jobcounter;")
+
+            database.execute_sql("ALTER TABLE jobcounter_new RENAME TO jobcounter;")
+
+    @classmethod
+    def get_job(cls, job: str) -> Dict[str, Tuple[int, datetime]]:
+        """Sums the shards of the counters of a job.
+
+        Returns:
+            value and first creation by counter name
+        """
+
+        query = cls.select(cls.name, fn.SUM(cls.value).alias('total'), fn.MIN(cls.created).alias('first')).where(cls.job == job).group_by(cls.name)
+        return {counter.name: (counter.total, counter.first) for counter in query}
+
+    @classmethod
+    def get_shards(cls, job: str) -> Dict[Tuple[int, str], int]:
+        return {(counter.crawler, counter.name): counter.value for counter in cls.select().where(cls.job == job)}
+
+    @staticmethod
+    def add(database: SqliteDatabase | PostgresqlDatabase, job: str, counts: Dict[str, int], crawler: int = 0) -> Dict[str, int]:
+        """Adds to the counters of a job in a single statement (inside the transaction of the caller, if any).
+
+        Args:
+            database: the database
+            job (str): job id
+            counts (Dict[str, int]): increments by counter name
+            crawler (int): shard to add to, the crawler id (0 for tools outside the crawl)
+
+        Returns:
+            the new values of the shard's counters that were added to
+        """
+
+        counts = {name: value for name, value in counts.items() if value}
+        if not counts:
+            return {}
+
+        # Same order every time, so concurrent transactions on shard 0 lock the rows in the same order
+        now: datetime = datetime.today()
+        return dict(database.execute_sql(
+            f"""
+            INSERT INTO jobcounter (job, crawler, name, value, created, updated)
+            VALUES {','.join([f"({database.param},{database.param},{database.param},{database.param},{database.param},{database.param})"] * len(counts))}
+            ON CONFLICT (job, crawler, name) DO UPDATE SET value=jobcounter.value+excluded.value, updated=excluded.updated
+            RETURNING name, value
+            """,
+            tuple(parameter for name in sorted(counts) for parameter in (job, crawler, name, counts[name], now, now))
+        ).fetchall())
+
 class URLDB:
+    # Limits of the state learn keeps per site
+    LEARN_PAGES: int = 1000
+    LEARN_PARAMETERS: int = 20
+
     def __init__(self, crawler) -> None:
         from crawler import Crawler
         self.crawler: Crawler = crawler
@@ -254,7 +401,33 @@ class URLDB:
         self._seen: set[str] = self.crawler.state.get('URLDB', set())
         self.crawler.state['URLDB'] = self._seen
 
-    def get_url(self, repetition: int) -> Optional[URL]:
+        # Query parameters of the site learned from the pages visited so far (see learn)
+        self._parameters: Dict[str, Any] = self.crawler.state.get('URLParameters', {'pages': {}, 'variants': {}, 'votes': {}, 'relevant': set(), 'ignored': set()})
+        self.crawler.state['URLParameters'] = self._parameters
+
+        # Job counters since the last checkpoint (see JobCounter)
+        self.counts: Dict[str, int] = {}
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def count_visit(self, repetition: int, code: int) -> None:
+        self.count('visits')
+        self.count(f"code_{code}")
+        if repetition == 1:
+            self.count('urls_complete')
+
+    def flush_counts(self) -> None:
+        # Called with the checkpoint, so the counters roll back with the crawler state
+        totals: Dict[str, int] = JobCounter.add(self.crawler.database, self.crawler.task.job, self.counts, self.crawler.task.crawler)
+        self.counts = {}
+
+        # The live metrics take the queue depth from the totals
+        if self.crawler.report is not None:
+            for name, value in totals.items():
+                self.crawler.report(f"jobcounter:{name}", value)
+
+    def get_url(self, repetition: int, fallback: bool = True) -> Optional[URL]:
         url: Optional[URL] = None
 
         query = [
@@ -270,7 +443,8 @@ class URLDB:
 
             url = URL.get_or_none(*query)
 
-            if (not url) and Config.BREADTHFIRST:
+            # Only move on to other depths if allowed
+            if (not url) and Config.BREADTHFIRST and fallback:
                 url = URL.get_or_none(*(query[:-1]))
         else:
             query.append(URL.state == "waiting")
@@ -284,11 +458,110 @@ class URLDB:
 
         return url
 
+    def _normalize(self, url: str) -> str:
+        if not Config.URL_CANONICALIZE:
+            return utils.normalize_url(url)
+        return utils.canonicalize_url(url, self._parameters['ignored'])
+
     def get_seen(self, url: str) -> bool:
-        return utils.normalize_url(url) in self._seen
+        return self._normalize(url) in self._seen
 
     def add_seen(self, url: str) -> None:
-        self._seen.add(utils.normalize_url(url))
+        self._seen.add(self._normalize(url))
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        # 64 bits are plenty to tell a site's pages apart and keep the crawler state small
+        return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], 'big')
+
+    def learn(self, url: str, links: Iterable[str]) -> None:
+        """Learns which query parameters do not change the content of the site's pages.
+
+        The links of a page are its signature. If pages whose URLs only differ in one parameter (its value, or
+        whether it is present) have the same signature URL_LEARN_PARAMETERS times and never a different one, the
+        parameter is ignored when comparing URLs of the site from then on.
+
+        Only hashes of the URLs and signatures are kept, for at most LEARN_PAGES pages and LEARN_PARAMETERS undecided
+        parameters per site, as the state is saved with every checkpoint.
+
+        Args:
+            url (str): URL of the visited page
+            links (Iterable[str]): URLs the page links to
+        """
+
+        if (not Config.URL_LEARN_PARAMETERS) or (not Config.URL_CANONICALIZE):
+            return
+
+        pages: Dict[int, int] = self._parameters['pages']
+        variants: Dict[int, Dict[str, Tuple[int, int]]] = self._parameters['variants']
+        votes: Dict[str, int] = self._parameters['votes']
+        relevant: Set[str] = self._parameters['relevant']
+        ignored: Set[str] = self._parameters['ignored']
+
+        # Links are compared as seen, so session ids or tracking parameters in them do not count
+        signature: int = URLDB._hash('\n'.join(sorted({self._normalize(link) for link in links})))
+        canonical_url: str = utils.canonicalize_url(url, ignored)
+        canonical: int = URLDB._hash(canonical_url)
+        parameters: List[Tuple[str, str]] = utils.get_query_parameters(canonical_url)
+        parsed = urllib.parse.urlsplit(canonical_url)
+
+        bases: List[int] = []
+        for i in range(len(parameters)):
+            query: str = '&'.join(parameter for j, (_, parameter) in enumerate(parameters) if j != i)
+            bases.append(URLDB._hash(urllib.parse.urlunsplit((parsed.scheme, parsed.netloc, parsed.path, query, ''))))
+
+        # Pages without one of the parameters, with another value of it, or with one more parameter
+        others: List[Tuple[str, int]] = []
+        for (name, _), base in zip(parameters, bases):
+            if base in pages:
+                others.append((name, pages[base]))
+            if (name in variants.get(base, {})) and (variants[base][name][0] != canonical):
+                others.append((name, variants[base][name][1]))
+        others += [(name, other[1]) for name, other in variants.get(canonical, {}).items()]
+
+        for name, other in others:
+            if (name in relevant) or (name in ignored):
+                continue
+            if (name not in votes) and (len(votes) >= URLDB.LEARN_PARAMETERS):
+                continue
+
+            if other != signature:
+                relevant.add(name)
+                self._forget(name)
+                continue
+
+            votes[name] = votes.get(name, 0) + 1
+            if votes[name] >= Config.URL_LEARN_PARAMETERS:
+                ignored.add(name)
+                self._forget(name)
+                self.crawler.log.info(f"Ignore query parameter {name}")
+
+                # Compare the URLs seen so far without the parameter as well
+                seen: Set[str] = {self._normalize(seen) for seen in self._seen}
+                self._seen.clear()
+                self._seen.update(seen)
+
+        # Bounded, as a site can have any number of pages and parameters
+        if len(pages) < URLDB.LEARN_PAGES:
+            pages[canonical] = signature
+            for (name, _), base in zip(parameters, bases):
+                if (name in relevant) or (name in ignored):
+                    continue
+                if (name not in votes) and (len(votes) >= URLDB.LEARN_PARAMETERS):
+                    continue
+
+                votes.setdefault(name, 0)
+                variants.setdefault(base, {})[name] = (canonical, signature)
+
+    def _forget(self, name: str) -> None:
+        # The observations of a decided parameter are no longer needed
+        variants: Dict[int, Dict[str, Tuple[int, int]]] = self._parameters['variants']
+
+        self._parameters['votes'].pop(name, None)
+        for base in list(variants):
+            variants[base].pop(name, None)
+            if not variants[base]:
+                del variants[base]
 
     def add_url(self, url: str, depth: int, fromurl: Optional[URL], force: bool = False) -> None:
         if (not force) and self.get_seen(url):
@@ -315,6 +588,7 @@ class URLDB:
         }
 
         URL.create(**url_data, repetition=1)
+        self.count('urls_added')
 
         for repetition in range(2, Config.REPETITIONS + 1):
             URL.create(**url_data, repetition=repetition, state="waiting")
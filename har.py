@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import pathlib
+import traceback
+import urllib.parse
+from asyncio import CancelledError
+from datetime import datetime, timezone
+from logging import Logger
+from typing import IO, Any, Dict, List, Optional
+
+from playwright.sync_api import BrowserContext, Request, Response
+
+
+class HarWriter:
+    """
+    Streams the requests of a browser context into compressed HAR files.
+
+    Every entry is written as soon as its request finishes, and response bodies are stored once in a
+    content-addressed attachment directory and referenced through the ``_file`` field (like the ``attach``
+    content mode of playwright), so memory does not grow with the number of requests. Call ``rotate`` to
+    start a new HAR file, e.g., for every URL and repetition.
+    """
+
+    def __init__(self, directory: pathlib.Path, log: Logger) -> None:
+        self.directory: pathlib.Path = directory
+        self.attachments: pathlib.Path = directory / 'attachments'
+        self.attachments.mkdir(parents=True, exist_ok=True)
+        self.log: Logger = log
+
+        self._file: Optional[IO[str]] = None
+        self._entries: int = 0
+        self._pages: List[Dict[str, Any]] = []
+
+    def attach(self, context: BrowserContext) -> None:
+        context.on('requestfinished', lambda request: self._on_request(request, False))
+        context.on('requestfailed', lambda request: self._on_request(request, True))
+
+    def rotate(self, path: pathlib.Path, page_url: Optional[str] = None) -> None:
+        self.close()
+
+        self._file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+        self._file.write('{"log": {"version": "1.2", "creator": {"name": "PyCrawler", "version": "1.0"}, "entries": [\n')
+        self._entries = 0
+        self._pages = [{
+            'startedDateTime': datetime.now(timezone.utc).isoformat(),
+            'id': 'page_1',
+            'title': page_url or '',
+            'pageTimings': {}
+        }]
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+
+        # Pages are known once the visit is over; key order does not matter in JSON
+        self._file.write('\n], "pages": ' + json.dumps(self._pages) + '}}\n')
+        self._file.close()
+        self._file = None
+
+    def _write_body(self, body: bytes, mime_type: str) -> str:
+        name: str = hashlib.sha1(body).hexdigest() + (mimetypes.guess_extension(mime_type) or '')
+        path: pathlib.Path = self.attachments / name
+
+        if not path.exists():
+            temporary: pathlib.Path = path.with_suffix(path.suffix + '.tmp')
+            temporary.write_bytes(body)
+            temporary.replace(path)
+
+        return f"{self.attachments.name}/{name}"
+
+    @staticmethod
+    def _timings(timing: Dict[str, float]) -> Dict[str, float]:
+        def span(start: str, end: str) -> float:
+            return round(timing[end] - timing[start], 3) if (timing.get(start, -1) >= 0) and (timing.get(end, -1) >= 0) else -1
+
+        return {
+            'blocked': -1,
+            'dns': span('domainLookupStart', 'domainLookupEnd'),
+            'connect': span('connectStart', 'connectEnd'),
+            'ssl': span('secureConnectionStart', 'connectEnd'),
+            'send': 0,
+            'wait': span('requestStart', 'responseStart'),
+            'receive': span('responseStart', 'responseEnd'),
+        }
+
+    def _entry(self, request: Request, failed: bool) -> Dict[str, Any]:
+        response: Optional[Response] = request.response() if not failed else None
+        timing: Dict[str, float] = request.timing
+        timings: Dict[str, float] = HarWriter._timings(timing)
+
+        content: Dict[str, Any] = {'size': -1, 'mimeType': 'x-unknown'}
+        if response is not None:
+            content['mimeType'] = response.header_value('Content-Type') or 'x-unknown'
+
+            try:
+                body: bytes = response.body()
+                content['size'] = len(body)
+                content['_file'] = self._write_body(body, content['mimeType'].split(';', 1)[0].strip())
+            except (Exception, CancelledError):
+                # Redirects and evicted resources have no body
+                pass
+
+        post_data: Optional[str] = request.post_data
+
+        entry: Dict[str, Any] = {
+            'pageref': 'page_1',
+            'startedDateTime': datetime.fromtimestamp(timing['startTime'] / 1000, timezone.utc).isoformat() if timing.get('startTime', -1) > 0 else datetime.now(timezone.utc).isoformat(),
+            'time': sum(value for value in timings.values() if value > 0),
+            'request': {
+                'method': request.method,
+                'url': request.url,
+                'httpVersion': 'HTTP/1.1',
+                'cookies': [],
+                'headers': request.headers_array(),
+                'queryString': [{'name': name, 'value': value} for name, value in urllib.parse.parse_qsl(urllib.parse.urlsplit(request.url).query, keep_blank_values=True)],
+                'headersSize': -1,
+                'bodySize': len(post_data) if post_data is not None else 0,
+            },
+            'response': {
+                'status': response.status if response is not None else 0,
+                'statusText': response.status_text if response is not None else '',
+                'httpVersion': 'HTTP/1.1',
+                'cookies': [],
+                'headers': response.headers_array() if response is not None else [],
+                'content': content,
+                'redirectURL': (response.header_value('Location') or '') if response is not None else '',
+                'headersSize': -1,
+                'bodySize': content['size'],
+            },
+            'cache': {},
+            'timings': timings,
+            '_resourceType': request.resource_type,
+        }
+
+        if post_data is not None:
+            entry['request']['postData'] = {'mimeType': request.header_value('Content-Type') or '', 'text': post_data}
+
+        if failed:
+            entry['response']['_failureText'] = request.failure
+
+        return entry
+
+    def _on_request(self, request: Request, failed: bool) -> None:
+        if self._file is None:
+            return
+
+        try:
+            entry: str = json.dumps(self._entry(request, failed))
+        except (Exception, CancelledError) as error:
+            self.log.warning('har.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return
+
+        # The file might have been rotated while the entry was collected
+        if self._file is None:
+            return
+
+        self._file.write((',\n' if self._entries > 0 else '') + entry)
+        self._entries += 1
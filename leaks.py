@@ -0,0 +1,311 @@
+import argparse
+import base64
+import codecs
+import html
+import json
+import multiprocessing
+import pathlib
+import re
+import sys
+import time
+import urllib.parse
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, cast
+
+from peewee import CharField, ForeignKeyField, IntegerField
+
+import utils
+from config import Config
+from database import BaseModel, Task, load_database
+
+# Request columns with data the browser sends
+FIELDS: List[str] = ['url', 'referer', 'reqheaders', 'reqbody']
+
+# Shorter variants match by chance
+MIN_LENGTH: int = 8
+
+# Identifier label and encoding of a pattern
+Variant = Tuple[str, str]
+
+
+class Leak(BaseModel):
+    request = IntegerField(column_name='request_id', index=True)
+    task = ForeignKeyField(Task, index=True)
+    identifier = CharField(index=True)
+    encoding = CharField(index=True)
+    field = CharField()
+    position = IntegerField()
+
+    @classmethod
+    def create_table(cls, safe: bool = False, **options) -> None:
+        database = load_database()
+        if database.table_exists('leak'):
+            # Tables of earlier versions allowed the same leak twice
+            if not any(index.name == 'idx_leak_unique' for index in database.get_indexes('leak')):
+                with database.atomic():
+                    database.execute_sql("DELETE FROM leak WHERE id NOT IN (SELECT MIN(id) FROM leak GROUP BY request_id, identifier, encoding, field);")
+                    database.execute_sql("CREATE UNIQUE INDEX idx_leak_unique ON leak(request_id, identifier, encoding, field);")
+            return
+
+        with database.atomic():
+            database.execute_sql(f"""
+                CREATE TABLE leak (
+                id {"INTEGER" if Config.SQLITE is not None else "SERIAL"} PRIMARY KEY {"AUTOINCREMENT" if Config.SQLITE is not None else ""},
+                request_id INTEGER NOT NULL,
+                task_id INTEGER NOT NULL REFERENCES task(id),
+                identifier VARCHAR NOT NULL,
+                encoding VARCHAR NOT NULL,
+                field VARCHAR NOT NULL,
+                position INTEGER NOT NULL);
+            """)
+
+            database.execute_sql("CREATE INDEX idx_leak_request ON leak(request_id);")
+            database.execute_sql("CREATE INDEX idx_leak_task ON leak(task_id);")
+            database.execute_sql("CREATE INDEX idx_leak_identifier ON leak(identifier);")
+            database.execute_sql("CREATE INDEX idx_leak_encoding ON leak(encoding);")
+
+            # Batches scanned again after an interruption add nothing
+            database.execute_sql("CREATE UNIQUE INDEX idx_leak_unique ON leak(request_id, identifier, encoding, field);")
+
+
+def _get_base64(data: bytes) -> Dict[str, str]:
+    # The identifier can start at any byte of a longer base64 string; for each of the three alignments, keep
+    # only the characters that depend on the identifier alone
+    result: Dict[str, str] = {}
+    for offset in range(3):
+        encoded: str = base64.b64encode(b'\x00' * offset + data).decode()
+        encoded = encoded[-(-offset * 8 // 6):(offset + len(data)) * 8 // 6]
+        result[f"base64{offset or ''}"] = encoded
+        result[f"base64url{offset or ''}"] = encoded.translate(str.maketrans('+/', '-_'))
+    return result
+
+def get_variants(value: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Encodes and hashes an identifier the ways utils.decode and utils.hashes undo them.
+
+    Args:
+        value (str): identifier, e.g., an email address or cookie value
+
+    Returns:
+        case-insensitive and case-sensitive variants by encoding
+    """
+
+    insensitive: Dict[str, str] = {
+        'text': value,
+        'url': urllib.parse.quote(value, safe=''),
+        'url_plus': urllib.parse.quote_plus(value),
+        'html': html.escape(value),
+        'json': json.dumps(value)[1:-1],
+        'rot13': codecs.encode(value, 'rot_13'),
+        'hex': value.encode().hex(),
+        'punycode': value.encode('punycode').decode() if not value.isascii() else value,
+    }
+
+    sensitive: Dict[str, str] = {}
+    for name, encoded in _get_base64(value.encode()).items():
+        sensitive[name] = encoded
+        sensitive[f"{name}_url"] = urllib.parse.quote(encoded, safe='')
+
+    # Hashes of the identifier and of its normalized form (e.g., hashed emails)
+    for prefix, data in (('', value), ('normalized_', value.strip().lower())):
+        for algorithm, digest in utils.hashes(data.encode()).items():
+            insensitive[f"{prefix}{algorithm}"] = digest.hex()
+            sensitive[f"{prefix}{algorithm}_base64"] = base64.b64encode(digest).decode().rstrip('=')
+
+    return {name: encoded.lower() for name, encoded in insensitive.items()}, sensitive
+
+
+class Matcher:
+    """
+    Finds all variants of the identifiers in a single pass over a text with an Aho-Corasick automaton
+    (pyahocorasick), or with one regular expression of all variants if it is not installed.
+    """
+
+    def __init__(self, patterns: Dict[str, List[Variant]]) -> None:
+        self.patterns: Dict[str, List[Variant]] = patterns
+
+        self._automaton: Any = None
+        self._regex: Optional[re.Pattern] = None
+
+        if not patterns:
+            return
+
+        try:
+            import ahocorasick
+            self._automaton = ahocorasick.Automaton()
+            for pattern, variants in patterns.items():
+                self._automaton.add_word(pattern, (len(pattern), variants))
+            self._automaton.make_automaton()
+        except ImportError:
+            self._regex = re.compile('|'.join(re.escape(pattern) for pattern in sorted(patterns, key=len, reverse=True)))
+
+    def find(self, text: str) -> Iterator[Tuple[int, Variant]]:
+        """Yields the position and variant of every match."""
+
+        if self._automaton is not None:
+            for end, (length, variants) in self._automaton.iter(text):
+                for variant in variants:
+                    yield end - length + 1, variant
+        elif self._regex is not None:
+            for match in self._regex.finditer(text):
+                for variant in self.patterns[match.group()]:
+                    yield match.start(), variant
+
+
+def get_matchers(identifiers: Dict[str, str], min_length: int = MIN_LENGTH) -> Tuple[Matcher, Matcher]:
+    """Builds the case-insensitive and case-sensitive matchers for identifiers by label."""
+
+    insensitive: Dict[str, List[Variant]] = {}
+    sensitive: Dict[str, List[Variant]] = {}
+    for label, value in identifiers.items():
+        _insensitive, _sensitive = get_variants(value)
+        for patterns, variants in ((insensitive, _insensitive), (sensitive, _sensitive)):
+            for encoding, pattern in variants.items():
+                # Encodings that leave the identifier unchanged count as the first one
+                if (len(pattern) >= min_length) and all(_label != label for _label, _ in patterns.get(pattern, [])):
+                    patterns.setdefault(pattern, []).append((label, encoding))
+
+    return Matcher(insensitive), Matcher(sensitive)
+
+def load_identifiers(path: pathlib.Path) -> Dict[str, str]:
+    # One identifier per line, optionally with a label: "<label>\t<value>"
+    identifiers: Dict[str, str] = {}
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.rstrip('\r\n')
+            if line.strip():
+                label, _, value = line.partition('\t') if '\t' in line else (line, '', line)
+                identifiers[label] = value
+    return identifiers
+
+
+# State of the worker processes
+_worker: Dict[str, Any] = {}
+
+def _init_worker(identifiers: Dict[str, str], fields: List[str], job: Optional[str], min_length: int) -> None:
+    _worker['matchers'] = get_matchers(identifiers, min_length)
+    _worker['fields'] = fields
+    _worker['job'] = job
+    _worker['database'] = load_database()
+
+def _to_text(value: Any) -> str:
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode('utf-8', errors='replace')
+    return value
+
+def scan_batch(batch: Tuple[int, int]) -> Tuple[int, int]:
+    """Scans the requests with ids in [first, last] and writes their leaks.
+
+    Returns:
+        number of requests and leaks
+    """
+
+    database = _worker['database']
+    insensitive, sensitive = cast(Tuple[Matcher, Matcher], _worker['matchers'])
+    fields: List[str] = _worker['fields']
+
+    query: str = f"SELECT id, task_id, {', '.join(fields)} FROM request WHERE id BETWEEN {database.param} AND {database.param}"
+    params: List[Any] = list(batch)
+    if _worker['job'] is not None:
+        query += f" AND task_id IN (SELECT id FROM task WHERE job={database.param})"
+        params.append(_worker['job'])
+
+    rows: List[Tuple] = database.execute_sql(query, params).fetchall()
+
+    leaks: List[Tuple] = []
+    for row in rows:
+        found: Set[Tuple[str, str, str]] = set()
+        for field, value in zip(fields, row[2:]):
+            if not value:
+                continue
+
+            text: str = _to_text(value)
+            for matcher, haystack in ((insensitive, text.lower()), (sensitive, text)):
+                for position, (label, encoding) in matcher.find(haystack):
+                    if (label, encoding, field) not in found:
+                        found.add((label, encoding, field))
+                        leaks.append((row[0], row[1], label, encoding, field, position))
+
+    # Stay below the parameter limit of PostgreSQL
+    for i in range(0, len(leaks), 1000):
+        chunk: List[Tuple] = leaks[i:i + 1000]
+        with database.atomic():
+            database.execute_sql(
+                f"INSERT INTO leak (request_id, task_id, identifier, encoding, field, position) VALUES {','.join(['(' + ','.join([database.param] * 6) + ')'] * len(chunk))} ON CONFLICT (request_id, identifier, encoding, field) DO NOTHING",
+                [value for leak in chunk for value in leak]
+            )
+
+    return len(rows), len(leaks)
+
+def scan(identifiers: Dict[str, str], job: Optional[str], processes: int, batch_size: int, fields: List[str], first: Optional[int] = None, min_length: int = MIN_LENGTH) -> Tuple[int, int]:
+    """Scans the request table for leaks of the identifiers with a pool of processes.
+
+    Batches are ranges of request ids, so every worker reads its rows by primary key and the table is never
+    read as a whole or passed through this process.
+
+    Args:
+        identifiers (Dict[str, str]): identifiers by label
+        job (str): only scan requests of this job
+        processes (int): number of worker processes
+        batch_size (int): request ids per batch
+        fields (List[str]): request columns to scan
+        first (int): first request id (to continue an interrupted scan)
+        min_length (int): minimum length of the variants
+
+    Returns:
+        number of requests and leaks
+    """
+
+    database = load_database()
+    Leak.create_table()
+    low, high = database.execute_sql("SELECT MIN(id), MAX(id) FROM request").fetchone()
+    database.close()
+
+    if low is None:
+        return 0, 0
+
+    low = max(low, first or low)
+    batches: List[Tuple[int, int]] = [(start, min(start + batch_size - 1, high)) for start in range(low, high + 1, batch_size)]
+
+    requests: int = 0
+    leaks: int = 0
+    start: float = time.perf_counter()
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(identifiers, fields, job, min_length)) as pool:
+        for i, (_requests, _leaks) in enumerate(pool.imap(scan_batch, batches)):
+            requests += _requests
+            leaks += _leaks
+
+            # Batches finish in order, so the next id is where to continue after an interruption
+            if (i % 100 == 99) or (i == len(batches) - 1):
+                print(f"{requests} requests, {leaks} leaks, {requests / (time.perf_counter() - start):.0f} requests/s, next id {batches[i][1] + 1}")
+
+    return requests, leaks
+
+def main(path: pathlib.Path, job: Optional[str], processes: int, batch_size: int, fields: List[str], first: Optional[int]) -> int:
+    identifiers: Dict[str, str] = load_identifiers(path)
+    if not identifiers:
+        print(f"No identifiers in {path}")
+        return 1
+
+    requests, leaks = scan(identifiers, job, processes, batch_size, fields, first)
+    print(f"Scanned {requests} requests, found {leaks} leaks (table leak)")
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-i", "--identifiers", type=pathlib.Path, required=True, help="file with one identifier per line, optionally '<label>\\t<value>'")
+    args_parser.add_argument("-j", "--job", type=str, default=None, help="only scan requests of this job")
+    args_parser.add_argument("-p", "--processes", type=int, default=multiprocessing.cpu_count(), help="number of worker processes")
+    args_parser.add_argument("-b", "--batch", type=int, default=10000, help="request ids per batch")
+    args_parser.add_argument("-f", "--fields", type=str, nargs='*', choices=FIELDS + ['location', 'resheaders'], default=FIELDS, help="request columns to scan")
+    args_parser.add_argument("--first", type=int, default=None, help="first request id (to continue an interrupted scan)")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(
+        cast(pathlib.Path, args.get('identifiers')),
+        args.get('job'),
+        cast(int, args.get('processes')),
+        cast(int, args.get('batch')),
+        cast(List[str], args.get('fields')),
+        args.get('first')
+    ))
@@ -0,0 +1,241 @@
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import pathlib
+import queue
+import shutil
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+# Structured fields every record carries (None if unknown)
+FIELDS: Tuple[str, ...] = ('job', 'crawler', 'task', 'url_id', 'phase', 'duration')
+
+# Listener of each logger that writes its own file
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+
+# Threads writing the records of child processes by their queue
+_children: Dict[int, '_ChildListener'] = {}
+
+
+class _Context(logging.Filter):
+    # Adds the structured fields to every record of the logger
+    def __init__(self, fields: Dict[str, Any]) -> None:
+        super().__init__()
+        self.fields: Dict[str, Any] = dict.fromkeys(FIELDS) | fields
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in self.fields.items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+class _RateLimit(logging.Filter):
+    # Lets through LOG_RATE_LIMIT warnings with the same message and first argument (e.g., the line of the
+    # traceback) per minute and counts the others, which are reported with the next one let through
+    PERIOD: float = 60
+
+    def __init__(self, limit: int) -> None:
+        super().__init__()
+        self.limit: int = limit
+        self._counts: Dict[Tuple[Any, Any], List] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (self.limit <= 0) or (record.levelno < logging.WARNING):
+            return True
+
+        key: Tuple[Any, Any] = (record.msg, record.args[0] if isinstance(record.args, tuple) and record.args else None)
+        entry: Optional[List] = self._counts.get(key, None)
+
+        if (entry is None) or (record.created - entry[0] >= _RateLimit.PERIOD):
+            if len(self._counts) > 1000:
+                self._counts = {key: value for key, value in self._counts.items() if record.created - value[0] < _RateLimit.PERIOD}
+
+            self._counts[key] = [record.created, 1, 0]
+            if (entry is not None) and entry[2]:
+                record.msg = f"{record.msg} [{entry[2]} similar messages suppressed]"
+            return True
+
+        entry[1] += 1
+        if entry[1] <= self.limit:
+            return True
+
+        entry[2] += 1
+        return False
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON lines with ECS field names and the structured fields of the crawler."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        document: Dict[str, Any] = {
+            '@timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'log.level': record.levelname.lower(),
+            'log.logger': record.name,
+            'message': record.getMessage(),
+            'process.pid': record.process,
+        }
+
+        for name in FIELDS:
+            value: Any = getattr(record, name, None)
+            if value is not None:
+                document[name] = value
+
+        if record.exc_info:
+            document['error.stack_trace'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            document['error.stack_trace'] = record.exc_text
+
+        return json.dumps(document, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # Unlike QueueHandler, keeps the stack trace out of the message, so the formatter of the listener can put it in
+    # its own field; the traceback itself is formatted here, as it cannot be pickled for other processes
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+
+        return record
+
+
+class _ChildListener(threading.Thread):
+    # Writes the records of one child process; unlike QueueListener, it never puts anything on the queue and
+    # gives up on a queue left broken by a killed process instead of blocking
+    TIMEOUT: float = 0.5
+
+    def __init__(self, log_queue: Any, handlers: Tuple[logging.Handler, ...]) -> None:
+        super().__init__(daemon=True)
+        self.queue: Any = log_queue
+        self.handlers: Tuple[logging.Handler, ...] = handlers
+        self.stopping: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while True:
+            try:
+                record: logging.LogRecord = self.queue.get(timeout=_ChildListener.TIMEOUT)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            except Exception:
+                return
+
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+def _get_formatter() -> logging.Formatter:
+    if Config.LOG_FORMAT == 'ecs':
+        try:
+            import ecs_logging
+            return ecs_logging.StdlibFormatter(extra={})
+        except ImportError:
+            pass
+
+    if Config.LOG_FORMAT in ('json', 'ecs'):
+        return JsonFormatter()
+
+    return logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+
+def _rotate(source: str, destination: str) -> None:
+    with open(source, 'rb') as _source, gzip.open(destination, 'wb') as _destination:
+        shutil.copyfileobj(_source, _destination)
+    os.remove(source)
+
+def _get_handler(path: pathlib.Path) -> logging.Handler:
+    handler: logging.FileHandler
+    if Config.LOG_ROTATE_BYTES:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=Config.LOG_ROTATE_BYTES, backupCount=Config.LOG_BACKUPS)
+    elif Config.LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=Config.LOG_ROTATE_WHEN, backupCount=Config.LOG_BACKUPS)
+    else:
+        return logging.FileHandler(path)
+
+    # Compress rotated files
+    handler.namer = lambda name: name + '.gz'
+    handler.rotator = _rotate
+    return handler
+
+def get_logger(path: pathlib.Path, name: str, log_queue: Optional[Any] = None, **fields) -> logging.Logger:
+    """Creates a logger that hands its records to a listener thread, which formats and writes them.
+
+    Args:
+        path (pathlib.Path): log file
+        name (str): name of the logger
+        log_queue: queue of a logger in another process (see get_queue) to write to its file instead
+        fields: structured fields of all records (job, crawler, task, ...)
+
+    Returns:
+        the logger
+    """
+
+    log = logging.Logger(name)
+    log.setLevel(Config.LOG_LEVEL)
+    log.addFilter(_Context(fields))
+    log.addFilter(_RateLimit(Config.LOG_RATE_LIMIT))
+
+    if log_queue is None:
+        log_queue = queue.SimpleQueue()
+
+        handler: logging.Handler = _get_handler(path)
+        handler.setFormatter(_get_formatter())
+
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        _listeners[name] = listener
+
+    log.addHandler(_QueueHandler(log_queue))
+    return log
+
+def get_queue(log: logging.Logger) -> Any:
+    """Creates a queue for one child process, which passes it to get_logger to write to the file of the logger.
+
+    A process killed while writing to a queue can leave the queue locked, so every child process gets its own
+    queue, and release_queue discards it once the process ended.
+    """
+
+    log_queue: Any = multiprocessing.Queue()
+    child: _ChildListener = _ChildListener(log_queue, _listeners[log.name].handlers)
+    child.start()
+    _children[id(log_queue)] = child
+    return log_queue
+
+def release_queue(log_queue: Any) -> None:
+    """Writes the remaining records of an ended child process and discards its queue."""
+
+    child: Optional[_ChildListener] = _children.pop(id(log_queue), None)
+    if child is not None:
+        # Stops once the queue is empty; a queue broken by a killed process is left to the daemon thread
+        child.stopping.set()
+        child.join(timeout=10)
+
+    log_queue.close()
+    log_queue.cancel_join_thread()
+
+def set_context(log: logging.Logger, **fields) -> None:
+    """Updates the structured fields of all further records of a logger."""
+
+    for _filter in log.filters:
+        if isinstance(_filter, _Context):
+            _filter.fields.update(fields)
+
+def close_logger(log: logging.Logger) -> None:
+    """Writes the remaining records and closes the log file."""
+
+    listener: Optional[logging.handlers.QueueListener] = _listeners.pop(log.name, None)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
@@ -1,20 +1,23 @@
 import argparse
 import importlib
 import logging
+import multiprocessing
 import pathlib
+import signal
 import sys
 import time
 import traceback
 from datetime import datetime
 from multiprocessing import Pipe, Process
-from typing import List, Optional, Type, cast
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional, Tuple, Type, cast
 
 from crawler import Crawler
-from database import Task, load_database
+from database import URL, JobCounter, Metric, Task, load_database
+from logger import close_logger, get_logger, get_queue, release_queue, set_context
+from metrics import LiveMetrics, get_rss
 from modules.Module import Module
 
-#import ecs_logging  # TODO elastic search logs
-
 
 Config = importlib.import_module('config').Config
 
@@ -25,23 +28,47 @@ class CustomProcess(Process):
 
         self._pconn, self._cconn = Pipe()
         self._exception = None
+        self._reports: List[Tuple[str, float, float]] = []
 
     def run(self):
         try:
             Process.run(self)
-            self._cconn.send(None)
+            self._cconn.send(('exit', None))
         except Exception as error:
             tb = traceback.format_exc()
-            self._cconn.send((type(error), error, tb))
+            self._cconn.send(('exit', (type(error), error, tb)))
         finally:
             self._cconn.close()
 
+    def report(self, name: str, value: float = 1, timestamp: Optional[float] = None) -> None:
+        # Called in the child process
+        try:
+            self._cconn.send(('report', name, value, timestamp or time.time()))
+        except (OSError, ValueError):
+            pass
+
+    def _receive(self) -> None:
+        try:
+            while (not self._pconn.closed) and self._pconn.poll():
+                message = self._pconn.recv()
+                if message[0] == 'report':
+                    self._reports.append(message[1:])
+                else:
+                    self._exception = message[1]
+                    self._pconn.close()
+        except (EOFError, OSError):
+            pass
+
     @property
-    def exception(self):
-        if (self._exception is None) and self._pconn.poll():
-            self._exception = self._pconn.recv()
-            self._pconn.close()
+    def reports(self) -> List[Tuple[str, float, float]]:
+        # Reports of the child process since the last call
+        self._receive()
+        reports, self._reports = self._reports, []
+        return reports
 
+    @property
+    def exception(self):
+        self._receive()
         return self._exception
 
 
@@ -52,15 +79,8 @@ def _validate_arguments(crawlers_count: int, starting_crawler_id: int, log_path:
     if log_path.exists() and not log_path.is_dir():
         raise ValueError('Path to directory for log output is incorrect')
 
-def _get_logger(log_path: pathlib.Path, name: str) -> logging.Logger:
-    handler: logging.FileHandler = logging.FileHandler(log_path)
-    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
-
-    log = logging.Logger(name)
-    log.setLevel(Config.LOG_LEVEL)
-    log.addHandler(handler)
-
-    return log
+def _is_live() -> bool:
+    return bool(Config.METRICS_ADDRESS or Config.METRICS_FILE)
 
 def _get_modules(module_names: List[str]) -> List[Type[Module]]:
     modules: List[Type[Module]] = []
@@ -69,6 +89,11 @@ def _get_modules(module_names: List[str]) -> List[Type[Module]]:
         modules.append(getattr(module, module_name))
     return modules
 
+def _report_counters(totals: Dict[str, int]) -> None:
+    # The live metrics take the queue depth from the totals
+    for name, value in totals.items():
+        cast(CustomProcess, multiprocessing.current_process()).report(f"jobcounter:{name}", value)
+
 def _get_task(job: str, crawler_id: int, database, log) -> Optional[Task]:
     # Get progress task
     task: Optional[Task] = Task.get_or_none(job=job, crawler=crawler_id, state='progress')
@@ -89,19 +114,40 @@ def _get_task(job: str, crawler_id: int, database, log) -> Optional[Task]:
         else:
             log.info("Loading free task")
             database.execute_sql(f"UPDATE task SET updated={database.param}, crawler={database.param}, state='progress' WHERE id={database.param}", (datetime.today(), crawler_id, result[0]))
+            _report_counters(JobCounter.add(database, job, {'tasks_claimed': 1}, crawler_id))
             task = Task.get_by_id(result[0])
 
     return task
 
-def _start_crawler(job: str, crawler_id: int, task: int, log_path: pathlib.Path, modules: List[Type[Module]]) -> None:
-    log = _get_logger(log_path / f"job{job}crawler{crawler_id}.log", job + str(crawler_id) + __name__)
+def _start_crawler(job: str, crawler_id: int, task: int, log_path: pathlib.Path, modules: List[Type[Module]], started: float, log_queue) -> None:
+    # The manager of the crawler writes the shared log file
+    log = get_logger(log_path / f"job{job}crawler{crawler_id}.log", job + str(crawler_id) + __name__, log_queue, job=job, crawler=crawler_id, task=task)
     crawler: Crawler = Crawler(task, log, modules)
-    crawler.start_crawl()
+    if _is_live():
+        crawler.report = cast(CustomProcess, multiprocessing.current_process()).report
+    log.info('Crawler process ready after %.3fs', time.time() - started)
+
+    # The manager terminates stale crawlers; exit through the finally below so the profile and trace are written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    try:
+        with crawler.profiler.profile():
+            crawler.start_crawl()
+    finally:
+        crawler.profiler.close()
+        if crawler.tracer is not None:
+            crawler.tracer.close()
     log.info('Stop crawler')
-    log.handlers[-1].close()
 
 
-def main(job: str, crawlers_count: int, module_names: List[str], log_path: pathlib.Path, starting_crawler_id: int = 1, listen: bool = False) -> int:
+def _start_forkserver(module_names: List[str]) -> None:
+    # The fork server imports everything once; it never opens a database connection or log file, so the
+    # crawler processes forked from it create their own instead of sharing inherited ones. The preload list
+    # only applies to the fork server of the calling process, so every crawler manager sets it for its own.
+    multiprocessing.set_start_method('forkserver', force=True)
+    multiprocessing.set_forkserver_preload(['__main__', 'config', 'utils', 'database', 'capture', 'crawler'] + [f"modules.{module_name}" for module_name in module_names])
+
+
+def main(job: str, crawlers_count: int, module_names: List[str], log_path: pathlib.Path, starting_crawler_id: int = 1, listen: bool = False, forkserver: bool = False) -> int:
     # Prepare logger
     log_path.mkdir(parents=True, exist_ok=True)
     (log_path / 'screenshots').mkdir(parents=True, exist_ok=True)
@@ -109,7 +155,7 @@ def main(job: str, crawlers_count: int, module_names: List[str], log_path: pathl
     if Config.HAR:
         Config.HAR.mkdir(parents=True, exist_ok=True)
 
-    log: logging.Logger = _get_logger(log_path / f"job{job}.log", job + __name__)
+    log: logging.Logger = get_logger(log_path / f"job{job}.log", job + __name__, job=job)
 
     # Importing modules
     log.debug("Import additional modules %s", str(module_names))
@@ -120,11 +166,20 @@ def main(job: str, crawlers_count: int, module_names: List[str], log_path: pathl
     for module in modules:
         module.register_job(log)
 
+    URL.create_table()
+    JobCounter.create_table()
+    if Config.METRICS:
+        Metric.create_table()
+
+    if forkserver:
+        log.info('Use preloaded fork server for crawler processes')
+        _start_forkserver(module_names)
+
     # Prepare crawlers
     log.info('Preparing crawlers')
-    crawlers: List[Process] = []
+    crawlers: List[CustomProcess] = []
     for i in range(0, crawlers_count):
-        process = Process(target=_manage_crawler, args=(job, i + starting_crawler_id, log_path, modules, listen))
+        process = CustomProcess(target=_manage_crawler, args=(job, i + starting_crawler_id, log_path, modules, listen, forkserver))
         crawlers.append(process)
 
     # Start crawlers
@@ -133,19 +188,65 @@ def main(job: str, crawlers_count: int, module_names: List[str], log_path: pathl
         crawler.start()
         log.info("Start crawler %s with JOBID %s PID %s", (i + starting_crawler_id), job, crawler.pid)
 
+    # Serve live metrics aggregated from the reports of the crawlers
+    metrics: Optional[LiveMetrics] = LiveMetrics(job, log) if _is_live() else None
+    if metrics is not None:
+        metrics.load_counters()
+        if Config.METRICS_ADDRESS:
+            log.info('Serve live metrics on %s:%s', *Config.METRICS_ADDRESS)
+            metrics.serve(Config.METRICS_ADDRESS)
+
     # Wait for crawlers to finish
     log.info('Waiting for crawlers to complete')
+    while any(crawler.is_alive() for crawler in crawlers):
+        wait([crawler.sentinel for crawler in crawlers if crawler.is_alive()], timeout=Config.METRICS_INTERVAL)
+
+        for i, crawler in enumerate(crawlers):
+            for report in crawler.reports:
+                if metrics is not None:
+                    metrics.add(i + starting_crawler_id, *report)
+
+        if (metrics is not None) and Config.METRICS_FILE:
+            metrics.write(Config.METRICS_FILE)
+
     for crawler in crawlers:
-        crawler.join()
+        if crawler.exception:
+            log.error("Crawler manager crashed %s", crawler.exception)
         crawler.close()
 
+    if metrics is not None:
+        metrics.close()
+
     log.info('Crawl complete')
+    close_logger(log)
 
     # Exit code
     return 0
 
-def _manage_crawler(job: str, crawler_id: int, log_path: pathlib.Path, modules: List[Type[Module]], listen: bool) -> None:
-    log = _get_logger(log_path / f"job{job}crawler{crawler_id}.log", job + str(crawler_id) + __name__)
+def _forward_reports(crawler: CustomProcess) -> bool:
+    # Pass the reports of the crawler on to the main process; return whether the landing page failed
+    failed: bool = False
+    for name, value, timestamp in crawler.reports:
+        failed = failed or (name == 'task_error')
+        cast(CustomProcess, multiprocessing.current_process()).report(name, value, timestamp)
+    return failed
+
+def _wait_crawler(crawler: CustomProcess, timeout: float) -> bool:
+    # Like join, but keep forwarding reports while waiting
+    failed: bool = False
+    deadline: float = time.time() + timeout
+    while crawler.is_alive() and (time.time() < deadline):
+        crawler.join(timeout=min(Config.METRICS_INTERVAL, deadline - time.time()))
+        failed = _forward_reports(crawler) or failed
+    return _forward_reports(crawler) or failed
+
+def _manage_crawler(job: str, crawler_id: int, log_path: pathlib.Path, modules: List[Type[Module]], listen: bool, forkserver: bool = False) -> None:
+    # The per-task crawler processes are forked from the fork server of the manager
+    if forkserver:
+        _start_forkserver([module.__name__ for module in modules])
+
+    log = get_logger(log_path / f"job{job}crawler{crawler_id}.log", job + str(crawler_id) + __name__, job=job, crawler=crawler_id)
+    report = cast(CustomProcess, multiprocessing.current_process()).report
     database = load_database()
     task: Optional[Task] = _get_task(job, crawler_id, database, log)
 
@@ -157,23 +258,31 @@ def _manage_crawler(job: str, crawler_id: int, log_path: pathlib.Path, modules:
             continue
 
         start_time: datetime = datetime.now()
+        set_context(log, task=task.get_id())
 
         with database:
             is_cached: bool = not database.execute_sql(f"SELECT crawlerstate IS NULL FROM task WHERE id={database.param}", (task.get_id(),)).fetchone()[0]
 
-        crawler: CustomProcess = CustomProcess(target=_start_crawler, args=(job, crawler_id, task.get_id(), log_path, modules))
+        # Every crawler process gets its own log queue, see get_queue
+        log_queue = get_queue(log)
+        crawler: CustomProcess = CustomProcess(target=_start_crawler, args=(job, crawler_id, task.get_id(), log_path, modules, time.time(), log_queue))
         crawler.start()
         log.info("Start crawler %s PID %s", crawler_id, crawler.pid)
 
+        failed: bool = False
         while crawler.is_alive() or is_cached:
             if not crawler.is_alive():
                 log.error("Crawler %s crashed %s", task.crawler, crawler.exception)
+                failed = _forward_reports(crawler) or failed
                 crawler.close()
-                crawler = CustomProcess(target=_start_crawler, args=(job, crawler_id, task.get_id(), log_path, modules))
+                release_queue(log_queue)
+                log_queue = get_queue(log)
+                crawler = CustomProcess(target=_start_crawler, args=(job, crawler_id, task.get_id(), log_path, modules, time.time(), log_queue))
                 crawler.start()
+                report('restart')
                 log.info("Start crawler %s PID %s", crawler_id, crawler.pid)
 
-            crawler.join(timeout=Config.RESTART_TIMEOUT)
+            failed = _wait_crawler(crawler, Config.RESTART_TIMEOUT) or failed
 
             with database:
                 timelastentry = database.execute_sql(f"SELECT updated FROM task WHERE id={database.param}", (task.get_id(),)).fetchone()[0]
@@ -186,6 +295,7 @@ def _manage_crawler(job: str, crawler_id: int, log_path: pathlib.Path, modules:
                 continue
 
             log.error("Close stale crawler %s", task.crawler)
+            report('stale')
 
             crawler.terminate()
             crawler.join(timeout=30)
@@ -194,21 +304,27 @@ def _manage_crawler(job: str, crawler_id: int, log_path: pathlib.Path, modules:
                 crawler.kill()
                 time.sleep(5)
 
+        failed = _forward_reports(crawler) or failed
         crawler.close()
+        release_queue(log_queue)
+
+        if crawler.exception:
+            log.error("Crawler %s crashed %s", task.crawler, crawler.exception)
 
         with database.atomic():
             task.updated = datetime.today()
-            database.execute_sql(f"UPDATE task SET updated={database.param}, state='complete', crawlerstate=NULL WHERE id={database.param}", (task.updated, task.get_id()))
+            error = database.execute_sql(f"UPDATE task SET updated={database.param}, state='complete', crawlerstate=NULL WHERE id={database.param} RETURNING error", (task.updated, task.get_id())).fetchone()[0]
+            failed = failed or bool(crawler.exception) or (error is not None)
+            _report_counters(JobCounter.add(database, job, {'tasks_complete': 1, 'tasks_failed': int(failed)}, crawler_id))
 
-        if crawler.exception:
-            log.error("Crawler %s crashed %s", task.crawler, crawler.exception)
+        report('task_failed' if failed else 'task_complete')
 
-        log.info("Crawler %s finished after %s", task.crawler, (datetime.now() - start_time), extra=())  # TODO
+        log.info("Crawler %s finished after %s", task.crawler, (datetime.now() - start_time), extra={'duration': (datetime.now() - start_time).total_seconds()})
 
         task = _get_task(job, crawler_id, database, log)
 
     database.close()
-    log.handlers[-1].close()
+    close_logger(log)
 
 
 if __name__ == '__main__':
@@ -224,6 +340,8 @@ if __name__ == '__main__':
                              help="starting crawler id (default 1); must be > 0")
     args_parser.add_argument("-l", "--listen", default=False, action='store_true',
                              help="crawler will not stop if there is no job; query and sleep until a job is found")
+    args_parser.add_argument("-f", "--forkserver", default=False, action='store_true',
+                             help="start crawler processes from a fork server with preloaded modules")
     args_parser.add_argument("-o", "--log", type=str, required=False, default=Config.LOG,
                              help="path to directory for log output")
 
@@ -247,5 +365,6 @@ if __name__ == '__main__':
         _modules,
         Config.LOG,
         cast(int, _args['crawlerid']),
-        cast(bool, _args['listen'])
+        cast(bool, _args['listen']),
+        cast(bool, _args['forkserver'])
     ))
@@ -0,0 +1,290 @@
+import argparse
+import os
+import pathlib
+import resource
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import Logger
+from typing import TYPE_CHECKING, Deque, Dict, Iterator, List, Optional, Tuple, cast
+
+from peewee import PostgresqlDatabase, SqliteDatabase
+
+from database import JobCounter, load_database
+
+# Only for annotations, the tracer imports playwright
+if TYPE_CHECKING:
+    from tracing import Tracer
+
+
+class PhaseTimer:
+    """
+    Measures wall and CPU time of the crawler phases and writes them to the metric table.
+
+    Timings are buffered in memory and written with a single statement per visit, so measuring a phase never
+    touches the database. CPU time is the time of the crawler process only, the browser runs in its own
+    processes. Phases can nest (e.g. the page handlers of a preloaded URL are part of the preload phase).
+    """
+
+    def __init__(self, enabled: bool, log: Logger) -> None:
+        self.enabled: bool = enabled
+        self.log: Logger = log
+        self.tracer: Optional['Tracer'] = None  # Also adds the phases to the trace of the task, if traced
+
+        self._timings: List[Tuple[str, float, float]] = []
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        if (not self.enabled) and (self.tracer is None):
+            yield
+            return
+
+        wall: float = time.monotonic()
+        cpu: float = time.process_time()
+        try:
+            yield
+        finally:
+            end: float = time.monotonic()
+            if self.tracer is not None:
+                self.tracer.add(phase, wall, end)
+            if self.enabled:
+                self._timings.append((phase, end - wall, time.process_time() - cpu))
+                self.log.debug('Phase %s took %.3fs', phase, end - wall, extra={'phase': phase, 'duration': end - wall})
+
+    def flush(self, database: SqliteDatabase | PostgresqlDatabase, task: int, url: Optional[int], repetition: int) -> None:
+        """Writes the buffered timings for a visit.
+
+        Args:
+            database (SqliteDatabase | PostgresqlDatabase): the database
+            task (int): task id
+            url (int): URL id of the visit
+            repetition (int): repetition of the visit
+        """
+
+        if not self._timings:
+            return
+
+        timings, self._timings = self._timings, []
+
+        params: List = []
+        for phase, wall, cpu in timings:
+            params += [task, url, repetition, phase, wall, cpu]
+
+        try:
+            with database.atomic():
+                database.execute_sql(
+                    f"INSERT INTO metric (task_id, url_id, repetition, phase, wall, cpu) VALUES {','.join(['(' + ','.join([database.param] * 6) + ')'] * len(timings))}",
+                    params
+                )
+        except Exception as error:
+            self.log.warning('metrics.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+
+def get_rss() -> int:
+    """Returns the resident memory of the current process in bytes."""
+
+    try:
+        with open('/proc/self/statm', encoding='utf-8') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak instead of current memory where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LiveMetrics:
+    """
+    Aggregates the metrics the crawler processes report over their pipes and renders them in the Prometheus text
+    format, served over HTTP and/or written to a file.
+
+    Reports are (name, value, timestamp) tuples tagged with the crawler id. The queue depth follows from the job
+    counters (see JobCounter): they are read once at the start, and afterwards the processes report the totals of
+    their shards JobCounter.add returns whenever they add to them, so the database is never polled. Tasks added while the job
+    runs only show up in the queue after a restart.
+    """
+
+    # Reported name: metric name and description
+    COUNTERS: Dict[str, Tuple[str, str]] = {
+        'task_complete': ('tasks_completed', 'Tasks completed'),
+        'task_failed': ('tasks_failed', 'Tasks failed (crawler crash or landing page error)'),
+        'restart': ('crawler_restarts', 'Crawler processes restarted after a crash'),
+        'stale': ('stale_kills', 'Stale crawler processes killed'),
+        'browser': ('browser_relaunches', 'Browser relaunches'),
+    }
+
+    WINDOW: int = 1000  # Page times kept for quantiles
+
+    def __init__(self, job: str, log: Logger) -> None:
+        self.job: str = job
+        self.log: Logger = log
+
+        self._lock: threading.Lock = threading.Lock()
+        self._counters: Dict[str, float] = dict.fromkeys(LiveMetrics.COUNTERS, 0)
+        self._pages: Deque[Tuple[float, float]] = deque(maxlen=LiveMetrics.WINDOW)
+        self._page_count: int = 0
+        self._page_sum: float = 0
+        self._rss: Dict[int, float] = {}
+        self._jobcounters: Dict[Tuple[int, str], float] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def add(self, crawler_id: int, name: str, value: float, timestamp: float) -> None:
+        with self._lock:
+            if name == 'page':
+                self._pages.append((timestamp, value))
+                self._page_count += 1
+                self._page_sum += value
+            elif name == 'rss':
+                self._rss[crawler_id] = value
+            elif name.startswith('jobcounter:'):
+                # Totals of the shard of a crawler arrive in any order, but counters only grow
+                key: Tuple[int, str] = (crawler_id, name[11:])
+                self._jobcounters[key] = max(self._jobcounters.get(key, 0), value)
+            elif name in self._counters:
+                self._counters[name] += value
+
+    def load_counters(self) -> None:
+        try:
+            database = load_database()
+            counters: Dict[Tuple[int, str], int] = JobCounter.get_shards(self.job)
+            database.close()
+        except Exception as error:
+            self.log.warning('metrics.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return
+
+        with self._lock:
+            for key, value in counters.items():
+                self._jobcounters[key] = max(self._jobcounters.get(key, 0), value)
+
+    def render(self) -> str:
+        with self._lock:
+            now: float = time.time()
+            times: List[float] = sorted(seconds for _, seconds in self._pages)
+            label: str = f'job="{self.job}"'
+
+            lines: List[str] = [
+                '# HELP pycrawler_pages_total Pages visited (per URL and repetition)',
+                '# TYPE pycrawler_pages_total counter',
+                f'pycrawler_pages_total{{{label}}} {self._page_count}',
+                '# HELP pycrawler_pages_per_minute Pages visited in the last minute',
+                '# TYPE pycrawler_pages_per_minute gauge',
+                f'pycrawler_pages_per_minute{{{label}}} {sum(1 for timestamp, _ in self._pages if now - timestamp <= 60)}',
+                f'# HELP pycrawler_page_seconds Time per page from page handlers to response handlers (quantiles of the last {LiveMetrics.WINDOW} pages)',
+                '# TYPE pycrawler_page_seconds summary',
+            ]
+
+            for quantile in (0.5, 0.95):
+                value: float = times[min(len(times) - 1, int(quantile * len(times)))] if times else float('nan')
+                lines.append(f'pycrawler_page_seconds{{{label},quantile="{quantile}"}} {value:.3f}')
+            lines.append(f'pycrawler_page_seconds_sum{{{label}}} {self._page_sum:.3f}')
+            lines.append(f'pycrawler_page_seconds_count{{{label}}} {self._page_count}')
+
+            for name, (metric, description) in LiveMetrics.COUNTERS.items():
+                lines += [
+                    f'# HELP pycrawler_{metric}_total {description}',
+                    f'# TYPE pycrawler_{metric}_total counter',
+                    f'pycrawler_{metric}_total{{{label}}} {self._counters[name]:g}',
+                ]
+
+            lines += ['# HELP pycrawler_queue Free entries in the task and URL tables', '# TYPE pycrawler_queue gauge']
+            totals: Dict[str, float] = {}
+            for (_, name), value in self._jobcounters.items():
+                totals[name] = totals.get(name, 0) + value
+            queue: Dict[str, float] = {
+                'task': totals.get('tasks_added', 0) - totals.get('tasks_claimed', 0),
+                'url': totals.get('urls_added', 0) - totals.get('urls_complete', 0),
+            }
+            lines += [f'pycrawler_queue{{{label},table="{table}"}} {count:g}' for table, count in queue.items()]
+
+            lines += ['# HELP pycrawler_rss_bytes Resident memory of the crawler processes (without the browser)', '# TYPE pycrawler_rss_bytes gauge']
+            lines += [f'pycrawler_rss_bytes{{{label},crawler="{crawler_id}"}} {rss:.0f}' for crawler_id, rss in sorted(self._rss.items())]
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: pathlib.Path) -> None:
+        # Replace the file at once, so readers never see a partial file
+        try:
+            temporary: pathlib.Path = path.with_name(path.name + '.tmp')
+            temporary.write_text(self.render(), encoding='utf-8')
+            temporary.replace(path)
+        except OSError as error:
+            self.log.warning('metrics.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def serve(self, address: Tuple[str, int]) -> None:
+        metrics: LiveMetrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body: bytes = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(address, Handler)
+        threading.Thread(target=self._server.serve_forever, name='LiveMetrics', daemon=True).start()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def get_report(job: str, phase: Optional[str] = None) -> List[Tuple]:
+    """Aggregates the timings of a job per phase, slowest phases first.
+
+    Args:
+        job (str): job id
+        phase (str): only include phases starting with this prefix (e.g. "receive_response")
+
+    Returns:
+        rows of phase, count, total wall, mean wall, max wall, total CPU, and mean CPU time in seconds
+    """
+
+    database = load_database()
+
+    return database.execute_sql(
+        f"""
+        SELECT metric.phase, COUNT(*), SUM(metric.wall), AVG(metric.wall), MAX(metric.wall), SUM(metric.cpu), AVG(metric.cpu)
+        FROM metric JOIN task ON metric.task_id=task.id
+        WHERE task.job={database.param} AND metric.phase LIKE {database.param}
+        GROUP BY metric.phase
+        ORDER BY SUM(metric.wall) DESC
+        """,
+        (job, (phase or '') + '%')
+    ).fetchall()
+
+
+def main(job: str, phase: Optional[str]) -> int:
+    rows: List[Tuple] = get_report(job, phase)
+    if not rows:
+        print(f"No metrics for job {job}")
+        return 1
+
+    width: int = max(len('phase'), *(len(row[0]) for row in rows))
+    print(f"{'phase':<{width}} {'count':>8} {'wall':>12} {'wall avg':>10} {'wall max':>10} {'cpu':>12} {'cpu avg':>10}")
+    for name, count, wall, wall_avg, wall_max, cpu, cpu_avg in rows:
+        print(f"{name:<{width}} {count:>8} {wall:>12.3f} {wall_avg:>10.3f} {wall_max:>10.3f} {cpu:>12.3f} {cpu_avg:>10.3f}")
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-j", "--job", type=str, required=True, help="unique job id for crawl")
+    args_parser.add_argument("-p", "--phase", type=str, default=None, help="only show phases with this prefix (e.g. receive_response)")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(str, args.get('job')), args.get('phase')))
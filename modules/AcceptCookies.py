@@ -1,12 +1,12 @@
-import re
-from typing import List, MutableSet, Optional
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Tuple
 
 import tld
-from playwright.sync_api import Error, Frame, Locator, Page, Response
+from playwright.sync_api import Error, Frame, Page
 
 import utils
+from capture import CapturedResponse
 from config import Config
-from database import URL
 from modules.Module import Module
 
 
@@ -16,50 +16,156 @@ class AcceptCookies(Module):
     """
 
     # Keywords for accept buttons
-    KEYWORDS_ENG: str = '/(\\W|^)(accept|okay|ok|consent|agree|allow|understand|continue|yes|' \
-                     'got.?it|fine)(\\W|$)/i'
-    KEYWORDS_GER: str = '/(\\W|^)(stimm|verstanden|versteh|akzeptier|ja(\\W|$)|weiter(\\W|$)|' \
-                     'annehm|bestätig|willig|lasse)/i'
+    KEYWORDS_ENG: str = r'(\W|^)(accept|okay|ok|consent|agree|allow|understand|continue|yes|' \
+                        r'got.?it|fine)(\W|$)'
+    KEYWORDS_GER: str = r'(\W|^)(stimm|verstanden|versteh|akzeptier|ja(\W|$)|weiter(\W|$)|' \
+                        r'annehm|bestätig|willig|lasse)'
 
     # Keywords to avoid clicking non-accepting buttons
     IGNORE: str = r'(\W|^)(no|not|nicht|nein|limit)(\W|$)'
 
+    # Known consent management platforms: name -> (script URL fragments, accept button selectors)
+    CMP: Dict[str, Tuple[List[str], List[str]]] = {
+        'onetrust': (['cdn.cookielaw.org', 'optanon', 'onetrust'], ['#onetrust-accept-btn-handler', '#accept-recommended-btn-handler']),
+        'cookiebot': (['consent.cookiebot.com', 'consentcdn.cookiebot.com'], ['#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll', '#CybotCookiebotDialogBodyButtonAccept']),
+        'didomi': (['sdk.privacy-center.org', 'didomi'], ['#didomi-notice-agree-button']),
+        'quantcast': (['quantcast.mgr.consensu.org', 'cmp.quantcast.com'], ['.qc-cmp2-summary-buttons button[mode="primary"]']),
+        'trustarc': (['consent.trustarc.com', 'truste.com'], ['#truste-consent-button']),
+        'usercentrics': (['app.usercentrics.eu', 'usercentrics'], ['[data-testid="uc-accept-all-button"]', '#uc-btn-accept-banner']),
+        'cookieyes': (['cdn-cookieyes.com'], ['.cky-btn-accept']),
+        'cookie-script': (['cdn.cookie-script.com'], ['#cookiescript_accept']),
+        'complianz': (['complianz'], ['.cmplz-btn.cmplz-accept']),
+        'borlabs': (['borlabs-cookie'], ['a[data-cookie-accept-all]', '#BorlabsCookieBox a[data-cookie-accept]']),
+        'klaro': (['klaro'], ['.cm-btn-accept-all', '.cm-btn-success']),
+        'osano': (['cmp.osano.com', 'cookieconsent'], ['.osano-cm-accept-all', '.cc-btn.cc-allow', '.cc-btn.cc-dismiss']),
+        'sourcepoint': (['sourcepoint', 'privacy-mgmt.com'], ['button.sp_choice_type_11']),
+        'iubenda': (['cdn.iubenda.com'], ['.iubenda-cs-accept-btn']),
+        'consentmanager': (['consentmanager.net'], ['#cmpbntyestxt', '.cmpboxbtnyes']),
+    }
+
+    # Outcome cached for an origin where the generic keyword scan clicked something
+    GENERIC: str = '*'
+
+    # URLs of an origin without a banner after which detection runs again (banners can show up later, e.g. after a redirect or A/B test)
+    RETRY: int = 5
+
+    # Attribute used to mark generic accept candidates within a frame
+    MARKER: str = 'data-pycrawler-accept'
+
+    _JS_VISIBLE: str = """
+        const visible = (node) => {
+            const rect = node.getBoundingClientRect();
+            if ((rect.width <= 0) || (rect.height <= 0)) return false;
+            for (let current = node; current && (current.nodeType === 1); current = current.parentNode) {
+                const style = window.getComputedStyle(current);
+                if ((style.display === 'none') || (style.visibility === 'hidden') || (parseFloat(style.opacity || '1') <= 0)) return false;
+            }
+            return true;
+        };
+    """
+
+    _JS_CMP: str = """
+        (cmps) => {
+            """ + _JS_VISIBLE + """
+            const scripts = Array.from(document.scripts, (script) => script.src.toLowerCase()).filter((src) => src);
+            const present = cmps.filter(([name, patterns, selectors]) => scripts.some((src) => patterns.some((pattern) => src.includes(pattern))));
+            for (const [name, patterns, selectors] of present.concat(cmps)) {
+                for (const selector of selectors) {
+                    let node = null;
+                    try { node = document.querySelector(selector); } catch (error) { continue; }
+                    if (node && visible(node)) return selector;
+                }
+            }
+            return null;
+        }
+    """
+
+    _JS_GENERIC: str = """
+        ([clickables, keywords, ignore, sso, marker]) => {
+            """ + _JS_VISIBLE + """
+            const ignoreRegex = new RegExp(ignore, 'i');
+            const ssoRegex = new RegExp(sso, 'i');
+            const nodes = Array.from(document.querySelectorAll(clickables)).filter(visible);
+            for (const keyword of keywords) {
+                const keywordRegex = new RegExp(keyword, 'i');
+                let count = 0;
+                for (const node of nodes) {
+                    const text = (node.innerText || node.value || '').trim();
+                    if ((!text) || (!keywordRegex.test(text))) continue;
+                    if (ignoreRegex.test(node.outerHTML) || ssoRegex.test(node.outerHTML)) continue;
+                    node.setAttribute(marker, String(count++));
+                }
+                if (count > 0) return count;
+            }
+            return 0;
+        }
+    """
+
     def __init__(self, crawler) -> None:
         super().__init__(crawler)
 
-        self._seen: MutableSet[str] = self.crawler.state.get('AcceptCookies', set())
+        # Origin -> accept selector that worked, or GENERIC
+        self._seen: Dict[str, str] = self.crawler.state.get('AcceptCookies', {})
         self.crawler.state['AcceptCookies'] = self._seen
-        
+
+        # Origin -> URLs left to skip detection on, after no banner was found
+        self._misses: Dict[str, int] = self.crawler.state.get('AcceptCookiesMisses', {})
+        self.crawler.state['AcceptCookiesMisses'] = self._misses
+
         if not Config.SAVE_CONTEXT:
             self.crawler.log.error("AcceptCookies: Config.SAVE_CONTEXT is False")
 
-    def receive_response(self, responses: List[Optional[Response]], final_url: str, repetition: int) -> None:
+    def receive_response(self, responses: List[Optional[CapturedResponse]], final_url: str, repetition: int) -> None:
         super().receive_response(responses, final_url, repetition)
 
         # Verify that response is valid
-        response: Optional[Response] = responses[-1] if len(responses) > 0 else None
+        response: Optional[CapturedResponse] = responses[-1] if len(responses) > 0 else None
         if (response is None) or (response.status >= 400):
             return
 
-        # Check if we already accepted cookies for origin
         url_origin: Optional[tld.utils.Result] = utils.get_tld_object(final_url)
-        if (url_origin is None) or (utils.get_url_origin(url_origin) in self._seen):
+        if url_origin is None:
             return
-        self._seen.add(utils.get_url_origin(url_origin))
+        origin: str = utils.get_url_origin(url_origin)
 
-        # Accept cookies in first-depth frames
-        for frame in self.crawler.page.frames[1:]:
-            response = self.accept(frame, self.crawler.url, inframe=True)
+        cookies: FrozenSet[Tuple[str, str, str, str]] = self._get_cookies()
 
-            if response:
-                self.crawler.log.info(f"Found a cookiebanner in frame {response.url}")
+        # Check if we already know the outcome for the origin
+        if origin in self._seen:
+            selector: str = self._seen[origin]
+            if selector == AcceptCookies.GENERIC:
+                return
 
-        # Accept cookies in main page
-        response = self.accept(self.crawler.page, self.crawler.url)
+            # Skip detection and click the known button directly if it is shown again
+            clicked: bool = any(AcceptCookies._click_selector(frame, selector) for frame in self.crawler.page.frames)
+        elif self._misses.get(origin, 0) > 0:
+            self._misses[origin] -= 1
+            return
+        else:
+            accepted: Optional[str] = self.accept(self.crawler.page)
+            clicked = accepted is not None
+
+            if accepted is not None:
+                self._seen[origin] = accepted
+                self._misses.pop(origin, None)
+                self.crawler.log.info(f"Found a cookiebanner in {final_url} with {accepted}")
+            else:
+                self._misses[origin] = AcceptCookies.RETRY
+
+        # Reload only when accepting the banner actually changed the cookies
+        if (not clicked) or (self._get_cookies() == cookies):
+            return
 
+        try:
+            response = self.crawler.page.goto(self.crawler.url.url, timeout=Config.LOAD_TIMEOUT, wait_until=Config.WAIT_LOAD_UNTIL)
+            self.crawler.page.wait_for_timeout(Config.WAIT_AFTER_LOAD)
+        except Error as error:
+            self.crawler.log.warning(f"AcceptCookies reload fail: {error}")
+            response = None
+
+        # Modules after this one read the reload like any other navigation
         if response:
-            self.crawler.log.info(f"Found a cookiebanner in main {final_url}")
-            responses.append(response)
+            responses.append(self.crawler.captures.get(response))
 
         # Save context (accepted cookies need context)
         if not Config.SAVE_CONTEXT:
@@ -69,53 +175,76 @@ class AcceptCookies(Module):
                 self.crawler.log.warning(f"Get main context fail: {error}")
 
         # Update the screenshot of the landing page
-        if self.crawler.initial and (self.crawler.repetition == 1) and response:
-            utils.get_screenshot(self.crawler.page, (Config.LOG / f"screenshots/{self.crawler.site.site}-{self.crawler.job_id}.png"), force=True)
+        if (self.crawler.url.get_id() == self.crawler.landing.get_id()) and (self.crawler.repetition == 1) and response:
+            self.crawler.screenshots.take(
+                self.crawler.page,
+                (Config.LOG / f"screenshots/{datetime.now().strftime('%Y-%m-%d')}-{self.crawler.task.job}-{self.crawler.task.crawler}-1-{self.crawler.site.scheme}-{self.crawler.site.site}.png"),
+                self.crawler.cdp,
+                force=True
+            )
+
+    def _get_cookies(self) -> FrozenSet[Tuple[str, str, str, str]]:
+        try:
+            return frozenset((cookie['name'], cookie['domain'], cookie['path'], cookie['value']) for cookie in self.crawler.context.cookies())
+        except Error:
+            return frozenset()
 
     @staticmethod
-    def accept(page: Page | Frame, url: URL, inframe: bool = False) -> Optional[Response]:
-        """Automatically searches buttons with accept keywords and presses them.
+    def _click_selector(frame: Frame, selector: str) -> bool:
+        try:
+            button = frame.locator(selector).first
+            if not button.is_visible():
+                return False
+            button.click(timeout=2000)
+            return True
+        except Error:
+            return False
+
+    @staticmethod
+    def accept(page: Page) -> Optional[str]:
+        """Finds cookie banners in the page and its frames and presses their accept buttons.
+
+        Known consent management platforms are clicked directly through their selectors; otherwise the
+        clickable elements of each frame are scanned for accept keywords within a single evaluation.
 
         Args:
-            page (Page | Frame): The page or frame
-            url (URL): The URL object
-            inframe (bool, optional): If the page argument is a page. Defaults to True.
-        """
+            page (Page): The page
 
-        # Get all buttons with certain keywords
-        try:
-            # First check for english keywords
-            buttons: Locator = page.locator(f"{utils.CLICKABLES} >> text={AcceptCookies.KEYWORDS_ENG} >> visible=true")
-            locator_count: int = utils.get_locator_count(buttons)
-
-            # Then check for german keywords
-            if locator_count == 0:
-                buttons = page.locator(f"{utils.CLICKABLES} >> text={AcceptCookies.KEYWORDS_GER} >> visible=true")
-                locator_count = utils.get_locator_count(buttons)
-        except Error:
-            return None
+        Returns:
+            The selector that accepted the banner, GENERIC for the keyword scan, or None if nothing was clicked
+        """
 
-        # Click on each possible cookie accept button
-        for i in range(locator_count):
-            button: Optional[Locator] = utils.get_locator_nth(buttons, i)
-            if button is None:
-                continue
+        cmps = [[name, patterns, selectors] for name, (patterns, selectors) in AcceptCookies.CMP.items()]
 
-            button_html: str = utils.get_locator_outer_html(button) or ''
+        # Check frames first, then the main page
+        frames: List[Frame] = page.frames[1:] + page.frames[:1]
 
-            if re.search(utils.SSO, button_html, flags=re.I) is not None:
+        # Known consent management platforms
+        for frame in frames:
+            try:
+                selector: Optional[str] = frame.evaluate(AcceptCookies._JS_CMP, cmps)
+            except Error:
                 continue
 
-            if re.search(AcceptCookies.IGNORE, button_html, flags=re.I) is not None:
-                continue
+            if (selector is not None) and AcceptCookies._click_selector(frame, selector):
+                page.wait_for_timeout(500)
+                return selector
 
-            utils.invoke_click(page, button, timeout=2000)
+        # Generic keyword scan
+        clicked: bool = False
+        for frame in frames:
+            try:
+                count: int = frame.evaluate(
+                    AcceptCookies._JS_GENERIC,
+                    [utils.CLICKABLES, [AcceptCookies.KEYWORDS_ENG, AcceptCookies.KEYWORDS_GER], AcceptCookies.IGNORE, utils.SSO, AcceptCookies.MARKER]
+                )
+            except Error:
+                continue
 
-        # Update responses if needed
-        response: Optional[Response] = None
+            for i in range(count):
+                clicked = AcceptCookies._click_selector(frame, f'[{AcceptCookies.MARKER}="{i}"]') or clicked
 
-        if not inframe:
-            response = page.goto(url.url, timeout=Config.LOAD_TIMEOUT, wait_until=Config.WAIT_LOAD_UNTIL)
-            page.wait_for_timeout(Config.WAIT_AFTER_LOAD)
+        if clicked:
+            page.wait_for_timeout(500)
 
-        return response
+        return AcceptCookies.GENERIC if clicked else None
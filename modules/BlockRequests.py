@@ -0,0 +1,436 @@
+import json
+import pathlib
+import pickle
+import re
+import traceback
+from asyncio import CancelledError
+from functools import lru_cache
+from logging import Logger
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from playwright.sync_api import Request, Route
+
+import utils
+from capture import CapturedResponse
+from config import Config
+from modules.Module import Module
+
+
+# Resource type options of filter lists mapped to playwright resource types
+RESOURCE_TYPES: Dict[str, FrozenSet[str]] = {
+    'script': frozenset({'script'}),
+    'image': frozenset({'image'}),
+    'stylesheet': frozenset({'stylesheet'}),
+    'xmlhttprequest': frozenset({'xhr', 'fetch', 'eventsource'}),
+    'subdocument': frozenset({'document'}),
+    'font': frozenset({'font'}),
+    'media': frozenset({'media'}),
+    'websocket': frozenset({'websocket'}),
+    'ping': frozenset({'ping'}),
+    'other': frozenset({'other', 'manifest', 'texttrack'}),
+}
+
+# Filter options we cannot honour for request blocking; filters using them are dropped
+UNSUPPORTED_OPTIONS: FrozenSet[str] = frozenset({
+    'csp', 'redirect', 'redirect-rule', 'removeparam', 'rewrite', 'replace', 'header', 'permissions',
+    'popup', 'popunder', 'document', 'doc', 'elemhide', 'ehide', 'generichide', 'ghide', 'specifichide',
+    'shide', 'genericblock', 'badfilter', 'important', 'empty', 'mp4', 'cname', 'strict1p', 'strict3p',
+    'to', 'from', 'method', 'denyallow', 'inline-script', 'inline-font', 'webrtc', 'object', 'object-subrequest'
+})
+
+_TOKEN: re.Pattern = re.compile(r'[a-z0-9%]+')
+
+
+@lru_cache(maxsize=4096)
+def _get_site(host: str) -> str:
+    url = utils.get_tld_object('https://' + host)
+    return utils.get_url_site(url) if url is not None else host
+
+
+class Filter:
+    """
+    Single network filter of an Adblock Plus style list.
+    """
+
+    __slots__ = ('pattern', 'regex', 'substring', 'third_party', 'resources', 'include', 'exclude', '_compiled')
+
+    def __init__(self, pattern: str, regex: Optional[str], third_party: Optional[bool], resources: Optional[FrozenSet[str]], include: FrozenSet[str], exclude: FrozenSet[str]) -> None:
+        self.pattern: str = pattern
+        self.regex: Optional[str] = regex
+        self.substring: Optional[str] = pattern if regex is None else None
+        self.third_party: Optional[bool] = third_party
+        self.resources: Optional[FrozenSet[str]] = resources
+        self.include: FrozenSet[str] = include
+        self.exclude: FrozenSet[str] = exclude
+        self._compiled: Optional[re.Pattern] = None
+
+    def __getstate__(self):
+        return (self.pattern, self.regex, self.third_party, self.resources, self.include, self.exclude)
+
+    def __setstate__(self, state) -> None:
+        self.__init__(*state)
+
+    @staticmethod
+    def _domain_match(site: str, host: str, domains: FrozenSet[str]) -> bool:
+        if (site in domains) or (host in domains):
+            return True
+
+        labels: List[str] = host.split('.')
+        return any(('.'.join(labels[i:]) in domains) for i in range(1, len(labels) - 1))
+
+    def match(self, url: str, resource: str, third_party: bool, first_party_site: str, first_party_host: str) -> bool:
+        if (self.third_party is not None) and (self.third_party != third_party):
+            return False
+
+        if (self.resources is not None) and (resource not in self.resources):
+            return False
+
+        if self.include and (not Filter._domain_match(first_party_site, first_party_host, self.include)):
+            return False
+
+        if self.exclude and Filter._domain_match(first_party_site, first_party_host, self.exclude):
+            return False
+
+        if self.substring is not None:
+            return self.substring in url
+
+        if self._compiled is None:
+            self._compiled = re.compile(self.regex or '')
+
+        return self._compiled.search(url) is not None
+
+
+class Matcher:
+    """
+    Compiled filter lists.
+
+    Plain hostname filters (``||example.com^``) are kept in suffix sets, so a host is checked with one set
+    lookup per label. All other filters are bucketed by their rarest token; a URL only tests the filters of the
+    tokens it contains, which keeps the decision for a request in the order of microseconds.
+    """
+
+    def __init__(self) -> None:
+        self.domains: Set[str] = set()
+        self.domains_third_party: Set[str] = set()
+        self.block: Dict[str, List[Filter]] = {}
+        self.allow: Dict[str, List[Filter]] = {}
+        self.sources: Dict[str, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.domains) + len(self.domains_third_party) + \
+               sum(len(entry) for entry in self.block.values()) + sum(len(entry) for entry in self.allow.values())
+
+    @staticmethod
+    def _pattern_regex(pattern: str) -> Optional[str]:
+        # Plain substrings do not need a regular expression
+        if not any(char in pattern for char in '|*^'):
+            return None
+
+        regex: str = ''
+        if pattern.startswith('||'):
+            regex = r'^[a-z][a-z0-9+.-]*://([^/?#]*\.)?'
+            pattern = pattern[2:]
+        elif pattern.startswith('|'):
+            regex = '^'
+            pattern = pattern[1:]
+
+        end: str = ''
+        if pattern.endswith('|'):
+            end = '$'
+            pattern = pattern[:-1]
+
+        for char in pattern:
+            if char == '*':
+                regex += '.*'
+            elif char == '^':
+                regex += r'(?:[^a-z0-9_.%-]|$)'
+            else:
+                regex += re.escape(char)
+
+        return regex + end
+
+    @staticmethod
+    def _pattern_token(pattern: str, counts: Dict[str, int]) -> str:
+        # A token is only usable if it cannot be part of a longer token in the URL
+        candidates: List[str] = []
+        for match in _TOKEN.finditer(pattern):
+            start, end = match.span()
+
+            if (start == 0) and (not pattern.startswith('|')):
+                continue
+            if (start > 0) and (pattern[start - 1] == '*'):
+                continue
+            if (end == len(pattern)) and (not pattern.endswith(('|', '^'))):
+                continue
+            if (end < len(pattern)) and (pattern[end] == '*'):
+                continue
+
+            candidates.append(match.group())
+
+        if not candidates:
+            return ''
+
+        return min(candidates, key=lambda token: (counts.get(token, 0), -len(token)))
+
+    def add(self, line: str, counts: Dict[str, int]) -> None:
+        line = line.strip()
+
+        # Comments, headers and cosmetic filters
+        if (not line) or line.startswith(('!', '[')) or ('##' in line) or ('#@#' in line) or ('#?#' in line) or ('#$#' in line):
+            return
+
+        allow: bool = line.startswith('@@')
+        if allow:
+            line = line[2:]
+
+        pattern, _, options = line.rpartition('$') if '$' in line else (line, '', '')
+        pattern = pattern.lower()
+
+        # Regular expression filters are rare and expensive to evaluate
+        if pattern.startswith('/') and pattern.endswith('/') and (len(pattern) > 1):
+            return
+
+        third_party: Optional[bool] = None
+        resources: Optional[Set[str]] = None
+        resources_excluded: Set[str] = set()
+        include: Set[str] = set()
+        exclude: Set[str] = set()
+
+        for option in filter(None, options.lower().split(',')):
+            name, _, value = option.partition('=')
+            negated: bool = name.startswith('~')
+            name = name.lstrip('~')
+
+            if name in UNSUPPORTED_OPTIONS:
+                return
+            elif name in ('third-party', '3p'):
+                third_party = not negated
+            elif name in ('first-party', '1p'):
+                third_party = negated
+            elif name == 'domain':
+                for domain in value.split('|'):
+                    (exclude if domain.startswith('~') else include).add(domain.lstrip('~'))
+            elif (name in RESOURCE_TYPES) or (name == 'xhr'):
+                types: FrozenSet[str] = RESOURCE_TYPES['xmlhttprequest' if name == 'xhr' else name]
+                if negated:
+                    resources_excluded.update(types)
+                else:
+                    resources = (resources or set()) | types
+            elif name == 'match-case':
+                continue
+            else:
+                return
+
+        if resources_excluded:
+            resources = (resources if resources is not None else set().union(*RESOURCE_TYPES.values())) - resources_excluded
+
+        # Plain hostname filters go to the suffix sets
+        if (not allow) and pattern.startswith('||') and pattern.endswith('^') and (not include) and (not exclude) and \
+                (resources is None) and (third_party is not False) and (not any(char in pattern[2:-1] for char in '/*^|:?')):
+            (self.domains_third_party if third_party else self.domains).add(pattern[2:-1])
+            return
+
+        # Leading and trailing wildcards are implicit
+        pattern = pattern.strip('*')
+        if (pattern in ('', '|', '||')) and (not include):
+            return
+
+        token: str = Matcher._pattern_token(pattern, counts)
+        counts[token] = counts.get(token, 0) + 1
+
+        entry = Filter(
+            pattern,
+            Matcher._pattern_regex(pattern),
+            third_party,
+            frozenset(resources) if resources is not None else None,
+            frozenset(include),
+            frozenset(exclude)
+        )
+
+        (self.allow if allow else self.block).setdefault(token, []).append(entry)
+
+    @staticmethod
+    def _match_buckets(buckets: Dict[str, List[Filter]], tokens: List[str], url: str, resource: str, third_party: bool, site: str, host: str) -> bool:
+        for token in tokens:
+            for entry in buckets.get(token, ()):
+                if entry.match(url, resource, third_party, site, host):
+                    return True
+
+        return False
+
+    def match(self, url: str, resource: str, first_party_host: str) -> bool:
+        """Decides whether a request should be blocked.
+
+        Args:
+            url (str): URL of the request
+            resource (str): playwright resource type of the request
+            first_party_host (str): hostname of the page that issued the request
+
+        Returns:
+            true if the request is blocked and not allowed by an exception filter
+        """
+
+        url = url.lower()
+        host: str = url.split('://', 1)[-1].split('/', 1)[0].split('?', 1)[0].split('#', 1)[0].rsplit('@', 1)[-1].split(':', 1)[0]
+        site: str = _get_site(host)
+        first_party_site: str = _get_site(first_party_host)
+        third_party: bool = site != first_party_site
+
+        blocked: bool = False
+
+        labels: List[str] = host.split('.')
+        for i in range(len(labels) - 1):
+            suffix: str = '.'.join(labels[i:])
+            if (suffix in self.domains) or (third_party and (suffix in self.domains_third_party)):
+                blocked = True
+                break
+
+        tokens: List[str] = list(dict.fromkeys(_TOKEN.findall(url)))
+        tokens.append('')
+
+        if not blocked:
+            blocked = Matcher._match_buckets(self.block, tokens, url, resource, third_party, first_party_site, first_party_host)
+
+        if not blocked:
+            return False
+
+        return not Matcher._match_buckets(self.allow, tokens, url, resource, third_party, first_party_site, first_party_host)
+
+
+class BlockRequests(Module):
+    """
+    Module to block ads and trackers using EasyList, EasyPrivacy and the Disconnect lists.
+    """
+
+    PRELOAD_SAFE: bool = True
+
+    LISTS: List[str] = ['easylist/easylist/*.txt', 'easylist/easyprivacy/*.txt']
+    DISCONNECT: pathlib.Path = pathlib.Path('disconnect-tracking-protection/services.json')
+    # Disconnect categories that are not blocked
+    DISCONNECT_IGNORE: FrozenSet[str] = frozenset({'Content'})
+    CACHE: pathlib.Path = Config.LOG / 'blockrequests.pickle'
+
+    def __init__(self, crawler) -> None:
+        super().__init__(crawler)
+
+        self._matcher: Matcher = BlockRequests.load_matcher()
+        self._blocked: int = 0
+
+    @staticmethod
+    def get_sources() -> Dict[str, Tuple[int, int]]:
+        sources: Dict[str, Tuple[int, int]] = {}
+
+        for path in [path for pattern in BlockRequests.LISTS for path in sorted(pathlib.Path('.').glob(pattern))] + [BlockRequests.DISCONNECT]:
+            if path.is_file():
+                stat = path.stat()
+                sources[str(path)] = (stat.st_size, stat.st_mtime_ns)
+
+        return sources
+
+    @staticmethod
+    def compile_matcher(sources: Dict[str, Tuple[int, int]]) -> Matcher:
+        matcher: Matcher = Matcher()
+        matcher.sources = sources
+        counts: Dict[str, int] = {}
+
+        for source in sources:
+            path: pathlib.Path = pathlib.Path(source)
+
+            if path == BlockRequests.DISCONNECT:
+                with open(path, 'r', encoding='utf-8') as file:
+                    categories = json.load(file)['categories']
+
+                for category, entities in categories.items():
+                    if category in BlockRequests.DISCONNECT_IGNORE:
+                        continue
+
+                    for entity in entities:
+                        for sites in next(iter(entity.values())).values():
+                            if isinstance(sites, list):
+                                matcher.domains_third_party.update(site.lower() for site in sites)
+                continue
+
+            with open(path, 'r', encoding='utf-8', errors='ignore') as file:
+                for line in file:
+                    matcher.add(line, counts)
+
+        return matcher
+
+    @staticmethod
+    def load_matcher(log: Optional[Logger] = None) -> Matcher:
+        """Loads the compiled matcher from disk, recompiling it if the filter lists changed.
+
+        Args:
+            log (Logger, optional): logger for progress output
+
+        Returns:
+            the compiled matcher
+        """
+
+        sources: Dict[str, Tuple[int, int]] = BlockRequests.get_sources()
+
+        try:
+            with open(BlockRequests.CACHE, 'rb') as file:
+                matcher: Matcher = pickle.load(file)
+            if matcher.sources == sources:
+                return matcher
+        except Exception:
+            pass
+
+        if log:
+            log.info("Compile request blocking filter lists")
+
+        matcher = BlockRequests.compile_matcher(sources)
+
+        try:
+            BlockRequests.CACHE.parent.mkdir(parents=True, exist_ok=True)
+            temporary: pathlib.Path = BlockRequests.CACHE.with_suffix('.tmp')
+            with open(temporary, 'wb') as file:
+                pickle.dump(matcher, file, protocol=pickle.HIGHEST_PROTOCOL)
+            temporary.replace(BlockRequests.CACHE)
+        except OSError as error:
+            if log:
+                log.warning(f"BlockRequests: cannot cache filters {error}")
+
+        return matcher
+
+    @staticmethod
+    def register_job(log: Logger) -> None:
+        # Compile once in the main process, the crawlers only load the cache
+        matcher: Matcher = BlockRequests.load_matcher(log)
+        log.info(f"Loaded {len(matcher)} request blocking filters")
+
+    def add_handlers(self) -> None:
+        super().add_handlers()
+
+        # Create context handler
+        def handler(route: Route, request: Request) -> None:
+            try:
+                # Never block the top-level navigation
+                if request.is_navigation_request() and (request.frame.parent_frame is None):
+                    route.fallback()
+                    return
+
+                # The page of the request, which is not the current page of the crawler while preloading
+                first_party: str = (request.frame.page.url.split('://', 1)[-1].split('/', 1)[0].split(':', 1)[0]) or self.crawler.site.site
+
+                if self._matcher.match(request.url, request.resource_type, first_party.lower()):
+                    self._blocked += 1
+                    route.abort('blockedbyclient')
+                else:
+                    route.fallback()
+            except (Exception, CancelledError) as error:
+                self.crawler.log.warning('BlockRequests.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+                route.fallback()
+
+        # Set context handler
+        try:
+            self.crawler.context.route('**/*', handler)
+        except (Exception, CancelledError) as error:
+            self.crawler.log.warning('BlockRequests.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def receive_response(self, responses: List[Optional[CapturedResponse]], final_url: str, repetition: int) -> None:
+        super().receive_response(responses, final_url, repetition)
+
+        self.crawler.log.info(f"Blocked {self._blocked} requests")
+        self._blocked = 0
@@ -1,15 +1,14 @@
-import json
-import re
 import traceback
 from asyncio import CancelledError
 from logging import Logger
+from typing import cast
 
-from bs4 import BeautifulSoup
 from peewee import BlobField, BooleanField, CharField, ForeignKeyField, IntegerField, TextField
 from playwright.sync_api import Response
 
+import capture
 from config import Config
-from database import URL, BaseModel, Site, Task, load_database
+from database import URL, BaseModel, Site, Task, add_columns, load_database
 from modules.Module import Module
 
 # TODO compare with HAR and CDP and add other data?
@@ -38,6 +37,8 @@ class Request(BaseModel):
     metaheaders = TextField(null=True)
     reqbody = BlobField(null=True)
     resbody = BlobField(null=True)
+    resbodystate = CharField(null=True, index=True)
+    resbodyfile = TextField(null=True)
 
 class CollectRequests(Module):
     """
@@ -48,6 +49,8 @@ class CollectRequests(Module):
     def register_job(log: Logger) -> None:
         database = load_database()
         if database.table_exists('request'):
+            # Tables of earlier versions lack the body capture columns
+            add_columns(database, 'request', {'resbodystate': "VARCHAR DEFAULT NULL", 'resbodyfile': "TEXT DEFAULT NULL"}, ['resbodystate'])
             return
 
         log.info("Create Request table")
@@ -79,7 +82,9 @@ class CollectRequests(Module):
                 resheaders TEXT DEFAULT NULL,
                 metaheaders TEXT DEFAULT NULL,
                 reqbody {"BLOB" if Config.SQLITE is not None else "BYTEA"} DEFAULT NULL,
-                resbody {"BLOB" if Config.SQLITE is not None else "BYTEA"} DEFAULT NULL);
+                resbody {"BLOB" if Config.SQLITE is not None else "BYTEA"} DEFAULT NULL,
+                resbodystate VARCHAR DEFAULT NULL,
+                resbodyfile TEXT DEFAULT NULL);
             """)
 
             database.execute_sql("CREATE INDEX idx_request_task ON request(task_id);")
@@ -95,40 +100,24 @@ class CollectRequests(Module):
             database.execute_sql("CREATE INDEX idx_request_codetext ON request(codetext);")
             database.execute_sql("CREATE INDEX idx_request_resource ON request(resource);")
             database.execute_sql("CREATE INDEX idx_request_content ON request(content);")
+            database.execute_sql("CREATE INDEX idx_request_resbodystate ON request(resbodystate);")
 
     def add_handlers(self) -> None:
         super().add_handlers()
 
         # Create page handler
         def handler(response: Response) -> None:
-            # Collect headers in meta tags
-            try:
-                metaheaders = BeautifulSoup(response.text(), 'html.parser')
-                metaheaders = metaheaders.find_all('meta', attrs={'http-equiv': re.compile('.*')})
-                metaheaders = json.dumps([str(entry) for entry in metaheaders])
-            except (Exception, CancelledError) as error:
-                self.crawler.log.warning('CollectRequests.py:%s %s', traceback.extract_stack()[-1].lineno, error)
-                metaheaders = None
-
-            # Get body
-            try:
-                reqbody = response.request.post_data_buffer
-            except (Exception, CancelledError) as error:
-                self.crawler.log.warning('CollectRequests.py:%s %s', traceback.extract_stack()[-1].lineno, error)
-                reqbody = None
+            if self.crawler.resetting:
+                return
 
-            try:
-                resbody = response.body()
-            except (Exception, CancelledError) as error:
-                self.crawler.log.warning('CollectRequests.py:%s %s', traceback.extract_stack()[-1].lineno, error)
-                resbody = None
+            captured: capture.CapturedResponse = cast(capture.CapturedResponse, self.crawler.captures.get(response))
 
             # Record header
             try:
                 self.crawler.database.execute_sql(
                     f"""
-                    INSERT INTO Request (task_id, site_id, fromurl_id, redirect, redirectfrom, url, navigation, mainframe, serviceworker, frame, depth, repetition, method, code, codetext, resource, content, referer, location, reqheaders, resheaders, metaheaders, reqbody, resbody)
-                    VALUES ({self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param})
+                    INSERT INTO Request (task_id, site_id, fromurl_id, redirect, redirectfrom, url, navigation, mainframe, serviceworker, frame, depth, repetition, method, code, codetext, resource, content, referer, location, reqheaders, resheaders, metaheaders, reqbody, resbody, resbodystate, resbodyfile)
+                    VALUES ({self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param},{self.crawler.database.param})
                     """,
                     (
                         self.crawler.task.get_id(),
@@ -150,11 +139,13 @@ class CollectRequests(Module):
                         response.header_value('Content-Type'),
                         response.request.header_value('Referer'),
                         response.header_value('Location'),
-                        json.dumps(response.request.headers_array()),
-                        json.dumps(response.headers_array()),
-                        metaheaders,
-                        reqbody,
-                        resbody
+                        captured.reqheaders,
+                        captured.resheaders,
+                        captured.metaheaders,
+                        captured.reqbody,
+                        captured.resbody,
+                        captured.resbodystate,
+                        captured.resbodyfile
                     )
                 )
             except (Exception, CancelledError) as error:
@@ -0,0 +1,237 @@
+import base64
+import json
+import traceback
+from asyncio import CancelledError
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import capture
+from config import Config
+from modules.CollectRequests import CollectRequests
+
+
+class CollectRequestsCDP(CollectRequests):
+    """
+    Module to collect all requests and responses through the Chrome DevTools Protocol.
+
+    Network events are buffered as plain dictionaries while the page loads, response bodies are only fetched
+    for responses that pass the body capture policy, and records are assembled on a background thread. The rows
+    are written to the same request table as CollectRequests when the crawler processes the page.
+    """
+
+    def __init__(self, crawler) -> None:
+        super().__init__(crawler)
+
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='CollectRequestsCDP')
+        self._records: List[Future] = []
+        self._requests: Dict[str, Dict[str, Any]] = {}
+        self._bodies: List[Dict[str, Any]] = []
+        self._frames: Dict[str, str] = {}
+        self._mainframe: Optional[str] = None
+        self._site: str = self.crawler.site.site
+
+    @staticmethod
+    def _headers_array(headers: Optional[Dict[str, str]]) -> List[Dict[str, str]]:
+        # DevTools joins repeated headers with newlines
+        return [{'name': name, 'value': value} for name, values in (headers or {}).items() for value in str(values).split('\n')]
+
+    @staticmethod
+    def _header_value(headers: Optional[Dict[str, str]], name: str) -> Optional[str]:
+        name = name.lower()
+        return next((value for key, value in (headers or {}).items() if key.lower() == name), None)
+
+    @staticmethod
+    def _assemble(record: Dict[str, Any]) -> Tuple:
+        response: Dict[str, Any] = record['response'] or {}
+        reqheaders: Dict[str, str] = record['reqheaders'] or record['request'].get('headers', {})
+        resheaders: Dict[str, str] = record['resheaders'] or response.get('headers', {})
+
+        metaheaders: Optional[str] = None
+        if record['data'] is not None:
+            try:
+                metaheaders = capture.get_meta_headers(record['data'], CollectRequestsCDP._header_value(resheaders, 'Content-Type') or response.get('mimeType', None))
+            except Exception:
+                metaheaders = None
+
+        resbody, resbodyfile, resbodystate = capture.store_body(record['data']) if record['data'] is not None else (None, None, capture.SKIPPED)
+
+        post_data: Optional[str] = record['request'].get('postData', None)
+
+        return (
+            record['task'],
+            record['site'],
+            record['fromurl'],
+            record['redirect'],
+            record['redirectfrom'],
+            record['request']['url'],
+            record['navigation'],
+            record['mainframe'],
+            response.get('fromServiceWorker', False),
+            record['frame'],
+            record['depth'],
+            record['repetition'],
+            record['request']['method'],
+            response.get('status', Config.ERROR_CODES['response_error']),
+            response.get('statusText', ''),
+            record['resource'],
+            CollectRequestsCDP._header_value(resheaders, 'Content-Type') or response.get('mimeType', ''),
+            CollectRequestsCDP._header_value(reqheaders, 'Referer'),
+            CollectRequestsCDP._header_value(resheaders, 'Location'),
+            json.dumps(CollectRequestsCDP._headers_array(reqheaders)),
+            json.dumps(CollectRequestsCDP._headers_array(resheaders)),
+            metaheaders,
+            post_data.encode() if post_data is not None else None,
+            resbody,
+            resbodystate,
+            resbodyfile
+        )
+
+    def _new_record(self, params: Dict[str, Any], redirectfrom: Optional[str]) -> Dict[str, Any]:
+        return {
+            'task': self.crawler.task.get_id(),
+            'site': self.crawler.site.get_id(),
+            'fromurl': self.crawler.url.get_id() if self.crawler.url is not None else None,
+            'depth': self.crawler.depth,
+            'repetition': self.crawler.repetition,
+            'request': params['request'],
+            'reqheaders': None,
+            'response': None,
+            'resheaders': None,
+            'data': None,
+            'size': None,
+            'redirect': None,
+            'redirectfrom': redirectfrom,
+            'navigation': (params.get('type') == 'Document') and (params['requestId'] == params.get('loaderId')),
+            'mainframe': params.get('frameId', self._mainframe) == self._mainframe,
+            'frameid': params.get('frameId', None),
+            'frame': None,
+            'resource': (params.get('type') or 'other').lower(),
+        }
+
+    def _finish(self, record: Dict[str, Any]) -> None:
+        record['frame'] = self._frames.get(record['frameid'], None)
+        self._records.append(self._executor.submit(CollectRequestsCDP._assemble, record))
+
+    def _on_request(self, params: Dict[str, Any]) -> None:
+        redirectfrom: Optional[str] = None
+
+        # A redirect reuses the request id, the previous hop is complete
+        previous: Optional[Dict[str, Any]] = self._requests.pop(params['requestId'], None)
+        if (previous is not None) and ('redirectResponse' in params):
+            previous['response'] = params['redirectResponse']
+            previous['redirect'] = params['request']['url']
+            redirectfrom = previous['request']['url']
+            self._finish(previous)
+
+        self._requests[params['requestId']] = self._new_record(params, redirectfrom)
+
+    def _on_request_extra(self, params: Dict[str, Any]) -> None:
+        record: Optional[Dict[str, Any]] = self._requests.get(params['requestId'], None)
+        if record is not None:
+            record['reqheaders'] = params.get('headers', None)
+
+    def _on_response(self, params: Dict[str, Any]) -> None:
+        record: Optional[Dict[str, Any]] = self._requests.get(params['requestId'], None)
+        if record is not None:
+            record['response'] = params['response']
+            record['resource'] = (params.get('type') or record['resource']).lower()
+
+    def _on_response_extra(self, params: Dict[str, Any]) -> None:
+        record: Optional[Dict[str, Any]] = self._requests.get(params['requestId'], None)
+        if record is not None:
+            record['resheaders'] = params.get('headers', None)
+
+    def _on_data(self, params: Dict[str, Any]) -> None:
+        # The size limits apply to the decoded body, encodedDataLength is what was transferred
+        record: Optional[Dict[str, Any]] = self._requests.get(params['requestId'], None)
+        if record is not None:
+            record['size'] = (record['size'] or 0) + params.get('dataLength', 0)
+
+    def _on_finished(self, params: Dict[str, Any]) -> None:
+        record: Optional[Dict[str, Any]] = self._requests.pop(params['requestId'], None)
+        if (record is None) or (record['response'] is None):
+            return
+
+        if capture.is_body_allowed(record['resource'], record['response'].get('mimeType', None), record['request']['url'], self._site, record['size']):
+            # Fetch the body later, once the page is processed, so loading the page is not interrupted
+            record['requestid'] = params['requestId']
+            self._bodies.append(record)
+        else:
+            self._finish(record)
+
+    def _on_failed(self, params: Dict[str, Any]) -> None:
+        # Like the response event of playwright, requests that never received a response are not recorded
+        record: Optional[Dict[str, Any]] = self._requests.pop(params['requestId'], None)
+        if (record is not None) and (record['response'] is not None):
+            self._finish(record)
+
+    def _on_frame(self, params: Dict[str, Any]) -> None:
+        self._frames[params['frame']['id']] = params['frame']['url']
+
+    def add_handlers(self) -> None:
+        if self.crawler.cdp is None:
+            self.crawler.log.warning("CollectRequestsCDP: no CDP session, use playwright handler")
+            super().add_handlers()
+            return
+
+        # Events of a previous session cannot complete anymore
+        self._requests.clear()
+        self._frames.clear()
+
+        try:
+            frame_tree = self.crawler.cdp.send('Page.getFrameTree')['frameTree']['frame']
+            self._mainframe = frame_tree['id']
+            self._frames[frame_tree['id']] = frame_tree['url']
+
+            self.crawler.cdp.on('Network.requestWillBeSent', self._on_request)
+            self.crawler.cdp.on('Network.requestWillBeSentExtraInfo', self._on_request_extra)
+            self.crawler.cdp.on('Network.responseReceived', self._on_response)
+            self.crawler.cdp.on('Network.responseReceivedExtraInfo', self._on_response_extra)
+            self.crawler.cdp.on('Network.dataReceived', self._on_data)
+            self.crawler.cdp.on('Network.loadingFinished', self._on_finished)
+            self.crawler.cdp.on('Network.loadingFailed', self._on_failed)
+            self.crawler.cdp.on('Page.frameNavigated', self._on_frame)
+
+            self.crawler.cdp.send('Page.enable')
+            self.crawler.cdp.send('Network.enable', {'maxResourceBufferSize': Config.BODY_MAX_SIZE} if Config.BODY_MAX_SIZE is not None else {})
+        except (Exception, CancelledError) as error:
+            self.crawler.log.warning('CollectRequestsCDP.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def receive_response(self, responses: List[Optional[capture.CapturedResponse]], final_url: str, repetition: int) -> None:
+        super().receive_response(responses, final_url, repetition)
+
+        # Fetch bodies that passed the capture policy
+        bodies, self._bodies = self._bodies, []
+        for record in bodies:
+            try:
+                body = self.crawler.cdp.send('Network.getResponseBody', {'requestId': record['requestid']})
+                record['data'] = base64.b64decode(body['body']) if body.get('base64Encoded', False) else body['body'].encode()
+            except (Exception, CancelledError) as error:
+                self.crawler.log.debug('CollectRequestsCDP.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+            self._finish(record)
+
+        # Write assembled records
+        records, self._records = self._records, []
+        rows: List[Tuple] = []
+
+        for record in records:
+            try:
+                rows.append(record.result())
+            except Exception as error:
+                self.crawler.log.warning('CollectRequestsCDP.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+        try:
+            with self.crawler.database.atomic():
+                for row in rows:
+                    self.crawler.database.execute_sql(
+                        f"""
+                        INSERT INTO Request (task_id, site_id, fromurl_id, redirect, redirectfrom, url, navigation, mainframe, serviceworker, frame, depth, repetition, method, code, codetext, resource, content, referer, location, reqheaders, resheaders, metaheaders, reqbody, resbody, resbodystate, resbodyfile)
+                        VALUES ({','.join([self.crawler.database.param] * 26)})
+                        """,
+                        row
+                    )
+        except (Exception, CancelledError) as error:
+            self.crawler.log.warning('CollectRequestsCDP.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+        self.crawler.log.debug(f"CollectRequestsCDP: wrote {len(rows)} requests")
@@ -2,9 +2,10 @@ import random
 from typing import Callable, Optional
 
 import tld
-from playwright.sync_api import Error, Locator, Response
+from playwright.sync_api import Error, Locator
 
 import utils
+from capture import CapturedResponse
 from config import Config
 from database import Site
 from modules.Module import Module
@@ -15,6 +16,8 @@ class CollectUrls(Module):
     Module to automatically collect links to crawl further.
     """
 
+    PRELOAD_SAFE: bool = True
+
     def __init__(self, crawler) -> None:
         super().__init__(crawler)
 
@@ -25,7 +28,7 @@ class CollectUrls(Module):
 
         self._url_filter_out: list[Callable[[tld.utils.Result], bool]] = []
 
-    def receive_response(self, responses: list[Optional[Response]], final_url: str, repetition: int) -> None:
+    def receive_response(self, responses: list[Optional[CapturedResponse]], final_url: str, repetition: int) -> None:
         super().receive_response(responses, final_url, repetition)
 
         # Speedup by ignoring repetitive URL collection from the same page
@@ -49,7 +52,7 @@ class CollectUrls(Module):
         )
 
         # Force collect URLs if page didn't load correctly
-        response: Optional[Response] = responses[-1] if len(responses) > 0 else None
+        response: Optional[CapturedResponse] = responses[-1] if len(responses) > 0 else None
         if (response is None) and (not Config.FORCE_COLLECT):
             return
 
@@ -63,6 +66,7 @@ class CollectUrls(Module):
             return
 
         urls: list[tld.utils.Result] = []
+        found: list[str] = []
 
         # Iterate over each link
         for i in range(utils.get_locator_count(links)):
@@ -82,6 +86,8 @@ class CollectUrls(Module):
             if not parsed_link:
                 continue
 
+            found.append(utils.get_url_str_with_query_fragment(parsed_link))
+
             # Check for same scheme
             if Config.SAME_SCHEME and (self.crawler.site.scheme != utils.get_url_scheme(parsed_link)):
                 continue
@@ -113,6 +119,9 @@ class CollectUrls(Module):
             # Add link
             urls.append(parsed_link)
 
+        # Learn which query parameters do not change the page before adding the URLs
+        self.crawler.urldb.learn(utils.get_url_str_with_query_fragment(parsed_url_final), found)
+
         self.crawler.log.info(f"Find {min(len(urls), self._max_urls)} URLs")
 
         # Prioritize URLs at the beginning and end of the HTML document
@@ -1,12 +1,14 @@
 import re
 import urllib.parse
+from datetime import datetime
 from logging import Logger
 from typing import List, Optional
 
 from peewee import BooleanField, ForeignKeyField, IntegerField
-from playwright.sync_api import Error, Locator, Page, Response
+from playwright.sync_api import Error, Locator, Page
 
 import utils
+from capture import CapturedResponse
 from config import Config
 from database import URL, BaseModel, Site, Task, database
 from modules.Module import Module
@@ -24,6 +26,9 @@ class FindLoginForms(Module):
     """
         Module to automatically find login forms.
     """
+
+    PRELOAD_SAFE: bool = True
+
     KEYWORDS_1 = r'/(log.?in|sign.?in|logge|anmeldung|anmelde|auth|' \
                  r'user.?name|e.?mail|nutzer|passwor|account|konto|mitglied)/i'
     KEYWORDS_2 = r'/(continue|next|weiter|proceed|fortfahren|submit|access|enter|eintragen|zugang)/i'
@@ -69,7 +74,7 @@ class FindLoginForms(Module):
         with database:
             database.create_tables([LoginForm])
 
-    def receive_response(self, responses: List[Optional[Response]], final_url: str, repetition: int) -> None:
+    def receive_response(self, responses: List[Optional[CapturedResponse]], final_url: str, repetition: int) -> None:
         super().receive_response(responses, final_url, repetition)
 
         # Find login forms
@@ -83,7 +88,11 @@ class FindLoginForms(Module):
 
             LoginForm.create(task=self.crawler.task, site=self.crawler.task.site, url=self.crawler.url, depth=self.crawler.depth)
 
-            utils.get_screenshot(self.crawler.page, (Config.LOG / f"screenshots/{self.crawler.site.site}-{self.crawler.job_id}-Login{self._found}.png"))
+            self.crawler.screenshots.take(
+                self.crawler.page,
+                (Config.LOG / f"screenshots/{datetime.now().strftime('%Y-%m-%d')}-{self.crawler.task.job}-{self.crawler.task.crawler}-Login{self._found}-{self.crawler.site.scheme}-{self.crawler.site.site}.png"),
+                self.crawler.cdp
+            )
 
     @staticmethod
     def verify_login_form(form: Locator) -> bool:
@@ -2,10 +2,15 @@ from logging import Logger
 from typing import Callable, List, Optional
 
 import tld
-from playwright.sync_api import Response
+
+from capture import CapturedResponse
 
 
 class Module:
+    # Whether the module works while the crawler preloads the next URL, i.e., its browser event handlers do not
+    # depend on the current URL of the crawler
+    PRELOAD_SAFE: bool = False
+
     def __init__(self, crawler) -> None:
         from crawler import Crawler
         self.crawler: Crawler = crawler
@@ -17,7 +22,7 @@ class Module:
     def add_handlers(self) -> None:
         pass
 
-    def receive_response(self, responses: List[Optional[Response]], final_url: str, repetition: int) -> None:
+    def receive_response(self, responses: List[Optional[CapturedResponse]], final_url: str, repetition: int) -> None:
         pass
 
     def add_url_filter_out(self, filters: List[Callable[[tld.utils.Result], bool]]) -> None:
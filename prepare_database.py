@@ -4,7 +4,7 @@ import traceback
 import tld
 import utils
 from config import Config
-from database import URL, Entity, Site, Task, load_database
+from database import URL, Entity, JobCounter, Metric, Site, Task, load_database
 
 
 def _save_entity_sites(entity, sites, adult=False, tracking=False, fingerprinting=False, malicious=False):
@@ -122,6 +122,8 @@ if __name__ == "__main__":
         database.create_tables([Site])
         database.create_tables([Task])
         database.create_tables([URL])
+        database.create_tables([Metric])
+        database.create_tables([JobCounter])
 
     # Load disconnect data
     _load_disconnect(database)
@@ -0,0 +1,189 @@
+import argparse
+import cProfile
+import os
+import pathlib
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from logging import Logger
+from types import FrameType
+from typing import Iterator, List, Optional, cast
+
+from config import Config
+
+
+class Profiler:
+    """
+    Profiles a share of the tasks completely and the page and response handlers of chosen modules in every task.
+
+    In sampled mode, a thread records the stack of the crawler every ``PROFILE_INTERVAL`` seconds and the profile
+    is written as collapsed stacks (one ``frame;frame;frame count`` line per stack), which flamegraph tools read.
+    In deterministic mode, cProfile traces every call and the profile is written in the pstats format. Profiles
+    are written per task and process to ``LOG/profiles``; ``python profiling.py -j <job>`` merges them.
+    Sampled profiles are also written every ``FLUSH`` seconds, so a crawler killed as stale leaves its profile behind.
+    """
+
+    FLUSH: float = 30
+
+    def __init__(self, job: str, crawler_id: int, task_id: int, log: Logger) -> None:
+        self.log: Logger = log
+        self.path: pathlib.Path = Config.LOG / 'profiles' / f"{job}-{crawler_id}-{task_id}-{os.getpid()}"
+
+        # The same tasks are chosen again when a crawler restarts
+        self.task: bool = random.Random(task_id).random() < Config.PROFILE
+        self.modules: List[str] = Config.PROFILE_MODULES or []
+
+        self._depth: int = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._samples: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_id: int = threading.get_ident()
+        self._stop: threading.Event = threading.Event()
+
+    @contextmanager
+    def profile(self, module: Optional[str] = None) -> Iterator[None]:
+        """Profiles the crawl of the task (no module) or the handlers of a module, if chosen."""
+
+        if not (self.task if module is None else (module in self.modules)):
+            yield
+            return
+
+        self._depth += 1
+        if self._depth == 1:
+            self._start()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._pause()
+
+    def _start(self) -> None:
+        if Config.PROFILE_MODE == 'deterministic':
+            self._profile = self._profile or cProfile.Profile()
+            self._profile.enable()
+        elif self._thread is None:
+            self._thread = threading.Thread(target=self._sample, name='Profiler', daemon=True)
+            self._thread.start()
+
+    def _pause(self) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+
+    def _sample(self) -> None:
+        flushed: float = time.monotonic()
+        while not self._stop.wait(Config.PROFILE_INTERVAL):
+            if time.monotonic() - flushed >= Profiler.FLUSH:
+                self._write()
+                flushed = time.monotonic()
+
+            if self._depth == 0:
+                continue
+
+            frame: Optional[FrameType] = sys._current_frames().get(self._thread_id, None)
+
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({pathlib.Path(frame.f_code.co_filename).name}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+
+            if stack:
+                self._samples[';'.join(reversed(stack))] += 1
+
+    def _write(self) -> None:
+        try:
+            if self._profile is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._profile.dump_stats(self.path.with_suffix('.pstats'))
+            elif self._samples:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # Replace the file at once, the process may be killed while writing
+                with open(self.path.with_suffix('.tmp'), 'w', encoding='utf-8') as file:
+                    for stack, count in list(self._samples.items()):
+                        file.write(f"{stack} {count}\n")
+                os.replace(self.path.with_suffix('.tmp'), self.path.with_suffix('.collapsed'))
+        except Exception as error:
+            self.log.warning('profiling.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def close(self) -> None:
+        """Stops profiling and writes the profile of the task."""
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self._write()
+
+
+def merge(job: str, directory: pathlib.Path) -> List[pathlib.Path]:
+    """Merges the profiles of all crawlers and tasks of a job.
+
+    Args:
+        job (str): job id
+        directory (pathlib.Path): directory of the profiles
+
+    Returns:
+        paths of the merged collapsed stacks and pstats profiles
+    """
+
+    merged: List[pathlib.Path] = []
+
+    collapsed: List[pathlib.Path] = sorted(directory.glob(f"{job}-*.collapsed"))
+    if collapsed:
+        samples: Counter = Counter()
+        for path in collapsed:
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack and count.isdigit():
+                        samples[stack] += int(count)
+
+        output: pathlib.Path = directory / f"{job}.collapsed"
+        with open(output, 'w', encoding='utf-8') as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+        merged.append(output)
+
+    profiles: List[pathlib.Path] = sorted(directory.glob(f"{job}-*.pstats"))
+    if profiles:
+        stats: pstats.Stats = pstats.Stats(str(profiles[0]))
+        for path in profiles[1:]:
+            stats.add(str(path))
+
+        output = directory / f"{job}.pstats"
+        stats.dump_stats(output)
+        merged.append(output)
+
+    return merged
+
+def main(job: str, directory: pathlib.Path) -> int:
+    merged: List[pathlib.Path] = merge(job, directory)
+    if not merged:
+        print(f"No profiles for job {job} in {directory}")
+        return 1
+
+    for path in merged:
+        print(f"Merged {path}")
+
+        if path.suffix == '.collapsed':
+            print("  Render with flamegraph.pl, or open in speedscope or https://www.speedscope.app")
+        else:
+            pstats.Stats(str(path)).sort_stats('cumulative').print_stats(20)
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-j", "--job", type=str, required=True, help="unique job id for crawl")
+    args_parser.add_argument("-d", "--directory", type=pathlib.Path, default=Config.LOG / 'profiles', help="directory of the profiles")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(str, args.get('job')), cast(pathlib.Path, args.get('directory'))))
@@ -0,0 +1,123 @@
+import base64
+import pathlib
+import queue
+import threading
+import traceback
+from logging import Logger
+from typing import Any, Dict, Optional, Set, Tuple, Union
+
+from playwright.sync_api import CDPSession, Error, Page
+
+from config import Config
+
+
+class ScreenshotWriter:
+    """
+    Takes screenshots with the configured format, quality and scale, and writes them on a background thread.
+
+    With a CDP session, screenshots are captured through ``Page.captureScreenshot``, which supports WebP and
+    scaling; otherwise playwright is used (PNG or JPEG). Decoding and writing the files happens on the writer
+    thread, so the crawler only waits for the browser to capture the page. Call ``close`` to flush pending
+    screenshots.
+    """
+
+    EXTENSIONS: Dict[str, str] = {'png': '.png', 'jpeg': '.jpg', 'webp': '.webp'}
+
+    def __init__(self, log: Logger) -> None:
+        self.log: Logger = log
+
+        self._queue: queue.Queue[Optional[Tuple[pathlib.Path, Union[str, bytes]]]] = queue.Queue()
+        self._pending: Set[pathlib.Path] = set()
+        self._lock: threading.Lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def get_path(path: pathlib.Path, cdp: bool) -> pathlib.Path:
+        # Playwright cannot encode WebP
+        image_format: str = Config.SCREENSHOT_FORMAT if cdp or (Config.SCREENSHOT_FORMAT != 'webp') else 'jpeg'
+        return path.with_suffix(ScreenshotWriter.EXTENSIONS[image_format])
+
+    def _capture_cdp(self, page: Page, cdp: CDPSession, full_page: bool) -> str:
+        params: Dict[str, Any] = {'format': Config.SCREENSHOT_FORMAT, 'captureBeyondViewport': full_page}
+
+        if Config.SCREENSHOT_FORMAT != 'png':
+            params['quality'] = Config.SCREENSHOT_QUALITY
+
+        if full_page or (Config.SCREENSHOT_SCALE != 1):
+            if full_page:
+                width, height = page.evaluate("() => [document.documentElement.scrollWidth, document.documentElement.scrollHeight]")
+            else:
+                viewport = page.viewport_size or {'width': 1280, 'height': 720}
+                width, height = viewport['width'], viewport['height']
+
+            params['clip'] = {'x': 0, 'y': 0, 'width': width, 'height': height, 'scale': Config.SCREENSHOT_SCALE}
+
+        return cdp.send('Page.captureScreenshot', params)['data']
+
+    def _capture_playwright(self, page: Page, full_page: bool) -> bytes:
+        if Config.SCREENSHOT_FORMAT == 'png':
+            return page.screenshot(type='png', full_page=full_page)
+
+        return page.screenshot(type='jpeg', quality=Config.SCREENSHOT_QUALITY, full_page=full_page, scale='css' if Config.SCREENSHOT_SCALE < 1 else 'device')
+
+    def take(self, page: Page, path: pathlib.Path, cdp: Optional[CDPSession] = None, force: bool = False, full_page: bool = False) -> bool:
+        """Captures a screenshot and queues it for writing.
+
+        Args:
+            page (Page): the page
+            path (pathlib.Path): path of the screenshot, the suffix is replaced to match the format
+            cdp (CDPSession): CDP session of the page, if available
+            force (bool): overwrite an existing screenshot
+            full_page (bool): capture the whole page instead of the viewport
+
+        Returns:
+            true if a screenshot was captured
+        """
+
+        path = ScreenshotWriter.get_path(path, cdp is not None)
+
+        with self._lock:
+            if (not force) and ((path in self._pending) or path.exists()):
+                return False
+
+        try:
+            data: Union[str, bytes] = self._capture_cdp(page, cdp, full_page) if cdp is not None else self._capture_playwright(page, full_page)
+        except Error as error:
+            self.log.warning('screenshots.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+            return False
+
+        # The writer thread is only started once there is something to write
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write, name='ScreenshotWriter', daemon=True)
+            self._thread.start()
+
+        with self._lock:
+            self._pending.add(path)
+        self._queue.put((path, data))
+
+        return True
+
+    def _write(self) -> None:
+        while True:
+            entry: Optional[Tuple[pathlib.Path, Union[str, bytes]]] = self._queue.get()
+            if entry is None:
+                return
+
+            path, data = entry
+
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(base64.b64decode(data) if isinstance(data, str) else data)
+            except Exception as error:
+                self.log.warning('screenshots.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+            with self._lock:
+                self._pending.discard(path)
+
+    def close(self) -> None:
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
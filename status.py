@@ -0,0 +1,133 @@
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, cast
+
+from config import Config
+from database import JobCounter, load_database
+
+
+def get_counters(job: str) -> Tuple[Dict[str, int], Optional[datetime]]:
+    """Reads the counters of a job.
+
+    Args:
+        job (str): job id
+
+    Returns:
+        counters by name, and when the first task was claimed (None if no task was claimed yet)
+    """
+
+    load_database()
+    counters: Dict[str, Tuple[int, datetime]] = JobCounter.get_job(job)
+    started: Optional[datetime] = counters['tasks_claimed'][1] if 'tasks_claimed' in counters else None
+    return {name: value for name, (value, _) in counters.items()}, started
+
+def rebuild(job: str) -> Dict[str, int]:
+    """Recomputes the counters of a job with full scans of the task and URL tables, e.g. for jobs that were
+    added before the counters existed. The average throughput restarts from the time of the rebuild.
+
+    Args:
+        job (str): job id
+
+    Returns:
+        the new counters
+    """
+
+    database = load_database()
+    JobCounter.create_table()
+
+    # Only URLs the crawler visits count, not the redirects saved with them
+    urls: str = f"FROM url JOIN task ON url.task_id=task.id WHERE task.job={database.param} AND url.redirect_id IS NULL"
+
+    counts: Dict[str, int] = {
+        'tasks_added': database.execute_sql(f"SELECT COUNT(*) FROM task WHERE job={database.param}", (job,)).fetchone()[0],
+        'tasks_claimed': database.execute_sql(f"SELECT COUNT(*) FROM task WHERE job={database.param} AND state!='free'", (job,)).fetchone()[0],
+        'tasks_complete': database.execute_sql(f"SELECT COUNT(*) FROM task WHERE job={database.param} AND state='complete'", (job,)).fetchone()[0],
+        'tasks_failed': database.execute_sql(f"SELECT COUNT(*) FROM task WHERE job={database.param} AND state='complete' AND error IS NOT NULL", (job,)).fetchone()[0],
+        'urls_added': database.execute_sql(f"SELECT COUNT(*) {urls} AND url.repetition=1", (job,)).fetchone()[0],
+        'urls_complete': database.execute_sql(f"SELECT COUNT(*) {urls} AND url.repetition=1 AND url.state='complete'", (job,)).fetchone()[0],
+        'visits': database.execute_sql(f"SELECT COUNT(*) {urls} AND url.state='complete'", (job,)).fetchone()[0],
+    }
+
+    for code, count in database.execute_sql(f"SELECT url.code, COUNT(*) {urls} AND url.state='complete' AND url.code IS NOT NULL GROUP BY url.code", (job,)).fetchall():
+        counts[f"code_{code}"] = count
+
+    with database.atomic():
+        JobCounter.delete().where(JobCounter.job == job).execute()
+        JobCounter.add(database, job, counts)
+
+    return counts
+
+def _get_code_name(code: int) -> str:
+    names: Dict[int, str] = {value: name for name, value in Config.ERROR_CODES.items()}
+    return f"{names[code]} ({code})" if code in names else str(code)
+
+def _get_rate(value: float, seconds: float) -> float:
+    return (value / seconds * 60) if seconds > 0 else 0
+
+def main(job: str, interval: Optional[float], rebuild_counters: bool) -> int:
+    if rebuild_counters:
+        rebuild(job)
+
+    counters, started = get_counters(job)
+    if not counters:
+        print(f"No counters for job {job} (use --rebuild for jobs added before the counters existed)")
+        return 1
+
+    # Current throughput from two readings, otherwise the average since the first task was claimed
+    rate_label: str = 'since start'
+    seconds: float = (datetime.today() - started).total_seconds() if started is not None else 0
+    previous: Dict[str, int] = {}
+    if interval:
+        time.sleep(interval)
+        previous = counters
+        counters, _ = get_counters(job)
+        seconds = interval
+        rate_label = f"last {interval:g}s"
+
+    def get(name: str) -> int:
+        return counters.get(name, 0)
+
+    tasks: int = get('tasks_added')
+    claimed: int = get('tasks_claimed')
+    complete: int = get('tasks_complete')
+    free: int = max(0, tasks - claimed)
+    progress: int = max(0, claimed - complete)
+    visits: int = get('visits')
+
+    print(f"Job {job}")
+    print(f"Tasks   {tasks} total, {free} free, {progress} in progress, {complete} complete, {get('tasks_failed')} failed ({get('tasks_failed') / complete if complete else 0:.1%} of complete)")
+    print(f"URLs    {get('urls_added')} discovered ({get('urls_added') / claimed if claimed else 0:.1f} per started task), {get('urls_complete')} complete, {max(0, get('urls_added') - get('urls_complete'))} free")
+    print(f"Visits  {visits} ({Config.REPETITIONS} repetitions per URL)")
+
+    codes: List[Tuple[int, int]] = sorted(((int(name[5:]), value) for name, value in counters.items() if name.startswith('code_')), key=lambda code: -code[1])
+    for code, count in codes:
+        error: bool = (code < 0) or (code >= 400)
+        print(f"  {_get_code_name(code):>20} {count:>10} {count / visits if visits else 0:>7.1%}{' error' if error else ''}")
+
+    task_rate: float = _get_rate(complete - previous.get('tasks_complete', 0), seconds)
+    visit_rate: float = _get_rate(visits - previous.get('visits', 0), seconds)
+    print(f"Rate    {task_rate:.2f} tasks/min, {visit_rate:.1f} visits/min ({rate_label})")
+
+    remaining: int = free + progress
+    if remaining == 0:
+        print("ETA     done")
+    elif task_rate > 0:
+        eta: timedelta = timedelta(minutes=remaining / task_rate)
+        print(f"ETA     {str(eta).split('.')[0]} ({(datetime.today() + eta).strftime('%Y-%m-%d %H:%M')})")
+    else:
+        print("ETA     unknown (no tasks completed yet)")
+
+    return 0
+
+if __name__ == '__main__':
+    # Preparing command line argument parser
+    args_parser = argparse.ArgumentParser()
+    args_parser.add_argument("-j", "--job", type=str, required=True, help="unique job id for crawl")
+    args_parser.add_argument("-i", "--interval", type=float, default=None, help="measure the current throughput over this many seconds instead of the average since the start")
+    args_parser.add_argument("--rebuild", default=False, action='store_true', help="recompute the counters with full scans (for jobs added before the counters existed)")
+
+    # Parse command line arguments
+    args = vars(args_parser.parse_args())
+    sys.exit(main(cast(str, args.get('job')), args.get('interval'), cast(bool, args.get('rebuild'))))
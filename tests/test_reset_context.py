@@ -0,0 +1,50 @@
+import http.server
+import threading
+from typing import Dict, Iterator, cast
+
+import pytest
+
+pytest.importorskip('playwright.sync_api')
+pytest.importorskip('config')
+
+from playwright.sync_api import Error, sync_playwright
+
+from benchmarks.common import get_logger, prepare_database
+from benchmarks.reset_context import _check, _Handler, _store, get_crawler
+from config import Config
+from crawler import Crawler
+
+
+@pytest.fixture(scope='module')
+def origin() -> Iterator[str]:
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+@pytest.mark.parametrize('browser', ['chromium', 'firefox', 'webkit'])
+def test_reset_context(browser: str, origin: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, 'BROWSER', browser)
+
+    log = get_logger('test_reset_context')
+    prepare_database([], log)
+
+    with sync_playwright() as playwright:
+        try:
+            crawler = get_crawler(playwright, log)
+        except Error as error:
+            pytest.skip(f"{browser} is not installed: {error.message.splitlines()[0]}")
+
+        try:
+            Crawler._init_context(cast(Crawler, crawler))
+            _store(crawler, origin)
+            assert Crawler._reset_context(cast(Crawler, crawler))
+
+            leaks: Dict[str, int] = _check(crawler, origin)
+            # Only Chromium can clear the HTTP cache in place
+            if browser != 'chromium':
+                leaks.pop('httpCache')
+            assert not any(leaks.values()), leaks
+        finally:
+            Crawler._close_context(cast(Crawler, crawler))
+            crawler.browser.close()
@@ -0,0 +1,21 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.startup import HEAVY
+
+ROOT: pathlib.Path = pathlib.Path(__file__).resolve().parent.parent
+
+
+def test_heavy_dependencies_not_imported() -> None:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')])))
+    script: str = f"import sys, utils, crawler, main; print(','.join(name for name in {HEAVY!r} if name in sys.modules))"
+
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        pytest.skip(f"crawler cannot be imported here: {result.stderr.strip().splitlines()[-1]}")
+
+    assert result.stdout.strip() == '', f"loaded at import time: {result.stdout.strip()}"
@@ -0,0 +1,113 @@
+import json
+import os
+import pathlib
+import random
+import time
+import traceback
+from datetime import datetime
+from logging import Logger
+from typing import Any, Dict, List, Optional
+
+from playwright.sync_api import Browser, BrowserContext
+
+from config import Config
+
+
+class Tracer:
+    """
+    Records a timeline of a task as a Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev).
+
+    The crawler phases (navigation, waits, module handlers, database writes) become spans of the crawler process.
+    With Chromium, the trace of the browser recorded through Playwright is merged in; both use the monotonic clock
+    of the system, so they line up. With ``TRACE_PLAYWRIGHT``, a Playwright trace (for ``playwright show-trace``)
+    is stored per browser context next to it. Tasks are only traced if chosen, otherwise the crawler has no tracer.
+
+    The trace is written in the JSON array format, which may end without the closing bracket, so the events of
+    every visit are appended as soon as the next one starts and a crawler killed as stale leaves its trace behind.
+    """
+
+    def __init__(self, job: str, crawler_id: int, task_id: int, site: str, log: Logger) -> None:
+        self.log: Logger = log
+        self.path: pathlib.Path = Config.LOG / 'screenshots' / f"{datetime.now().strftime('%Y-%m-%d')}-{job}-{crawler_id}-{task_id}-{site}.trace.json"
+
+        self._pid: int = os.getpid()
+        self._events: List[Dict[str, Any]] = [
+            {'name': 'process_name', 'ph': 'M', 'pid': self._pid, 'args': {'name': f"pycrawler crawler {crawler_id} task {task_id}"}},
+        ]
+        self._visit: Dict[str, Any] = {}
+        self._contexts: int = 0
+
+    @staticmethod
+    def is_traced(task_id: int) -> bool:
+        # The same tasks are chosen again when a crawler restarts
+        return (task_id in Config.TRACE_TASKS) or (random.Random(f"trace-{task_id}").random() < Config.TRACE)
+
+    def visit(self, url: str, repetition: int) -> None:
+        self.flush()
+        self._visit = {'url': url, 'repetition': repetition}
+        self._events.append({'name': 'visit', 'cat': 'pycrawler', 'ph': 'i', 's': 'p', 'ts': time.monotonic() * 1e6, 'pid': self._pid, 'tid': self._pid, 'args': self._visit})
+
+    def add(self, phase: str, start: float, end: float) -> None:
+        """Adds a span of the crawler from start to end (time.monotonic)."""
+
+        self._events.append({'name': phase, 'cat': 'pycrawler', 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'pid': self._pid, 'tid': self._pid, 'args': self._visit})
+
+    def start_browser(self, browser: Browser) -> None:
+        if Config.BROWSER != 'chromium':
+            return
+
+        try:
+            browser.start_tracing(categories=Config.TRACE_CATEGORIES)
+        except Exception as error:
+            self.log.warning('tracing.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def stop_browser(self, browser: Browser) -> None:
+        if Config.BROWSER != 'chromium':
+            return
+
+        try:
+            trace: Any = json.loads(browser.stop_tracing())
+            self._events += trace['traceEvents'] if isinstance(trace, dict) else trace
+        except Exception as error:
+            self.log.warning('tracing.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def attach(self, context: BrowserContext) -> None:
+        if not Config.TRACE_PLAYWRIGHT:
+            return
+
+        try:
+            context.tracing.start(screenshots=True, snapshots=True)
+        except Exception as error:
+            self.log.warning('tracing.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def detach(self, context: BrowserContext) -> None:
+        if not Config.TRACE_PLAYWRIGHT:
+            return
+
+        self._contexts += 1
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            context.tracing.stop(path=self.path.with_name(self.path.name.replace('.trace.json', f"-{os.getpid()}-{self._contexts}.zip")))
+        except Exception as error:
+            self.log.warning('tracing.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+    def flush(self) -> None:
+        """Appends the events recorded since the last flush; a crawler restarted for the same task continues the file."""
+
+        if not self._events:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            new: bool = not self.path.exists()
+            with open(self.path, 'a', encoding='utf-8') as file:
+                if new:
+                    file.write('[\n')
+                file.writelines(json.dumps(event) + ',\n' for event in self._events)
+        except Exception as error:
+            self.log.warning('tracing.py:%s %s', traceback.extract_stack()[-1].lineno, error)
+
+        self._events = []
+
+    def close(self) -> None:
+        self.flush()
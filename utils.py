@@ -3,18 +3,17 @@ import codecs
 import hashlib
 import html
 import json
+import os
 import pathlib
 import re
 import urllib.parse
-from typing import Dict, List, Optional
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-import nltk
 import tld
-from autocorrect import Speller
 from config import Config
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from nltk.stem import SnowballStemmer
 from playwright.sync_api import BrowserContext, Error, Frame, Locator, Page, Response
 from tld.exceptions import TldBadUrl, TldDomainNotFound
 
@@ -27,11 +26,53 @@ SSO: str = r'facebook|twitter|google|yahoo|windows.?live|linked.?in|git.?hub|pay
            r'word.?press|dwolla|miicard|yammer|sound.?cloud|instagram|the.?city|apple|slack|' \
            r'evernote'
 
+# Query parameters that never change the content of a page; names ending with '*' are prefixes
+TRACKING_PARAMETERS: List[str] = [
+    'utm_*', 'gclid', 'gclsrc', 'dclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'yclid', 'twclid', 'ttclid',
+    'li_fat_id', 'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', '__hstc', '__hssc', '__hsfp',
+    'hsctatracking', 'mkt_tok', 'oly_anon_id', 'oly_enc_id', 'vero_id', 'rb_clickid', 's_cid', 'wickedid',
+    'ref_src', 'ref_url', 'spm', 'scm', 'pk_*', 'piwik_*', 'matomo_*', 'mtm_*', 'trk_*', 'stm_*',
+]
+SESSION_PARAMETERS: List[str] = [
+    'jsessionid', 'phpsessid', 'aspsessionid*', 'asp.net_sessionid', 'sessionid', 'session_id',
+    'cfid', 'cftoken', 'zenid', 'oscsid', 'xtcsid',
+]
+
+
+# The NLP dependencies take seconds to load and are only needed for tokenizing, so they are loaded on first use
+@lru_cache(maxsize=1)
+def _get_speller() -> Callable[[str], str]:
+    from autocorrect import Speller
+    return Speller(only_replacements=True)
+
+@lru_cache(maxsize=1)
+def _get_nltk() -> Tuple[Callable[[str], List[str]], Set[str], Callable[[str], str], Callable[[str], str]]:
+    from nltk.corpus import stopwords
+    from nltk.stem import SnowballStemmer, WordNetLemmatizer
+    from nltk.tokenize import NLTKWordTokenizer
+
+    # Tokenized text has no punctuation left, so it is a single sentence and needs no Punkt sentence splitting
+    word_tokenize: Callable[[str], List[str]] = NLTKWordTokenizer().tokenize
+
+    # Missing corpora change the tokens, so they are only optional if configured, and then reported
+    try:
+        lemmatizer: WordNetLemmatizer = WordNetLemmatizer()
+        lemmatizer.lemmatize('test')
+        lemmatize: Callable[[str], str] = lru_cache(maxsize=TOKENIZE_CACHE)(lemmatizer.lemmatize)
+    except LookupError:
+        if not Config.TOKENIZE_OPTIONAL_CORPORA:
+            raise
+        warnings.warn("nltk corpus wordnet is missing, words are not lemmatized", RuntimeWarning)
+        lemmatize = str
+    try:
+        _stopwords: Set[str] = set(stopwords.words('english'))
+    except LookupError:
+        if not Config.TOKENIZE_OPTIONAL_CORPORA:
+            raise
+        warnings.warn("nltk corpus stopwords is missing, stop words are not removed", RuntimeWarning)
+        _stopwords = set()
 
-_speller = Speller(only_replacements=True)
-_stop = stopwords.words('english')
-_lem = WordNetLemmatizer()
-_stem = SnowballStemmer('english')
+    return word_tokenize, _stopwords, lemmatize, lru_cache(maxsize=TOKENIZE_CACHE)(SnowballStemmer('english').stem)
 
 
 def get_tld_object(url: str) -> Optional[tld.utils.Result]:
@@ -65,6 +106,65 @@ def normalize_url(url: str, query: bool = True, fragment: bool = False) -> str:
 
     return urllib.parse.urlunparse((scheme, netloc, path, '', parsed.query if query else '', parsed.fragment if fragment else ''))
 
+_PERCENT: re.Pattern = re.compile(r'%[0-9a-fA-F]{2}')
+_UNRESERVED: str = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-._~'
+_PATH_SESSION: re.Pattern = re.compile(r';(?:jsessionid|phpsessid|sessionid)=[^/;?]*', re.IGNORECASE)
+
+def _normalize_percent(part: str) -> str:
+    # Escaped unreserved characters are the same as the characters themselves (RFC 3986, 6.2.2.2)
+    def replace(match: re.Match) -> str:
+        char: str = chr(int(match.group()[1:], 16))
+        return char if char in _UNRESERVED else match.group().upper()
+    return _PERCENT.sub(replace, part)
+
+@lru_cache(maxsize=1)
+def _get_strip_parameters() -> Tuple[Set[str], Tuple[str, ...]]:
+    names: List[str] = [name.lower() for name in TRACKING_PARAMETERS + SESSION_PARAMETERS + Config.URL_STRIP_PARAMETERS]
+    return {name for name in names if not name.endswith('*')}, tuple(name[:-1] for name in names if name.endswith('*'))
+
+def get_query_parameters(url: str) -> List[Tuple[str, str]]:
+    """Splits the query of a URL into its raw parameters and their decoded, lowercased names."""
+
+    result: List[Tuple[str, str]] = []
+    for parameter in urllib.parse.urlsplit(url).query.split('&'):
+        if parameter:
+            result.append((urllib.parse.unquote_plus(parameter.split('=', 1)[0]).lower(), parameter))
+    return result
+
+def canonicalize_url(url: str, ignore: Iterable[str] = ()) -> str:
+    """Normalizes a URL so that URLs for the same content compare equal.
+
+    On top of normalize_url, tracking and session parameters (TRACKING_PARAMETERS, SESSION_PARAMETERS,
+    Config.URL_STRIP_PARAMETERS) and session ids in the path are removed, the remaining query parameters are
+    sorted, and percent-escapes are normalized. With Config.URL_LOWERCASE_PATH, the path is lowercased as well.
+
+    Args:
+        url (str): URL
+        ignore (Iterable[str]): further lowercased parameter names to remove, e.g., learned for the site
+
+    Returns:
+        the canonical URL
+    """
+
+    url = normalize_url(url)
+
+    try:
+        parsed = urllib.parse.urlsplit(url)
+    except Exception:
+        return url
+
+    path: str = _normalize_percent(_PATH_SESSION.sub('', parsed.path))
+    if Config.URL_LOWERCASE_PATH:
+        path = path.lower()
+
+    names, prefixes = _get_strip_parameters()
+    query: List[str] = sorted(
+        _normalize_percent(parameter) for name, parameter in get_query_parameters(url)
+        if (name not in names) and (not name.startswith(prefixes)) and (name not in ignore)
+    )
+
+    return urllib.parse.urlunsplit((parsed.scheme, parsed.netloc, path, '&'.join(query), ''))
+
 def get_url_scheme(url: tld.utils.Result) -> str:
     return url.parsed_url.scheme
 
@@ -227,28 +327,73 @@ def search_google(context: BrowserContext, query: str, page_number: int = 0, sta
 
     return result
 
-def tokenize(data: str, lower: bool = True, alpha: bool = False, autocorrect: bool = False, stop: bool = False, stem: bool = False) -> str:
+# Entries of the token and string caches, and longest string to cache (UI labels repeat, page texts do not)
+TOKENIZE_CACHE: int = 1 << 16
+TOKENIZE_CACHE_LENGTH: int = 256
+
+_TOKENIZE_ALPHA: re.Pattern = re.compile(r'[^A-Za-z\s]')
+_TOKENIZE_ALNUM: re.Pattern = re.compile(r'[^A-Za-z0-9\s]')
+_TOKENIZE_SPACES: re.Pattern = re.compile(r'\s+')
+
+def _tokenize(data: str, lower: bool, alpha: bool, autocorrect: bool, stop: bool, stem: bool) -> str:
     result = data.strip().lower() if lower else data.strip()
 
     # TODO: add custom rules?
 
-    result = re.sub(r'\s+', ' ', re.sub(r'[^A-Za-z\s]' if alpha else r'[^A-Za-z0-9\s]', ' ', result)).strip()
-    result = ''.join(result)
+    result = _TOKENIZE_SPACES.sub(' ', (_TOKENIZE_ALPHA if alpha else _TOKENIZE_ALNUM).sub(' ', result)).strip()
 
     if autocorrect:
-        result = _speller(result)
+        result = _get_speller()(result)
 
-    result = nltk.word_tokenize(result)
+    word_tokenize, stopwords, lemmatize, _stem = _get_nltk()
 
-    result = [_lem.lemmatize(entry) for entry in result]
+    tokens: List[str] = [lemmatize(entry) for entry in word_tokenize(result)]
 
     if stop:
-        result = [entry for entry in result if (entry not in _stop) and (len(entry) > 1)]
+        tokens = [entry for entry in tokens if (entry not in stopwords) and (len(entry) > 1)]
 
     if stem:
-        result = [_stem.stem(entry) for entry in result]
+        tokens = [_stem(entry) for entry in tokens]
 
-    return ' '.join(result)
+    return ' '.join(tokens)
+
+_tokenize_cached: Callable[[str, bool, bool, bool, bool, bool], str] = lru_cache(maxsize=TOKENIZE_CACHE)(_tokenize)
+
+def tokenize(data: str, lower: bool = True, alpha: bool = False, autocorrect: bool = False, stop: bool = False, stem: bool = False) -> str:
+    if len(data) <= TOKENIZE_CACHE_LENGTH:
+        return _tokenize_cached(data, lower, alpha, autocorrect, stop, stem)
+    return _tokenize(data, lower, alpha, autocorrect, stop, stem)
+
+def _tokenize_chunk(chunk: List[str], options: Tuple[bool, bool, bool, bool, bool]) -> List[str]:
+    return [tokenize(data, *options) for data in chunk]
+
+def tokenize_batch(data: Iterable[str], lower: bool = True, alpha: bool = False, autocorrect: bool = False, stop: bool = False, stem: bool = False, processes: int = 0, chunk_size: int = 1000) -> List[str]:
+    """Tokenizes many strings like tokenize, each distinct string once.
+
+    Args:
+        data: the strings
+        processes (int): tokenize the distinct strings in a pool of this many processes (0 for this process)
+        chunk_size (int): strings per task of the pool
+
+    Returns:
+        the tokenized strings, in order
+    """
+
+    strings: List[str] = list(data)
+    distinct: List[str] = list(dict.fromkeys(strings))
+    options: Tuple[bool, bool, bool, bool, bool] = (lower, alpha, autocorrect, stop, stem)
+
+    if (processes > 1) and (len(distinct) > chunk_size):
+        import multiprocessing
+        from functools import partial
+
+        with multiprocessing.Pool(processes) as pool:
+            chunks: List[List[str]] = pool.map(partial(_tokenize_chunk, options=options), [distinct[i:i + chunk_size] for i in range(0, len(distinct), chunk_size)])
+        tokenized: Dict[str, str] = dict(zip(distinct, (result for chunk in chunks for result in chunk)))
+    else:
+        tokenized = dict(zip(distinct, _tokenize_chunk(distinct, options)))
+
+    return [tokenized[string] for string in strings]
 
 def decode(data: str) -> Dict[str, bytes | str]:
     data = data.strip()
@@ -313,26 +458,91 @@ def decode(data: str) -> Dict[str, bytes | str]:
 
     return result
 
-def hashes(data: bytes) -> Dict[str, bytes]:
-    result = {}
-
-    _hash = hashlib.md5()
-    _hash.update(data)
-    result['md5'] = _hash.digest()
-
-    _hash = hashlib.sha1()
-    _hash.update(data)
-    result['sha1'] = _hash.digest()
-
-    _hash = hashlib.sha256()
-    _hash.update(data)
-    result['sha256'] = _hash.digest()
-
-    _hash = hashlib.sha512()
-    _hash.update(data)
-    result['sha512'] = _hash.digest()
-
-    return result
+# Digests of utils.hashes, chunk size of one pass, and size above which the digests of a chunk run in parallel
+HASH_ALGORITHMS: Tuple[str, ...] = ('md5', 'sha1', 'sha256', 'sha512')
+HASH_CHUNK: int = 1 << 20
+HASH_PARALLEL: int = 4 << 20
+
+@lru_cache(maxsize=1)
+def _get_hash_pool(pid: int) -> ThreadPoolExecutor:
+    # hashlib releases the GIL for large updates; one pool per process, as threads do not survive a fork
+    return ThreadPoolExecutor(max_workers=len(HASH_ALGORITHMS), thread_name_prefix='hashes')
+
+def _get_chunks(data: bytes | bytearray | memoryview | BinaryIO | pathlib.Path) -> Iterator[bytes | memoryview]:
+    if isinstance(data, pathlib.Path):
+        with open(data, 'rb') as file:
+            yield from _get_chunks(file)
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        view: memoryview = memoryview(data).cast('B')
+        for start in range(0, len(view), HASH_CHUNK):
+            yield view[start:start + HASH_CHUNK]
+    else:
+        while chunk := data.read(HASH_CHUNK):
+            yield chunk
+
+def _get_size(data: bytes | bytearray | memoryview | BinaryIO | pathlib.Path) -> int:
+    if isinstance(data, pathlib.Path):
+        return data.stat().st_size
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return memoryview(data).nbytes
+    return -1
+
+def hashes(data: bytes | bytearray | memoryview | BinaryIO | pathlib.Path, parallel: Optional[bool] = None) -> Dict[str, bytes]:
+    """Computes all digests of HASH_ALGORITHMS in a single pass over the data.
+
+    Every chunk is fed to all digests while it is in the CPU cache. For data larger than HASH_PARALLEL (and
+    streams), the digests of a chunk are computed in parallel threads.
+
+    Args:
+        data: bytes, memoryview, binary file, or path of a file (e.g., a spilled body)
+        parallel (bool): compute the digests in parallel threads (default depends on the size)
+
+    Returns:
+        digest by algorithm
+    """
+
+    digests: List[Any] = [hashlib.new(algorithm) for algorithm in HASH_ALGORITHMS]
+
+    # Small bodies fit in the cache as a whole
+    if isinstance(data, bytes) and (len(data) <= HASH_CHUNK) and (not parallel):
+        for digest in digests:
+            digest.update(data)
+        return {algorithm: digest.digest() for algorithm, digest in zip(HASH_ALGORITHMS, digests)}
+
+    if parallel is None:
+        size: int = _get_size(data)
+        parallel = (size < 0) or (size > HASH_PARALLEL)
+
+    pool: Optional[ThreadPoolExecutor] = _get_hash_pool(os.getpid()) if parallel else None
+
+    for chunk in _get_chunks(data):
+        if pool is not None:
+            for future in [pool.submit(digest.update, chunk) for digest in digests]:
+                future.result()
+        else:
+            for digest in digests:
+                digest.update(chunk)
+
+    return {algorithm: digest.digest() for algorithm, digest in zip(HASH_ALGORITHMS, digests)}
+
+def hashes_batch(bodies: Iterable[bytes | bytearray | memoryview | BinaryIO | pathlib.Path]) -> List[Dict[str, bytes]]:
+    """Computes the digests of many bodies, with each thread of the pool hashing a share of the bodies.
+
+    Args:
+        bodies: the bodies, as for hashes
+
+    Returns:
+        digest by algorithm for every body, in order
+    """
+
+    _bodies: List[Any] = list(bodies)
+    shares: int = len(HASH_ALGORITHMS)
+
+    results: List[Dict[str, bytes]] = [{}] * len(_bodies)
+    for share, digests in enumerate(_get_hash_pool(os.getpid()).map(lambda share: [hashes(body, parallel=False) for body in _bodies[share::shares]], range(shares))):
+        results[share::shares] = digests
+
+    return results
 
 def decompress(data: bytes) -> bytes:
     # TODO: implement